@@ -0,0 +1,137 @@
+import functools
+import json
+import threading
+import time
+from collections import OrderedDict
+
+
+class _InFlight:
+    """A pending upstream call that concurrent identical requests wait on."""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None  # exception raised by the leader's fetch, re-raised to every waiter
+
+
+class ResponseCache:
+    """Thread-safe TTL cache with LRU eviction bounded by an approximate byte budget.
+
+    Concurrent misses for the same key are collapsed into a single upstream call
+    (single-flight); the other callers block until the leader's result is available, and
+    get the leader's exception when its call fails.
+    Cached values are shared between callers and must be treated as read-only.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (expires_at, size, value)
+        self._in_flight = {}
+        self._size = 0
+        self._stats = {}
+
+    def _count(self, endpoint, field):
+        stats = self._stats.setdefault(endpoint, {'hits': 0, 'misses': 0, 'shared': 0, 'evictions': 0})
+        stats[field] += 1
+
+    @staticmethod
+    def _estimate_size(value):
+        nbytes = getattr(value, 'nbytes', None)  # values that know their size, e.g. rendered pages
+        if nbytes is not None:
+            return nbytes
+        try:
+            return len(json.dumps(value, ensure_ascii=False))
+        except (TypeError, ValueError):
+            return 1024
+
+    def _store(self, endpoint, key, value, ttl):
+        size = self._estimate_size(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._size -= self._entries.pop(key)[1]
+            self._entries[key] = (time.monotonic() + ttl, size, value)
+            self._size += size
+            while self._size > self.max_bytes and self._entries:
+                evicted_key, (_, evicted_size, _) = self._entries.popitem(last=False)
+                self._size -= evicted_size
+                self._count(evicted_key[0], 'evictions')
+
+    def get_or_fetch(self, endpoint, key, ttl, fetch, should_cache=bool):
+        """Returns the cached value for key, calling fetch() on a miss.
+
+        Results for which should_cache(value) is false (e.g. failed upstream calls) are
+        handed to waiting callers but not stored.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self._count(endpoint, 'hits')
+                    return entry[2]
+                del self._entries[key]
+                self._size -= entry[1]
+
+            pending = self._in_flight.get(key)
+            if pending is None:
+                pending = self._in_flight[key] = _InFlight()
+                self._count(endpoint, 'misses')
+                leader = True
+            else:
+                self._count(endpoint, 'shared')
+                leader = False
+
+        if not leader:
+            pending.event.wait()
+            if pending.error is not None:
+                raise pending.error
+            return pending.value
+
+        try:
+            pending.value = fetch()
+            if should_cache(pending.value):
+                self._store(endpoint, key, pending.value, ttl)
+            return pending.value
+        except BaseException as e:
+            pending.error = e
+            raise
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+            pending.event.set()
+
+    def invalidate(self, endpoint=None):
+        """Drops every cached entry, or only those of endpoint."""
+        with self._lock:
+            for key in [key for key in self._entries if endpoint is None or key[0] == endpoint]:
+                self._size -= self._entries.pop(key)[1]
+
+    def stats(self):
+        """Returns hit/miss counters per endpoint and the current cache footprint."""
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._size,
+                'max_bytes': self.max_bytes,
+                'endpoints': {endpoint: dict(counts) for endpoint, counts in self._stats.items()}
+            }
+
+
+def cached_endpoint(cache, endpoint, ttl):
+    """Decorator that routes calls through cache, keyed by endpoint and the call arguments.
+
+    The undecorated function stays reachable as ``func.__wrapped__`` for callers that need fresh data.
+    A ttl of 0 disables caching for the endpoint.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args):
+            if ttl <= 0:
+                return func(*args)
+            key = (endpoint,) + tuple(str(arg) for arg in args)
+            return cache.get_or_fetch(endpoint, key, ttl, lambda: func(*args))
+        return wrapper
+    return decorator
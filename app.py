@@ -1,4 +1,4 @@
-from flask import Flask, render_template, request, jsonify, session, redirect, url_for, Response
+from flask import Flask, render_template, request, jsonify, session, redirect, url_for, Response, send_file
 import requests
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
@@ -9,32 +9,168 @@ from tqdm import tqdm
 import asyncio
 import aiohttp
 import threading
-from queue import Queue, Empty
+from queue import Empty
 import json
+import hmac
+import hashlib
+import ipaddress
+import socket
+from urllib.parse import urljoin, urlparse
+from datetime import datetime
 from flask import Response, stream_with_context, Flask, request, jsonify, render_template
-from cache_manager import process_and_cache_series_data, search_series, get_cached_data, get_series_count_by_category
+from api_cache import ResponseCache, cached_endpoint
+from download_manager import DownloadExecutor
+from download_jobs import DownloadJobQueue
+from progress_hub import ProgressHub
+from json_stream import JsonArrayParser, iter_json_array
+from rate_limiter import BandwidthLimiter, parse_rate, parse_schedule
+from downloader import download_file, probe, DownloadCancelled
+from download_manifest import DownloadManifest, COMPLETE, INCOMPLETE
+from cover_cache import CoverCache
+from page_cache import cached_page, compress_response
+from upstream_pool import UpstreamPool
+from metrics import Registry, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from cache_manager import process_and_cache_series_data, process_and_cache_series_data_concurrent, refresh_series_data_incremental, refresh_category, search_series, get_last_fetch_date, get_series_count_by_category, get_category_page, page_series_listing, get_catalog_generation
+from search_index import CATEGORY_SORTS
 # from config import BASE_URL, USERNAME, PASSWORD # Comment out or remove this line
 
 # Retrieve configuration from environment variables
 BASE_URL = os.getenv('BASE_URL')
 USERNAME = os.getenv('USERNAME')
 PASSWORD = os.getenv('PASSWORD')
+# Mirrors of the provider: BASE_URL may list several base URLs separated by commas. Requests go to
+# the fastest healthy one, measured by health checks every UPSTREAM_HEALTH_INTERVAL seconds.
+BASE_URLS = [url.strip().rstrip('/') for url in (BASE_URL or '').split(',') if url.strip()]
+UPSTREAM_HEALTH_INTERVAL = float(os.getenv('UPSTREAM_HEALTH_INTERVAL', '30'))
+
+# Catalog crawl tuning: number of get_series requests in flight and per-request timeout (seconds).
+# A concurrency of 1 falls back to the sequential crawl.
+CRAWL_CONCURRENCY = int(os.getenv('CRAWL_CONCURRENCY', '8'))
+CRAWL_TIMEOUT = float(os.getenv('CRAWL_TIMEOUT', '30'))
+# Connect and read timeouts (seconds) of the upstream calls made while rendering a page. Each call
+# holds one of the production server's WEB_THREADS request threads until it answers.
+UPSTREAM_TIMEOUT = (5, float(os.getenv('UPSTREAM_TIMEOUT', '30')))
+# Scheduled incremental refresh: run every CACHE_REFRESH_INTERVAL seconds (0 = off), refetching only
+# categories fetched more than CACHE_STALE_AFTER seconds ago.
+CACHE_REFRESH_INTERVAL = float(os.getenv('CACHE_REFRESH_INTERVAL', '0'))
+CACHE_STALE_AFTER = float(os.getenv('CACHE_STALE_AFTER', '86400'))
+# Category pages are served from the local catalog; viewing a category whose listing is older than
+# CATEGORY_STALE_AFTER seconds refreshes it in the background.
+CATEGORY_STALE_AFTER = float(os.getenv('CATEGORY_STALE_AFTER', '21600'))
+CATEGORY_REFRESH_RETRY = 300  # seconds before retrying a category whose background refresh did not help
+
+# Search results per page on /search (a ?limit= of up to SEARCH_MAX_LIMIT overrides it).
+SEARCH_PAGE_SIZE = int(os.getenv('SEARCH_PAGE_SIZE', '24'))
+SEARCH_MAX_LIMIT = 100
+
+# Upstream response cache: per-endpoint TTLs in seconds (0 disables) and total memory budget.
+API_CACHE_TTL_CATEGORIES = float(os.getenv('API_CACHE_TTL_CATEGORIES', '600'))
+API_CACHE_TTL_SERIES = float(os.getenv('API_CACHE_TTL_SERIES', '300'))
+API_CACHE_TTL_SERIES_INFO = float(os.getenv('API_CACHE_TTL_SERIES_INFO', '120'))
+API_CACHE_MAX_BYTES = int(os.getenv('API_CACHE_MAX_MB', '64')) * 1024 * 1024
+
+# Rendered index, category and search pages are cached per catalog generation for this many seconds
+# (0 disables), and revalidated by browsers with ETags. Compressed static files share the budget.
+PAGE_CACHE_TTL = float(os.getenv('PAGE_CACHE_TTL', '60'))
+PAGE_CACHE_MAX_BYTES = int(os.getenv('PAGE_CACHE_MB', '16')) * 1024 * 1024
+
+# Cover images are served through /cover from an on-disk thumbnail cache of up to COVER_CACHE_MB
+# (0 = link the provider's covers directly), shrunk to fit COVER_SIZE when Pillow is installed and
+# cached by browsers for COVER_MAX_AGE seconds. After a catalog refresh, COVER_PREFETCH workers fetch
+# the covers of each category's first page (0 = off).
+COVER_CACHE_DIR = os.getenv('COVER_CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'covers'))
+COVER_CACHE_MAX_BYTES = int(os.getenv('COVER_CACHE_MB', '256')) * 1024 * 1024
+COVER_SIZE = tuple(int(n) for n in os.getenv('COVER_SIZE', '300x450').lower().split('x'))
+COVER_MAX_AGE = int(os.getenv('COVER_MAX_AGE', str(30 * 86400)))
+COVER_PREFETCH = int(os.getenv('COVER_PREFETCH', '0'))
+COVER_MAX_SOURCE_BYTES = 10 * 1024 * 1024  # covers larger than this are not proxied
+COVER_MAX_REDIRECTS = 5
+
+# Key for signed values such as /cover URLs. Without SECRET_KEY a random key is made at startup, so
+# pages rendered before a restart lose their covers until they are reloaded.
+SECRET_KEY = os.getenv('SECRET_KEY', '').encode() or os.urandom(32)
+
+# Episode downloads: episodes transferred in parallel overall, and streams allowed per upstream host.
+MAX_PARALLEL_DOWNLOADS = int(os.getenv('MAX_PARALLEL_DOWNLOADS', '3'))
+MAX_DOWNLOADS_PER_HOST = int(os.getenv('MAX_DOWNLOADS_PER_HOST', '2'))
+# Byte ranges fetched concurrently per episode when the server supports them (1 = single stream),
+# and attempts per transfer before giving up; each attempt resumes from the bytes already on disk.
+DOWNLOAD_SEGMENTS = int(os.getenv('DOWNLOAD_SEGMENTS', '1'))
+DOWNLOAD_MAX_ATTEMPTS = int(os.getenv('DOWNLOAD_MAX_ATTEMPTS', '5'))
+# Download write pipeline: bytes read from the network per chunk, and bytes of received chunks
+# buffered for the writer thread (sizes like '256K' or '16M').
+DOWNLOAD_CHUNK_SIZE = parse_rate(os.getenv('DOWNLOAD_CHUNK_SIZE', '256K')) or 256 * 1024
+DOWNLOAD_BUFFER_SIZE = parse_rate(os.getenv('DOWNLOAD_BUFFER', '16M')) or DOWNLOAD_CHUNK_SIZE
+# Reserve the full size of an episode on disk before writing it (0 = let files grow as data arrives).
+DOWNLOAD_PREALLOCATE = os.getenv('DOWNLOAD_PREALLOCATE', '1') not in ('0', 'false', 'no')
+# When to force downloaded data to disk: 'none', 'end' (before the file is renamed into place) or a
+# size such as '64M' (every that many bytes, and at the end).
+DOWNLOAD_FSYNC = os.getenv('DOWNLOAD_FSYNC', 'none').lower()
+DOWNLOAD_FSYNC_INTERVAL = (None if DOWNLOAD_FSYNC in ('', 'none') else 0 if DOWNLOAD_FSYNC == 'end'
+                           else parse_rate(DOWNLOAD_FSYNC))
+# Journal of queued/running/finished download jobs, used to resume work after a restart.
+DOWNLOAD_JOBS_DB = os.getenv('DOWNLOAD_JOBS_DB', 'download_jobs.db')
+# On shutdown, running downloads get this many seconds to finish before they are interrupted and
+# re-queued (they resume from their partial files on the next start).
+SHUTDOWN_DRAIN_TIMEOUT = float(os.getenv('SHUTDOWN_DRAIN_TIMEOUT', '60'))
+
+# Progress events: per-episode transfer updates are coalesced to at most PROGRESS_MAX_RATE per second
+# and, if PROGRESS_MIN_STEP is set, to steps of at least that many percent.
+PROGRESS_MAX_RATE = float(os.getenv('PROGRESS_MAX_RATE', '4'))
+PROGRESS_MIN_STEP = float(os.getenv('PROGRESS_MIN_STEP', '0'))
+
+# HTTP connection pools of the shared upstream session: number of hosts kept and connections per host.
+# The default leaves room for every download stream next to the page requests.
+UPSTREAM_POOL_CONNECTIONS = int(os.getenv('UPSTREAM_POOL_CONNECTIONS', str(max(10, len(BASE_URLS)))))
+UPSTREAM_POOL_MAXSIZE = int(os.getenv('UPSTREAM_POOL_MAXSIZE', str(max(10, MAX_PARALLEL_DOWNLOADS * DOWNLOAD_SEGMENTS + 4))))
+
+# Download bandwidth in bytes/s ('500K', '2M', ...; 0 = unlimited): shared by all streams, per download,
+# and an optional time-of-day schedule for the shared limit, e.g. "01:00-07:00=0;*=2M".
+BANDWIDTH_LIMIT = parse_rate(os.getenv('BANDWIDTH_LIMIT', '0'))
+BANDWIDTH_LIMIT_PER_DOWNLOAD = parse_rate(os.getenv('BANDWIDTH_LIMIT_PER_DOWNLOAD', '0'))
+BANDWIDTH_SCHEDULE = parse_schedule(os.getenv('BANDWIDTH_SCHEDULE', ''))
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
+# Prometheus metrics, served at /metrics
+metrics = Registry()
+UPSTREAM_LATENCY = metrics.histogram('iptv_upstream_request_seconds',
+                                     'Time until upstream player_api.php responses arrive', ['action'])
+UPSTREAM_ERRORS = metrics.counter('iptv_upstream_errors_total',
+                                  'Upstream player_api.php requests that failed or returned an error status', ['action'])
+UPSTREAM_RETRIES = metrics.counter('iptv_upstream_retries_total',
+                                   'Upstream requests retried by the HTTP adapter, by status or error', ['reason'])
+DOWNLOAD_BYTES = metrics.counter('iptv_download_bytes_total', 'Episode bytes received from upstream')
+DOWNLOADS_ACTIVE = metrics.gauge('iptv_downloads_active', 'Episode transfers in progress')
+DOWNLOADS_FINISHED = metrics.counter('iptv_downloads_total', 'Finished episode transfers', ['result'])
+CRAWL_DURATION = metrics.histogram('iptv_crawl_duration_seconds', 'Duration of catalog refreshes', ['mode'],
+                                   buckets=(5, 15, 30, 60, 120, 300, 600, 1200, 1800, 3600))
+CRAWL_RUNS = metrics.counter('iptv_crawl_runs_total', 'Catalog refreshes by mode and result', ['mode', 'result'])
+SEARCH_LATENCY = metrics.histogram('iptv_search_seconds', 'Latency of catalog searches')
+
 app = Flask(__name__)
-app.config['TEMPLATES_AUTO_RELOAD'] = True
-app.secret_key = 'your-secret-key'
+# TEMPLATES_AUTO_RELOAD is left unset, so templates are only reloaded on change in debug mode
+app.secret_key = SECRET_KEY
 
 
 DOWNLOADS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'downloads')
 
-# Configure session for requests with more robust settings
+class CountingRetry(Retry):
+    """Retry policy that counts every retry it allows in the upstream metrics"""
+    
+    def increment(self, method=None, url=None, response=None, error=None, *args, **kwargs):
+        retry = super().increment(method, url, response, error, *args, **kwargs)
+        reason = response.status if response is not None and response.status else type(error).__name__
+        UPSTREAM_RETRIES.labels(reason).inc()
+        return retry
+
+# Configure session for requests with more robust settings. With mirrors, a failing one is retried
+# only once before requests fail over to the next.
 session = requests.Session()
-retry_strategy = Retry(
-    total=3,
+retry_strategy = CountingRetry(
+    total=3 if len(BASE_URLS) <= 1 else 1,
     backoff_factor=1,
     status_forcelist=[429, 500, 502, 503, 504],
     allowed_methods=["HEAD", "GET", "POST"],
@@ -44,8 +180,8 @@ retry_strategy = Retry(
 
 adapter = HTTPAdapter(
     max_retries=retry_strategy,
-    pool_connections=10,
-    pool_maxsize=10
+    pool_connections=UPSTREAM_POOL_CONNECTIONS,
+    pool_maxsize=UPSTREAM_POOL_MAXSIZE
 )
 session.mount("http://", adapter)
 session.mount("https://", adapter)
@@ -53,9 +189,73 @@ session.headers.update({
     'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
 })
 
+api_cache = ResponseCache(max_bytes=API_CACHE_MAX_BYTES)
+page_cache = ResponseCache(max_bytes=PAGE_CACHE_MAX_BYTES)
+
+# Health checks ask player_api.php for the account info, without retries so a dead mirror shows quickly
+health_session = requests.Session()
+health_session.headers.update(session.headers)
+
+def check_upstream(base_url):
+    """Health check of one mirror: raises when it does not answer player_api.php in time"""
+    response = health_session.get(f"{base_url}/player_api.php", params={"username": USERNAME, "password": PASSWORD},
+                                  timeout=(3, 10))
+    response.raise_for_status()
+    response.close()
+
+upstream_pool = UpstreamPool(BASE_URLS or [''], check_upstream, interval=UPSTREAM_HEALTH_INTERVAL)
+
+def is_mirror_failure(error):
+    """Whether a failed request means the mirror is unwell: unreachable, timed out or a 5xx response.
+
+    Client errors such as a 404 for a missing episode say nothing about the mirror.
+    """
+    if isinstance(error, requests.exceptions.HTTPError):
+        return error.response is not None and error.response.status_code >= 500
+    if isinstance(error, aiohttp.ClientResponseError):
+        return error.status >= 500
+    return isinstance(error, (requests.exceptions.RequestException, aiohttp.ClientError, asyncio.TimeoutError))
+
+def mark_failed_if_mirror_failure(url, error):
+    if is_mirror_failure(error):
+        upstream_pool.mark_failed(url)
+
+def upstream_get(params, **kwargs):
+    """GET a player_api.php action from the fastest healthy mirror, failing over to the others.
+
+    Records latency and failures in the metrics and in the upstream pool.
+    """
+    action = params.get('action')
+    endpoints = upstream_pool.ranked()
+    for attempt, endpoint in enumerate(endpoints, 1):
+        last = attempt == len(endpoints)
+        url = f"{endpoint.base_url}/player_api.php"
+        start = time.perf_counter()
+        try:
+            response = session.get(url, params=params, **kwargs)
+        except requests.exceptions.RequestException:
+            UPSTREAM_ERRORS.labels(action).inc()
+            upstream_pool.mark_failed(url)
+            if last:
+                raise
+            continue
+        finally:
+            elapsed = time.perf_counter() - start
+            UPSTREAM_LATENCY.labels(action).observe(elapsed)
+        if response.status_code >= 400:
+            UPSTREAM_ERRORS.labels(action).inc()
+            if response.status_code >= 500:
+                upstream_pool.mark_failed(url)
+                if not last:
+                    response.close()
+                    continue
+        else:
+            upstream_pool.observe(url, elapsed)
+        return response
+
+@cached_endpoint(api_cache, 'get_series_categories', API_CACHE_TTL_CATEGORIES)
 def get_categories():
     """Fetch all series categories with improved error handling"""
-    url = f"{BASE_URL}/player_api.php"
     params = {
         "username": USERNAME,
         "password": PASSWORD,
@@ -63,8 +263,8 @@ def get_categories():
     }
     
     try:
-        logger.debug(f"Fetching categories from: {url}")
-        response = session.get(url, params=params, timeout=(5, 15))
+        logger.debug("Fetching categories")
+        response = upstream_get(params, timeout=(5, 15))
         response.raise_for_status()
         categories = response.json()
         logger.debug(f"Retrieved {len(categories)} categories")
@@ -79,9 +279,9 @@ def get_categories():
         logger.error(f"Unexpected error: {str(e)}")
         return []
 
+@cached_endpoint(api_cache, 'get_series', API_CACHE_TTL_SERIES)
 def get_series_by_category(category_id):
     """Fetch all series in a category"""
-    url = f"{BASE_URL}/player_api.php"
     params = {
         "username": USERNAME,
         "password": PASSWORD,
@@ -90,16 +290,106 @@ def get_series_by_category(category_id):
     }
     
     try:
-        response = session.get(url, params=params)
+        response = upstream_get(params, timeout=UPSTREAM_TIMEOUT)
         response.raise_for_status()
         return response.json()
     except Exception as e:
         print(f"Error fetching series list: {str(e)}")
         return []
 
+def iter_series_by_category(category_id):
+    """Stream the series of a category, yielding each record as soon as it has been received"""
+    params = {
+        "username": USERNAME,
+        "password": PASSWORD,
+        "action": "get_series",
+        "category_id": category_id
+    }
+    
+    with upstream_get(params, stream=True, timeout=(5, CRAWL_TIMEOUT)) as response:
+        response.raise_for_status()
+        yield from iter_json_array(response.iter_content(chunk_size=65536))
+
+# The concurrent crawl follows the sequential one's policy: the same connect and read timeouts, the
+# retries and backoff of retry_strategy on every mirror, then failover to the next one.
+CRAWL_REQUEST_TIMEOUT = aiohttp.ClientTimeout(total=None, sock_connect=5, sock_read=CRAWL_TIMEOUT)
+
+def crawl_backoff(retry):
+    """Seconds to wait before the retry-th retry of a request, as urllib3 does for retry_strategy"""
+    if retry <= 1:
+        return 0
+    return min(Retry.DEFAULT_BACKOFF_MAX, retry_strategy.backoff_factor * 2 ** (retry - 1))
+
+async def open_crawl_response(http_session, url, params):
+    """GET url, retrying connection errors and retry_strategy's statuses.
+
+    Returns the open response and how long its own attempt took to answer.
+    """
+    for retry in range(retry_strategy.total + 1):
+        if retry:
+            UPSTREAM_RETRIES.labels(reason).inc()
+            await asyncio.sleep(crawl_backoff(retry))
+        start = time.perf_counter()
+        try:
+            response = await http_session.get(url, params=params, headers=dict(session.headers),
+                                              timeout=CRAWL_REQUEST_TIMEOUT)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            error, reason = e, type(e).__name__
+            continue
+        finally:
+            elapsed = time.perf_counter() - start
+            UPSTREAM_LATENCY.labels('get_series').observe(elapsed)
+        if response.status not in retry_strategy.status_forcelist:
+            return response, elapsed
+        response.release()
+        error = aiohttp.ClientResponseError(response.request_info, response.history, status=response.status,
+                                            message=response.reason or '')
+        reason = response.status
+    raise error
+
+async def iter_series_by_category_async(http_session, category_id):
+    """Stream the series of a category over a shared aiohttp session, yielding records as they arrive.
+
+    Mirrors are tried in upstream_pool order. A failure after the first record ends the category,
+    like a broken stream in the sequential crawl.
+    """
+    params = {
+        "username": USERNAME,
+        "password": PASSWORD,
+        "action": "get_series",
+        "category_id": str(category_id)
+    }
+    
+    endpoints = upstream_pool.ranked()
+    for attempt, endpoint in enumerate(endpoints, 1):
+        url = f"{endpoint.base_url}/player_api.php"
+        try:
+            response, elapsed = await open_crawl_response(http_session, url, params)
+        except Exception as e:
+            UPSTREAM_ERRORS.labels('get_series').inc()
+            mark_failed_if_mirror_failure(url, e)
+            if attempt == len(endpoints):
+                raise
+            continue
+        try:
+            async with response:
+                response.raise_for_status()
+                upstream_pool.observe(url, elapsed)
+                parser = JsonArrayParser()
+                async for chunk in response.content.iter_chunked(65536):
+                    for series in parser.feed(chunk):
+                        yield series
+                for series in parser.close():
+                    yield series
+        except Exception as e:
+            UPSTREAM_ERRORS.labels('get_series').inc()
+            mark_failed_if_mirror_failure(url, e)
+            raise
+        return
+
+@cached_endpoint(api_cache, 'get_series_info', API_CACHE_TTL_SERIES_INFO)
 def get_series_info(series_id):
     """Fetch series information"""
-    url = f"{BASE_URL}/player_api.php"
     params = {
         "username": USERNAME,
         "password": PASSWORD,
@@ -108,58 +398,259 @@ def get_series_info(series_id):
     }
     
     try:
-        response = session.get(url, params=params)
+        response = upstream_get(params, timeout=UPSTREAM_TIMEOUT)
         response.raise_for_status()
         return response.json()
     except Exception as e:
         print(f"Error fetching series info: {str(e)}")
         return None
 
-def download_episode_file(episode, output_path):
-    """Download a single episode file with progress"""
-    url = f"{BASE_URL}/series/{USERNAME}/{PASSWORD}/{episode['id']}.{episode['container_extension']}"
+# Covers are requested while a page is being viewed, so a broken cover fails fast instead of going
+# through the API session's retries and backoff
+cover_session = requests.Session()
+cover_adapter = HTTPAdapter(max_retries=1, pool_connections=10, pool_maxsize=10)
+cover_session.mount("http://", cover_adapter)
+cover_session.mount("https://", cover_adapter)
+cover_session.headers.update(session.headers)
+
+def is_web_url(url):
+    return urlparse(url).scheme in ('http', 'https')
+
+def check_cover_redirect(url):
+    """Refuse a cover redirect that leaves http(s) or points at a private, loopback or reserved address"""
+    parsed = urlparse(url)
+    if parsed.scheme not in ('http', 'https') or not parsed.hostname:
+        raise ValueError(f"Cover redirected to an unsupported URL: {url}")
+    for *_, sockaddr in socket.getaddrinfo(parsed.hostname, None, proto=socket.IPPROTO_TCP):
+        if not ipaddress.ip_address(sockaddr[0].split('%')[0]).is_global:
+            raise ValueError(f"Cover redirected to a non-public address: {url}")
+
+def fetch_cover(url):
+    """Fetch an original cover image, refusing anything larger than COVER_MAX_SOURCE_BYTES.
+
+    Redirects are followed only to public http(s) addresses.
+    """
+    for _ in range(COVER_MAX_REDIRECTS + 1):
+        with cover_session.get(url, stream=True, timeout=(5, 15), allow_redirects=False) as response:
+            if response.is_redirect:
+                url = urljoin(url, response.headers['Location'])
+                check_cover_redirect(url)
+                continue
+            response.raise_for_status()
+            data = bytearray()
+            for chunk in response.iter_content(chunk_size=65536):
+                data.extend(chunk)
+                if len(data) > COVER_MAX_SOURCE_BYTES:
+                    raise ValueError(f"Cover larger than {COVER_MAX_SOURCE_BYTES} bytes: {url}")
+        return bytes(data)
+    raise ValueError(f"Cover redirected more than {COVER_MAX_REDIRECTS} times: {url}")
+
+cover_cache = CoverCache(COVER_CACHE_DIR, fetch_cover, max_bytes=COVER_CACHE_MAX_BYTES,
+                         max_size=COVER_SIZE) if COVER_CACHE_MAX_BYTES > 0 else None
+
+def cover_signature(url):
+    """Signature that limits /cover to URLs rendered by this application"""
+    return hmac.new(SECRET_KEY, url.encode(), hashlib.sha256).hexdigest()[:32]
+
+@app.template_global()
+def cover_url(url):
+    """URL to show a cover image through the thumbnail cache"""
+    if not url or cover_cache is None or not is_web_url(url):
+        return url or ''
+    return url_for('cover', url=url, sig=cover_signature(url))
+
+def prefetch_covers():
+    """Warm the cover cache with the covers on the first page of every cached category"""
+    urls = []
+    for category_id in get_series_count_by_category():
+        entries, _, _ = get_category_page(category_id, 'default', 0, 20)
+        urls.extend(entry.get('cover') for entry in entries if entry.get('cover', '').startswith(('http://', 'https://')))
+    logger.info(f"Prefetching up to {len(urls)} covers")
+    fetched = cover_cache.prefetch(urls, workers=COVER_PREFETCH)
+    logger.info(f"Prefetched {fetched} covers")
+
+progress_hub = ProgressHub(max_rate=PROGRESS_MAX_RATE, min_step=PROGRESS_MIN_STEP)
+CACHE_PROGRESS_CHANNEL = 'cache'
+
+def batch_channel(batch_id):
+    """Progress channel of a batch of download jobs"""
+    return f"batch:{batch_id}"
+
+bandwidth_limiter = BandwidthLimiter(global_rate=BANDWIDTH_LIMIT, per_download_rate=BANDWIDTH_LIMIT_PER_DOWNLOAD,
+                                     schedule=BANDWIDTH_SCHEDULE)
+
+download_executor = DownloadExecutor(max_parallel=MAX_PARALLEL_DOWNLOADS, max_per_host=MAX_DOWNLOADS_PER_HOST)
+
+def get_episode_url(episode, base_url=None):
+    """Build the stream URL of an episode, on the fastest healthy mirror unless base_url is given"""
+    if base_url is None:
+        base_url = upstream_pool.best().base_url
+    return f"{base_url}/series/{USERNAME}/{PASSWORD}/{episode['id']}.{episode['container_extension']}"
+
+def download_episode_file(episode, output_path, cancel_event=None, progress_channel=None, host_slot=None):
+    """Download a single episode file with progress, resuming from a previous partial download.
+
+    With host_slot (see DownloadExecutor.submit) the download stays on the mirror whose host slot it
+    holds, and only moves to the best mirror, taking a slot there, once that mirror has failed.
+    """
+    def url():
+        if host_slot is None:
+            return get_episode_url(episode)
+        if not upstream_pool.is_healthy(host_slot.url):
+            host_slot.move(get_episode_url(episode))
+        return host_slot.url
+    
+    limit_bandwidth = bandwidth_limiter.throttle_for_download()
+    
+    def throttle(amount):
+        # Called for every chunk received, so this is also where transferred bytes are counted
+        DOWNLOAD_BYTES.inc(amount)
+        limit_bandwidth(amount)
     
+    DOWNLOADS_ACTIVE.inc()
+    result = 'failed'
     try:
-        logger.debug(f"Attempting to download from: {url}")
-        response = session.get(url, stream=True)
-        response.raise_for_status()
-        
-        file_size = int(response.headers.get('content-length', 0))
-        logger.debug(f"File size: {file_size} bytes")
+        logger.debug(f"Attempting to download {episode['title']}")
         
         # Set up CLI progress bar
         progress_bar = tqdm(
-            total=file_size,
             unit='iB',
             unit_scale=True,
             desc=f"Downloading {episode['title']}"
         )
         
-        downloaded = 0
-        with open(output_path, 'wb') as f:
-            for data in response.iter_content(chunk_size=8192):
-                if data:
-                    size = f.write(data)
-                    downloaded += size
-                    progress_bar.update(size)
-                    # Update web UI progress via SSE
-                    progress = {
-                        'episode': episode['title'],
-                        'progress': (downloaded / file_size) * 100 if file_size > 0 else 0,
-                        'status': 'downloading'
-                    }
-                    sse_queue.put(progress)
+        def on_progress(downloaded, file_size):
+            if cancel_event is not None and cancel_event.is_set():
+                raise DownloadCancelled()
+            if file_size and progress_bar.total != file_size:
+                progress_bar.total = file_size
+            progress_bar.update(downloaded - progress_bar.n)
+            # Update web UI progress via SSE
+            if progress_channel:
+                progress = {
+                    'episode': episode['title'],
+                    'episode_id': episode['id'],
+                    'progress': (downloaded / file_size) * 100 if file_size > 0 else 0,
+                    'status': 'downloading'
+                }
+                progress_hub.publish(progress_channel, progress, key=str(episode['id']))
         
-        progress_bar.close()
+        try:
+            download_file(session, url, output_path, on_progress, segments=DOWNLOAD_SEGMENTS,
+                          max_attempts=DOWNLOAD_MAX_ATTEMPTS, throttle=throttle, chunk_size=DOWNLOAD_CHUNK_SIZE,
+                          buffer_size=DOWNLOAD_BUFFER_SIZE, preallocate=DOWNLOAD_PREALLOCATE,
+                          fsync_interval=DOWNLOAD_FSYNC_INTERVAL,
+                          on_request_error=mark_failed_if_mirror_failure)
+        finally:
+            progress_bar.close()
+        result = 'done'
         return True
+    except DownloadCancelled:
+        logger.info(f"Download of {episode['title']} cancelled")
+        result = 'cancelled'
+        return False
     except Exception as e:
+        # The partial .part file is kept so the next attempt resumes where this one stopped
         logger.error(f"Error downloading {episode['title']}: {str(e)}")
-        if os.path.exists(output_path):
-            os.remove(output_path)
         return False
+    finally:
+        DOWNLOADS_ACTIVE.dec()
+        DOWNLOADS_FINISHED.labels(result).inc()
+
+download_manifest = DownloadManifest(os.path.join(DOWNLOADS_DIR, '.manifests'))
+
+def episode_already_downloaded(episode, series_id, output_path):
+    """Whether output_path already holds the complete episode.
+
+    The manifest answers for files this application finished; other existing files count as
+    complete when their size matches what the server reports for a HEAD request.
+    """
+    if not os.path.exists(output_path):
+        return False
+    if download_manifest.is_complete(series_id, episode['id'], output_path):
+        return True
+    url = get_episode_url(episode)
+    try:
+        size, _ = probe(session, url, timeout=(5, 15))
+    except requests.exceptions.RequestException as e:
+        mark_failed_if_mirror_failure(url, e)
+        logger.debug(f"Could not check the size of {episode['title']}: {str(e)}")
+        return False
+    if size and size == os.path.getsize(output_path):
+        download_manifest.record(series_id, episode['id'], output_path, COMPLETE, size)
+        return True
+    return False
+
+def run_download_job(job, cancel_event, host_slot):
+    """Run one queued download job, skipping episodes completed since they were queued"""
+    episode, output_path = job['episode'], job['output_path']
+    if download_manifest.is_complete(job['series_id'], episode['id'], output_path):
+        logger.info(f"{episode['title']} is already downloaded, skipping")
+        return True
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    download_manifest.record(job['series_id'], episode['id'], output_path, INCOMPLETE)
+    if not download_episode_file(episode, output_path, cancel_event, progress_channel=batch_channel(job['batch_id']),
+                                 host_slot=host_slot):
+        return False
+    download_manifest.record(job['series_id'], episode['id'], output_path, COMPLETE, os.path.getsize(output_path))
+    return True
+
+def on_download_job_finished(job, batch):
+    """Report a finished job, and its batch once every job of the batch is done, via SSE"""
+    channel = batch_channel(batch['batch_id'])
+    progress_hub.publish(channel, {
+        'episode': job['title'],
+        'episode_id': job['episode_id'],
+        'job_id': job['id'],
+        'batch_id': batch['batch_id'],
+        'progress': (batch['finished'] / batch['total']) * 100,
+        'status': 'success' if job['state'] == 'done' else 'error'
+    }, key=job['episode_id'])
+    if batch['active'] == 0:
+        progress_hub.publish(channel, {
+            'batch_id': batch['batch_id'],
+            'progress': 100,
+            'status': 'complete',
+            'message': 'All downloads completed' if not batch['failed']
+                       else f"Downloads finished, {batch['failed']} of {batch['total']} failed"
+        }, key='batch')
+        # Close the batch's streams; late subscribers still get its final state
+        progress_hub.close(channel)
+
+download_queue = DownloadJobQueue(DOWNLOAD_JOBS_DB, download_executor, run_download_job,
+                                  lambda job: get_episode_url(job['episode']),
+                                  on_finished=on_download_job_finished)
+
+def start_background_services():
+    """Start the download dispatcher, resuming jobs left unfinished by a previous run"""
+    if not os.path.exists(DOWNLOADS_DIR):
+        os.makedirs(DOWNLOADS_DIR)
+    download_queue.start()
+    if len(upstream_pool) > 1:
+        upstream_pool.start()
+    if CACHE_REFRESH_INTERVAL > 0:
+        threading.Thread(target=cache_refresh_scheduler, name='cache-refresh', daemon=True).start()
+
+def end_progress_streams():
+    """Close every open progress stream so the server can stop without waiting on idle SSE clients"""
+    progress_hub.close_all()
+
+def stop_background_services(timeout=SHUTDOWN_DRAIN_TIMEOUT):
+    """Stop dispatching downloads and drain the running ones, re-queuing any still running after timeout"""
+    end_progress_streams()
+    logger.info(f"Draining running downloads (up to {timeout:.0f}s)")
+    if download_queue.stop(timeout=timeout, interrupt=True):
+        logger.info("Download queue drained")
+    else:
+        logger.warning("Some downloads did not stop in time; they will resume on the next start")
+
+@app.after_request
+def compress_responses(response):
+    return compress_response(response, page_cache)
 
 @app.route('/')
 @app.route('/page/<int:page>')
+@cached_page(page_cache, PAGE_CACHE_TTL, get_catalog_generation)
 def index(page=1):
     page_size = 30 # Changed from 20 to 30
     categories = get_categories()
@@ -182,28 +673,89 @@ def index(page=1):
                          total_categories=total_categories,
                          category_counts=category_counts)
 
+def category_is_stale(category):
+    last_fetched = category.get('last_fetched')
+    if not last_fetched:
+        return True
+    return (datetime.now() - datetime.fromisoformat(last_fetched)).total_seconds() >= CATEGORY_STALE_AFTER
+
+category_refresh_attempts = {}  # category_id -> monotonic time of the last background refresh
+category_refresh_attempts_lock = threading.Lock()
+
+def refresh_category_in_background(category_id, category_name):
+    """Refresh one category's cached listing from upstream without holding up the request"""
+    if cache_refresh_lock.locked():
+        return
+    now = time.monotonic()
+    with category_refresh_attempts_lock:
+        if now - category_refresh_attempts.get(category_id, -CATEGORY_REFRESH_RETRY) < CATEGORY_REFRESH_RETRY:
+            return
+        category_refresh_attempts[category_id] = now
+    logger.info(f"Refreshing stale category {category_id} in the background")
+    threading.Thread(target=run_category_refresh, args=(category_id, category_name),
+                     name='category-refresh', daemon=True).start()
+
+# One category refresh at a time. Separate from cache_refresh_lock, so a refresh started by a page view
+# never turns away a catalog refresh asked for by a user or the scheduler.
+category_refresh_lock = threading.Lock()
+
+def run_category_refresh(category_id, category_name):
+    """Replace one category's cached series with a fresh listing.
+
+    Reports nothing on the cache progress channel. Skipped when a catalog refresh or another
+    category refresh is running; a catalog refresh started meanwhile refetches the category anyway.
+    """
+    if cache_refresh_lock.locked() or not category_refresh_lock.acquire(blocking=False):
+        return False
+    started = time.perf_counter()
+    result = 'success'
+    try:
+        if not refresh_category(category_id, category_name, iter_series_by_category):
+            result = 'error'
+    except Exception as e:
+        result = 'error'
+        logger.error(f"Error refreshing category {category_id}: {str(e)}")
+    finally:
+        CRAWL_DURATION.labels('category').observe(time.perf_counter() - started)
+        CRAWL_RUNS.labels('category', result).inc()
+        category_refresh_lock.release()
+    return result == 'success'
+
 @app.route('/series/<category_id>')
 @app.route('/series/<category_id>/page/<int:page>')
+@cached_page(page_cache, PAGE_CACHE_TTL, get_catalog_generation)
 def series(category_id, page=1):
     page_size = 20
-    series_list = get_series_by_category(category_id)
+    page = max(1, page)
+    sort = request.args.get('sort', 'default')
+    if sort not in CATEGORY_SORTS:
+        sort = 'default'
+    offset = (page - 1) * page_size
     
-    # Get category name
-    categories = get_categories()
-    category_name = next((cat['category_name'] for cat in categories if cat['category_id'] == category_id), 'Unknown Category')
+    catalog_page = get_category_page(category_id, sort, offset, page_size)
+    if catalog_page is not None:
+        series_list, total, category = catalog_page
+        category_name = category.get('category_name') or 'Unknown Category'
+        if category_is_stale(category):
+            refresh_category_in_background(category_id, category_name)
+    else:
+        # Not in the local catalog (yet): page through the upstream listing instead
+        series_list, total = page_series_listing(get_series_by_category(category_id), category_id,
+                                                 sort, offset, page_size)
+        categories = get_categories()
+        category_name = next((cat['category_name'] for cat in categories if cat['category_id'] == category_id), 'Unknown Category')
     
     # Calculate pagination
-    total = len(series_list)
     pages = (total + page_size - 1) // page_size
-    start = (page - 1) * page_size
-    end = start + page_size
     
     return render_template('series.html', 
-                         series_list=series_list[start:end],
+                         series_list=series_list,
                          current_page=page,
                          total_pages=pages,
                          category_id=category_id,
-                         category_name=category_name)
+                         category_name=category_name,
+                         sort=sort,
+                         sorts=list(CATEGORY_SORTS))
 
 @app.route('/download', methods=['POST'])
 def download():
@@ -246,48 +798,46 @@ def download_episodes():
         if not episodes_to_download:
             return jsonify({'error': 'No episodes found in selected range'}), 400
         
-        # Create downloads directory if it doesn't exist
+        try:
+            priority = int(request.form.get('priority', 0))
+        except ValueError:
+            priority = 0
+        
         series_dir = os.path.join(DOWNLOADS_DIR, f"{series_data['info']['name']} - S{season}")
-        os.makedirs(series_dir, exist_ok=True)
+        items = []
+        downloaded = []
+        for episode in episodes_to_download:
+            output_path = os.path.join(series_dir, f"{episode['title']}.{episode['container_extension']}")
+            if episode_already_downloaded(episode, series_id, output_path):
+                downloaded.append(str(episode['id']))
+            else:
+                items.append((episode, series_id, output_path))
         
-        # Start download process in background thread
-        def download_worker():
-            try:
-                total = len(episodes_to_download)
-                for i, episode in enumerate(episodes_to_download, 1):
-                    output_path = os.path.join(series_dir, f"{episode['title']}.{episode['container_extension']}")
-                    success = download_episode_file(episode, output_path)
-                    # Update progress via SSE
-                    progress = {
-                        'episode': episode['title'],
-                        'progress': (i / total) * 100,
-                        'status': 'success' if success else 'error'
-                    }
-                    sse_queue.put(progress)
-                
-                # Send completion message
-                sse_queue.put({
-                    'progress': 100,
-                    'status': 'complete',
-                    'message': 'All downloads completed'
-                })
-                # Send sentinel to close connection
-                sse_queue.put(None)
-            except Exception as e:
-                logger.error(f"Download worker error: {str(e)}")
-                sse_queue.put({
-                    'status': 'error',
-                    'error': str(e)
-                })
-                sse_queue.put(None)
+        if not items:
+            return jsonify({
+                'success': True,
+                'message': f'All {len(downloaded)} selected episodes are already downloaded',
+                'batch_id': None,
+                'job_ids': [],
+                'already_downloaded': downloaded
+            })
         
-        thread = threading.Thread(target=download_worker)
-        thread.daemon = True
-        thread.start()
+        # Queue one job per episode; the dispatcher downloads them in the background
+        batch_id, job_ids, skipped = download_queue.enqueue(items, priority=priority)
+        if not job_ids:
+            return jsonify({'error': 'All selected episodes are already queued or downloading'}), 409
         
+        message = f'Download queued for {len(job_ids)} episodes'
+        if skipped:
+            message += f' ({len(skipped)} already queued)'
+        if downloaded:
+            message += f' ({len(downloaded)} already downloaded)'
         return jsonify({
             'success': True,
-            'message': f'Download started for {len(episodes_to_download)} episodes'
+            'message': message,
+            'batch_id': batch_id,
+            'job_ids': job_ids,
+            'already_downloaded': downloaded
         })
         
     except KeyError as e:
@@ -297,29 +847,76 @@ def download_episodes():
         logger.error(f"Download error: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
-# Add SSE route for progress updates
-sse_queue = Queue()
+@app.route('/jobs')
+def list_jobs():
+    """List download jobs, newest first, optionally filtered by ?state="""
+    state = request.args.get('state')
+    limit = request.args.get('limit', 200, type=int)
+    return jsonify(download_queue.list_jobs(state=state, limit=limit))
 
-@app.route('/progress')
-def progress():
+@app.route('/jobs/<int:job_id>')
+def get_job(job_id):
+    job = download_queue.get(job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job)
+
+@app.route('/jobs/<int:job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    if not download_queue.cancel(job_id):
+        return jsonify({'error': 'Job is not queued or running'}), 409
+    return jsonify({'success': True, 'job_id': job_id})
+
+@app.route('/bandwidth', methods=['GET', 'POST'])
+def bandwidth():
+    """Show or change the download bandwidth limits at runtime"""
+    if request.method == 'POST':
+        settings = request.get_json(silent=True) or request.form
+        try:
+            bandwidth_limiter.configure(
+                global_rate=parse_rate(settings['global_rate']) if 'global_rate' in settings else None,
+                per_download_rate=(parse_rate(settings['per_download_rate'])
+                                   if 'per_download_rate' in settings else None),
+                schedule=parse_schedule(settings['schedule']) if 'schedule' in settings else None
+            )
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        logger.info(f"Bandwidth limits updated: {bandwidth_limiter.state()}")
+    return jsonify(bandwidth_limiter.state())
+
+def progress_stream(path, args):
+    """Channel and keep-alive interval of the progress stream at path, or None if args lack a batch
+
+    The production server (asgi.py) serves these streams from its event loop with the same settings.
+    """
+    if path == '/cache_progress':
+        return CACHE_PROGRESS_CHANNEL, 15
+    if path == '/progress' and args.get('batch_id'):
+        return batch_channel(args['batch_id']), 30
+    return None
+
+def sse_response(channel, keep_alive=30):
+    """Stream the events of a progress channel to one client"""
+    subscription = progress_hub.subscribe(channel)
+    
     def generate():
         try:
             while True:
                 # Add timeout to prevent infinite blocking
                 try:
-                    progress = sse_queue.get(timeout=30)
-                    if progress is None:  # Use None as sentinel to stop
-                        break
-                    yield f"data: {json.dumps(progress)}\n\n"
-                except Queue.Empty:
-                    # Send keep-alive message every 30 seconds
+                    progress = subscription.get(timeout=keep_alive)
+                except Empty:
+                    # Send keep-alive message to prevent timeout
                     yield ": keep-alive\n\n"
+                    continue
+                if progress is None:  # Channel closed
+                    break
+                yield f"data: {json.dumps(progress)}\n\n"
         except GeneratorExit:
             # Client disconnected, cleanup
-            logger.debug("Client disconnected from progress stream")
-        except Exception as e:
-            logger.error(f"Error in progress stream: {str(e)}")
-            yield f"data: {json.dumps({'error': str(e)})}\n\n"
+            logger.debug(f"Client disconnected from progress stream {channel}")
+        finally:
+            progress_hub.unsubscribe(subscription)
     
     return Response(
         stream_with_context(generate()),
@@ -330,84 +927,219 @@ def progress():
         }
     )
 
+# Add SSE route for progress updates
+@app.route('/progress')
+def progress():
+    stream = progress_stream(request.path, request.args)
+    if stream is None:
+        return jsonify({'error': 'batch_id is required'}), 400
+    return sse_response(*stream)
+
+@app.route('/cover')
+def cover():
+    """Serve a cover thumbnail from the on-disk cache, fetching it from the provider on a miss"""
+    url = request.args.get('url', '')
+    if (cover_cache is None or not is_web_url(url)
+            or not hmac.compare_digest(request.args.get('sig', ''), cover_signature(url))):
+        return jsonify({'error': 'Invalid cover URL'}), 403
+    cached = cover_cache.get(url)
+    if cached is None:
+        # Let the browser try the provider itself
+        return redirect(url)
+    path, etag, mimetype = cached
+    response = send_file(path, mimetype=mimetype, etag=etag, max_age=COVER_MAX_AGE, conditional=True)
+    response.cache_control.immutable = True
+    return response
+
+@app.route('/upstream')
+def upstream_status():
+    """Health and smoothed latency of every upstream mirror, in the order requests try them"""
+    ranked = [endpoint.base_url for endpoint in upstream_pool.ranked()]
+    return jsonify(sorted(upstream_pool.stats(), key=lambda endpoint: ranked.index(endpoint['base_url'])))
+
+@app.route('/api_cache/stats')
+def api_cache_stats():
+    """Hit/miss counters and memory footprint of the upstream response cache."""
+    return jsonify(api_cache.stats())
+
+def catalog_series_total():
+    return sum(get_series_count_by_category().values())
+
+def cache_request_counts(cache):
+    return {(endpoint, kind): count
+            for endpoint, counts in cache.stats()['endpoints'].items() for kind, count in counts.items()}
+
+# Gauges read from the application's components when /metrics is scraped
+metrics.gauge_func('iptv_catalog_series', 'Series in the local catalog', catalog_series_total)
+metrics.gauge_func('iptv_catalog_categories', 'Categories with series in the local catalog',
+                   lambda: len(get_series_count_by_category()))
+metrics.gauge_func('iptv_progress_channels', 'Progress channels held by the progress hub',
+                   lambda: progress_hub.stats()['channels'])
+metrics.gauge_func('iptv_progress_subscribers', 'Open progress (SSE) streams',
+                   lambda: progress_hub.stats()['subscribers'])
+metrics.gauge_func('iptv_progress_queued_events', 'Progress events waiting to be sent to SSE clients',
+                   lambda: progress_hub.stats()['queued_events'])
+metrics.gauge_func('iptv_download_jobs', 'Download jobs by state',
+                   lambda: {(state,): count for state, count in download_queue.state_counts().items()},
+                   labelnames=['state'])
+metrics.gauge_func('iptv_bandwidth_limit_bytes', 'Shared download bandwidth limit in effect, bytes/s (0 = unlimited)',
+                   lambda: bandwidth_limiter.state()['effective_rate'])
+metrics.gauge_func('iptv_api_cache_bytes', 'Memory used by cached upstream responses',
+                   lambda: api_cache.stats()['bytes'])
+metrics.gauge_func('iptv_api_cache_requests_total', 'Upstream response cache lookups by endpoint and outcome',
+                   lambda: cache_request_counts(api_cache), labelnames=['endpoint', 'outcome'], kind='counter')
+metrics.gauge_func('iptv_page_cache_bytes', 'Memory used by cached rendered pages and compressed static files',
+                   lambda: page_cache.stats()['bytes'])
+metrics.gauge_func('iptv_page_cache_requests_total', 'Rendered page and static file cache lookups by outcome',
+                   lambda: cache_request_counts(page_cache), labelnames=['endpoint', 'outcome'], kind='counter')
+
+metrics.gauge_func('iptv_upstream_up', 'Whether an upstream mirror is considered healthy',
+                   lambda: {(e['base_url'],): int(e['healthy']) for e in upstream_pool.stats()}, labelnames=['endpoint'])
+metrics.gauge_func('iptv_upstream_latency_seconds', 'Smoothed latency of an upstream mirror',
+                   lambda: {(e['base_url'],): e['latency'] for e in upstream_pool.stats() if e['latency'] is not None},
+                   labelnames=['endpoint'])
+if cover_cache is not None:
+    metrics.gauge_func('iptv_cover_cache_bytes', 'Disk used by cached cover thumbnails',
+                       lambda: cover_cache.stats()['bytes'])
+    metrics.gauge_func('iptv_cover_requests_total', 'Cover requests by outcome',
+                       lambda: {(outcome,): cover_cache.stats()[outcome] for outcome in ('hits', 'misses', 'shared', 'errors')},
+                       labelnames=['outcome'], kind='counter')
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus metrics in the text exposition format"""
+    return Response(metrics.render(), content_type=METRICS_CONTENT_TYPE)
+
 @app.route('/test_base_html')
 def test_base_html():
     return render_template('base.html')
 
 @app.route('/search')
+@cached_page(page_cache, PAGE_CACHE_TTL, get_catalog_generation)
 def search():
     query = request.args.get('query')
+    page = max(1, request.args.get('page', 1, type=int))
+    limit = min(max(1, request.args.get('limit', SEARCH_PAGE_SIZE, type=int)), SEARCH_MAX_LIMIT)
     results = []
-    last_fetch_date = None
-
-    cached_data = get_cached_data()
-    if cached_data:
-        last_fetch_date = cached_data.get("last_fetch_date")
+    total = 0
 
     if query:
-        results, _ = search_series(query) # _ is used to ignore last_fetch_date from search_series as we already got it
+        with SEARCH_LATENCY.time():
+            results, total, last_fetch_date = search_series(query, offset=(page - 1) * limit, limit=limit)
+    else:
+        last_fetch_date = get_last_fetch_date()
 
-    return render_template('search.html', query=query, results=results, last_fetch_date=last_fetch_date)
+    return render_template('search.html', query=query, results=results, last_fetch_date=last_fetch_date,
+                           total=total, current_page=page, total_pages=(total + limit - 1) // limit, limit=limit)
 
 @app.route('/cache_progress')
 def cache_progress():
-    def generate():
-        while True:
-            try:
-                progress_data = sse_queue.get(timeout=1) # Short timeout to keep connection alive
-                if progress_data is None: # Sentinel to close connection
-                    break
-                yield f"data: {json.dumps(progress_data)}\n\n"
-            except Empty:
-                yield ": keep-alive\n\n" # Send keep-alive to prevent timeout
-            except GeneratorExit:
-                logger.debug("Client disconnected from cache progress stream")
-                break
-            except Exception as e:
-                logger.error(f"Error in cache progress stream: {str(e)}")
-                yield f"data: {json.dumps({'status': 'error', 'message': str(e)})}\n\n"
-
-    return Response(stream_with_context(generate()), mimetype='text/event-stream')
+    return sse_response(*progress_stream(request.path, request.args))
+
+cache_refresh_lock = threading.Lock()
+
+def claim_cache_refresh():
+    """Take cache_refresh_lock and clear the cache progress channel for a new run.
+
+    Returns False when another refresh is already running.
+    """
+    if not cache_refresh_lock.acquire(blocking=False):
+        return False
+    progress_hub.reset(CACHE_PROGRESS_CHANNEL)
+    return True
+
+def run_cache_refresh(mode='full', stale_after=None, claimed=False):
+    """Run a full or incremental catalog refresh, reporting on the cache progress channel.
+
+    Returns False without doing anything
+    when another refresh is already running. Callers that already ran claim_cache_refresh() pass
+    claimed=True; the lock is released when the refresh ends.
+    """
+    if not claimed and not claim_cache_refresh():
+        return False
+    started = time.perf_counter()
+    result = 'success'
+    try:
+        def progress_callback(progress, message, status):
+            progress_hub.publish(CACHE_PROGRESS_CHANNEL, {
+                'progress': progress,
+                'message': message,
+                'status': status
+            }, key='cache')
+        
+        # Crawls stream listings straight from upstream, bypassing the response cache so they see fresh
+        # data and do not evict the entries serving page views.
+        async_fetch = iter_series_by_category_async if CRAWL_CONCURRENCY > 1 else None
+        if mode == 'incremental':
+            refresh_series_data_incremental(get_categories, iter_series_by_category, progress_callback,
+                                            stale_after=stale_after,
+                                            get_series_by_category_async_func=async_fetch,
+                                            max_in_flight=CRAWL_CONCURRENCY, request_timeout=CRAWL_TIMEOUT)
+        elif async_fetch:
+            process_and_cache_series_data_concurrent(get_categories, async_fetch, progress_callback,
+                                                     max_in_flight=CRAWL_CONCURRENCY,
+                                                     request_timeout=CRAWL_TIMEOUT)
+        else:
+            process_and_cache_series_data(get_categories, iter_series_by_category, progress_callback)
+    except Exception as e:
+        result = 'error'
+        logger.error(f"Error during caching process: {str(e)}")
+        progress_hub.publish(CACHE_PROGRESS_CHANNEL, {
+            'status': 'error',
+            'message': f'Caching failed: {str(e)}'
+        }, key='cache')
+    finally:
+        CRAWL_DURATION.labels(mode).observe(time.perf_counter() - started)
+        CRAWL_RUNS.labels(mode, result).inc()
+        progress_hub.close(CACHE_PROGRESS_CHANNEL) # Close the SSE connections
+        cache_refresh_lock.release()
+    if result == 'success' and cover_cache is not None and COVER_PREFETCH > 0:
+        threading.Thread(target=prefetch_covers, name='cover-prefetch', daemon=True).start()
+    return True
+
+def cache_refresh_scheduler():
+    """Periodically refresh stale categories in the background"""
+    while True:
+        time.sleep(CACHE_REFRESH_INTERVAL)
+        logger.info("Starting scheduled incremental cache refresh")
+        if not run_cache_refresh('incremental', stale_after=CACHE_STALE_AFTER):
+            logger.info("Skipping scheduled cache refresh, another refresh is running")
 
 @app.route('/cache_data')
 def cache_data():
-    """Endpoint to trigger the caching of series data in a background thread."""
+    """Endpoint to trigger the caching of series data in a background thread.
+
+    ?mode=incremental only writes changed series; with ?stale_after=<seconds> it also only
+    fetches categories whose listing is older than that.
+    """
+    mode = request.args.get('mode', 'full')
+    if mode not in ('full', 'incremental'):
+        return jsonify({"status": "error", "message": f"Unknown mode: {mode}"}), 400
+    stale_after = request.args.get('stale_after', type=float)
+    # Claim the refresh here, so concurrent requests get a 409, and a progress stream opened after
+    # this response does not replay the end of the previous run
+    if not claim_cache_refresh():
+        return jsonify({"status": "busy", "message": "A caching process is already running."}), 409
+    
     def caching_worker(app_context):
         with app_context:
-            try:
-                total_categories = len(get_categories())
-                def progress_callback(progress, message, status):
-                    sse_queue.put({
-                        'progress': progress,
-                        'message': message,
-                        'status': status
-                    })
-                
-                process_and_cache_series_data(get_categories, get_series_by_category, progress_callback)
-                sse_queue.put({
-                    'progress': 100,
-                    'status': 'complete',
-                    'message': 'Caching process completed.'
-                })
-            except Exception as e:
-                logger.error(f"Error during caching process: {str(e)}")
-                sse_queue.put({
-                    'status': 'error',
-                    'message': f'Caching failed: {str(e)}'
-                })
-            finally:
-                sse_queue.put(None) # Sentinel to close the SSE connection
+            run_cache_refresh(mode, stale_after, claimed=True)
 
     # Start the caching process in a new thread
     app_context = app.app_context()
     thread = threading.Thread(target=caching_worker, args=(app_context,))
     thread.daemon = True
-    thread.start()
+    try:
+        thread.start()
+    except Exception:
+        cache_refresh_lock.release()
+        raise
 
     return jsonify({"status": "success", "message": "Caching process initiated in background."})
 
 if __name__ == '__main__':
-    if not os.path.exists(DOWNLOADS_DIR):
-        os.makedirs(DOWNLOADS_DIR)
+    # With the debug reloader only the serving child process runs background work
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_background_services()
     # Add host parameter to make it accessible from other devices on the network
     app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
@@ -0,0 +1,115 @@
+# ASGI entry point of the production server (see gunicorn.conf.py).
+#
+# Progress streams (/progress, /cache_progress) are served from the event loop, so a connected client
+# costs a coroutine instead of a thread. Every other request runs the Flask app on a pool of
+# WEB_THREADS threads, including pages that wait on the provider (see UPSTREAM_TIMEOUT in app.py).
+import asyncio
+import json
+import logging
+import os
+import signal
+import threading
+from queue import Empty
+from urllib.parse import parse_qsl
+
+from a2wsgi import WSGIMiddleware
+
+import app as application
+
+logger = logging.getLogger(__name__)
+
+WEB_THREADS = int(os.getenv('WEB_THREADS', '32'))
+
+wsgi = WSGIMiddleware(application.app, workers=WEB_THREADS)
+
+SSE_HEADERS = [
+    (b'content-type', b'text/event-stream; charset=utf-8'),
+    (b'cache-control', b'no-cache'),
+    (b'x-accel-buffering', b'no'),
+]
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await lifespan(receive, send)
+        return
+    if scope['type'] == 'http' and scope['method'] == 'GET':
+        args = dict(parse_qsl(scope['query_string'].decode('latin-1')))
+        stream = application.progress_stream(scope['path'], args)
+        if stream is not None:
+            await stream_progress(*stream, receive, send)
+            return
+    await wsgi(scope, receive, send)
+
+
+async def stream_progress(channel, keep_alive, receive, send):
+    """Stream the events of a progress channel to one client until the channel closes or it disconnects"""
+    subscription = application.progress_hub.subscribe(channel)
+    disconnected = asyncio.ensure_future(wait_for_disconnect(receive))
+    try:
+        await send({'type': 'http.response.start', 'status': 200, 'headers': SSE_HEADERS})
+        while True:
+            event = asyncio.ensure_future(subscription.aget(timeout=keep_alive))
+            await asyncio.wait({event, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+            if not event.done():
+                event.cancel()
+                logger.debug(f"Client disconnected from progress stream {channel}")
+                return
+            try:
+                progress = event.result()
+            except Empty:
+                # Send keep-alive message to prevent timeout
+                chunk = ": keep-alive\n\n"
+            else:
+                if progress is None:  # Channel closed
+                    break
+                chunk = f"data: {json.dumps(progress)}\n\n"
+            await send({'type': 'http.response.body', 'body': chunk.encode(), 'more_body': True})
+        await send({'type': 'http.response.body', 'body': b''})
+    finally:
+        disconnected.cancel()
+        application.progress_hub.unsubscribe(subscription)
+
+
+async def wait_for_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            try:
+                application.start_background_services()
+                end_progress_streams_on_exit()
+            except Exception as e:
+                logger.exception("Failed to start background services")
+                await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+                return
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            # Runs once open requests have finished; draining downloads may take SHUTDOWN_DRAIN_TIMEOUT
+            await asyncio.get_running_loop().run_in_executor(None, application.stop_background_services)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+def end_progress_streams_on_exit():
+    """Close open progress streams as soon as the server is told to stop
+
+    The server waits for open requests before shutting down, and idle progress streams would
+    otherwise keep it waiting until gunicorn's graceful_timeout. The server's own handlers still run.
+    """
+    if threading.current_thread() is not threading.main_thread():
+        return
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        previous = signal.getsignal(sig)
+
+        def on_exit(signum, frame, previous=previous):
+            # Run outside the signal handler since the progress hub takes locks
+            threading.Thread(target=application.end_progress_streams, daemon=True).start()
+            if callable(previous):
+                previous(signum, frame)
+
+        signal.signal(sig, on_exit)
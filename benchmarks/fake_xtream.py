@@ -0,0 +1,258 @@
+"""Local stand-in for an Xtream Codes panel, used by the benchmarks.
+
+Serves player_api.php (get_series_categories, get_series, get_series_info) over a generated
+catalog and /series/<user>/<pass>/<id>.<ext> episode streams with HEAD and Range support.
+Catalog size, per-request latency and per-connection bandwidth are configurable.
+
+Run standalone with:  python benchmarks/fake_xtream.py --categories 200 --series-per-category 100
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+WORDS = (
+    "the lost city night river shadow empire crown house secret island star dark blue red last "
+    "first code storm winter summer wild heart broken fire ice garden road bridge hunter doctor "
+    "family law order detective mystery kingdom legend ocean mountain desert ghost machine signal"
+).split()
+NAMES = "john mary james anna robert laura michael sarah david emma peter olivia paul sophie mark".split()
+SURNAMES = "smith jones brown taylor wilson davies evans thomas johnson roberts walker wright".split()
+PATTERN = bytes(range(256)) * 256  # 64 KiB repeating episode payload
+RANGE_RE = re.compile(r'bytes=(\d*)-(\d*)')
+
+
+class FakeCatalog:
+    """Deterministic catalog of categories, series and episodes."""
+
+    def __init__(self, categories=50, series_per_category=40, seasons=2, episodes_per_season=10,
+                 plot_words=40, seed=1):
+        rng = random.Random(seed)
+        self.categories = [{"category_id": str(c), "category_name": f"Category {c}", "parent_id": 0}
+                           for c in range(1, categories + 1)]
+        self.series = {}
+        self.series_by_category = {}
+        series_id = 1
+        for category in self.categories:
+            listing = []
+            for _ in range(series_per_category):
+                name = ' '.join(rng.choice(WORDS).title() for _ in range(rng.randint(1, 4)))
+                record = {
+                    "num": series_id,
+                    "name": f"{name} {series_id}",
+                    "series_id": series_id,
+                    "cover": f"http://covers.invalid/{series_id}.jpg",
+                    "plot": ' '.join(rng.choice(WORDS) for _ in range(plot_words)).capitalize() + '.',
+                    "cast": ', '.join(f"{rng.choice(NAMES).title()} {rng.choice(SURNAMES).title()}"
+                                      for _ in range(rng.randint(1, 4))),
+                    "director": "",
+                    "genre": "Drama",
+                    "releaseDate": f"20{rng.randint(0, 24):02d}-01-01",
+                    "last_modified": str(1600000000 + rng.randint(0, 10 ** 8)),
+                    "rating": f"{rng.uniform(1, 10):.1f}",
+                    "rating_5based": 0,
+                    "backdrop_path": [],
+                    "youtube_trailer": "",
+                    "episode_run_time": "45",
+                    "category_id": category["category_id"],
+                }
+                listing.append(record)
+                self.series[series_id] = record
+                series_id += 1
+            self.series_by_category[category["category_id"]] = listing
+        self.seasons = seasons
+        self.episodes_per_season = episodes_per_season
+
+    def series_info(self, series_id):
+        record = self.series.get(series_id)
+        if record is None:
+            return None
+        episodes = {}
+        for season in range(1, self.seasons + 1):
+            episodes[str(season)] = [{
+                "id": str(series_id * 1000 + season * 100 + episode),
+                "episode_num": episode,
+                "title": f"{record['name']} - S{season:02d}E{episode:02d}",
+                "container_extension": "mkv",
+                "info": {"duration_secs": 2700, "bitrate": 2000},
+                "season": season,
+            } for episode in range(1, self.episodes_per_season + 1)]
+        return {
+            "seasons": [{"season_number": season} for season in range(1, self.seasons + 1)],
+            "info": dict(record, category_id=record["category_id"]),
+            "episodes": episodes,
+        }
+
+
+class FakeXtreamServer:
+    """Threaded HTTP server for a FakeCatalog.
+
+    latency: seconds added to every player_api.php request.
+    bandwidth: bytes per second per episode stream (0 = unlimited).
+    episode_size: size in bytes of every episode file.
+    """
+
+    def __init__(self, catalog, host='127.0.0.1', port=0, latency=0.0, bandwidth=0, episode_size=8 * 1024 * 1024):
+        self.catalog = catalog
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.episode_size = episode_size
+        self.requests = {}
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def count(self, key):
+        with self._lock:
+            self.requests[key] = self.requests.get(key, 0) + 1
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send_json(self, value):
+                body = json.dumps(value).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _api(self, query):
+                action = query.get('action', [None])[0]
+                server.count(action)
+                if server.latency:
+                    time.sleep(server.latency)
+                if action == 'get_series_categories':
+                    return self._send_json(server.catalog.categories)
+                if action == 'get_series':
+                    category_id = query.get('category_id', [None])[0]
+                    return self._send_json(server.catalog.series_by_category.get(category_id, []))
+                if action == 'get_series_info':
+                    try:
+                        series_id = int(query.get('series_id', ['0'])[0])
+                    except ValueError:
+                        series_id = 0
+                    return self._send_json(server.catalog.series_info(series_id) or {})
+                self._send_json({"user_info": {"auth": 1}})
+
+            def _stream(self, head):
+                server.count('stream')
+                size = server.episode_size
+                start, end, status = 0, size - 1, 200
+                match = RANGE_RE.match(self.headers.get('Range', ''))
+                if match and (match.group(1) or match.group(2)):
+                    if match.group(1):
+                        start = int(match.group(1))
+                        end = min(int(match.group(2)), size - 1) if match.group(2) else size - 1
+                    else:
+                        start = max(0, size - int(match.group(2)))
+                    if start >= size or start > end:
+                        self.send_response(416)
+                        self.send_header('Content-Range', f'bytes */{size}')
+                        self.send_header('Content-Length', '0')
+                        self.end_headers()
+                        return
+                    status = 206
+                self.send_response(status)
+                self.send_header('Content-Type', 'video/x-matroska')
+                self.send_header('Accept-Ranges', 'bytes')
+                self.send_header('Content-Length', str(end - start + 1))
+                if status == 206:
+                    self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+                self.end_headers()
+                if head:
+                    return
+                position = start
+                started = time.monotonic()
+                sent = 0
+                try:
+                    while position <= end:
+                        offset = position % len(PATTERN)
+                        chunk = PATTERN[offset:offset + min(len(PATTERN) - offset, end + 1 - position)]
+                        self.wfile.write(chunk)
+                        position += len(chunk)
+                        sent += len(chunk)
+                        if server.bandwidth:
+                            ahead = sent / server.bandwidth - (time.monotonic() - started)
+                            if ahead > 0:
+                                time.sleep(ahead)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+            def _route(self, head):
+                parsed = urlparse(self.path)
+                if parsed.path.endswith('/player_api.php'):
+                    return self._api(parse_qs(parsed.query))
+                if parsed.path.startswith('/series/'):
+                    return self._stream(head)
+                self.send_response(404)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def do_GET(self):
+                self._route(head=False)
+
+            def do_HEAD(self):
+                self._route(head=True)
+
+        return Handler
+
+
+def episode_payload(start, length):
+    """Returns the bytes the fake server sends for [start, start + length) of any episode."""
+    out = bytearray()
+    position = start
+    while len(out) < length:
+        offset = position % len(PATTERN)
+        chunk = PATTERN[offset:offset + min(len(PATTERN) - offset, length - len(out))]
+        out += chunk
+        position += len(chunk)
+    return bytes(out)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--categories', type=int, default=50)
+    parser.add_argument('--series-per-category', type=int, default=40)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to each API request')
+    parser.add_argument('--bandwidth', type=int, default=0, help='bytes/s per episode stream (0 = unlimited)')
+    parser.add_argument('--episode-size', type=int, default=8 * 1024 * 1024)
+    args = parser.parse_args()
+    catalog = FakeCatalog(args.categories, args.series_per_category)
+    server = FakeXtreamServer(catalog, args.host, args.port, args.latency, args.bandwidth, args.episode_size)
+    print(f"Serving {len(catalog.series)} series at {server.base_url} (Ctrl+C to stop)")
+    try:
+        server._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
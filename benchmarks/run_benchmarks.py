@@ -0,0 +1,281 @@
+"""Benchmark suite for catalog crawling, search, page rendering and episode downloads.
+
+Everything runs against the local fake Xtream server in benchmarks/fake_xtream.py, inside a
+temporary working directory, so no provider credentials are needed.
+
+    python benchmarks/run_benchmarks.py --output results.json
+    python benchmarks/run_benchmarks.py --compare results.json
+    python benchmarks/run_benchmarks.py --only search --search-sizes 10000,100000
+
+Results are printed and optionally written as JSON: {"meta": {...}, "results": {name: {metric: value}}}.
+With --compare, every metric is shown next to the baseline value and the relative change.
+"""
+import argparse
+import contextlib
+import io
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_ROOT)
+sys.path.insert(0, BENCH_DIR)
+
+from fake_xtream import FakeCatalog, FakeXtreamServer  # noqa: E402
+
+SEARCH_QUERIES = ['the', 'lost city', 'john', 'smith', 'river', 'ocean kingdom', 'winter', 'zzzz', 'detective', 'ma',
+                  'detectve', 'kingdon hunter']  # the last two are misspelled
+SEARCH_LIMIT = 24  # one page of results, as /search requests it
+SUITES = ('crawl', 'search', 'pages', 'download')
+
+
+def percentiles(samples):
+    ordered = sorted(samples)
+
+    def pick(fraction):
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+    return {
+        'p50_ms': round(pick(0.50) * 1000, 3),
+        'p95_ms': round(pick(0.95) * 1000, 3),
+        'mean_ms': round(statistics.mean(ordered) * 1000, 3),
+    }
+
+
+@contextlib.contextmanager
+def quiet():
+    """Silences the application's print/tqdm output while a benchmark runs."""
+    with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+        yield
+
+
+def timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def bench_crawl(app, cache_manager, server, args):
+    results = {}
+    series_total = len(server.catalog.series)
+    with quiet():
+        seconds, _ = timed(cache_manager.process_and_cache_series_data, app.get_categories, app.iter_series_by_category)
+    results['crawl.sequential'] = {'seconds': round(seconds, 3), 'series_per_s': round(series_total / seconds, 1)}
+
+    for concurrency in (4, 16):
+        with quiet():
+            seconds, _ = timed(cache_manager.process_and_cache_series_data_concurrent, app.get_categories,
+                               app.iter_series_by_category_async, max_in_flight=concurrency)
+        results[f'crawl.concurrent_{concurrency}'] = {'seconds': round(seconds, 3),
+                                                       'series_per_s': round(series_total / seconds, 1)}
+    return results
+
+
+def bench_search(cache_manager, args):
+    from cache_backends import JsonCacheBackend, SqliteCacheBackend
+
+    results = {}
+    for size in args.search_sizes:
+        per_category = 100
+        catalog = FakeCatalog(categories=max(1, size // per_category), series_per_category=per_category,
+                              seasons=1, episodes_per_season=1)
+        data = {'last_fetch_date': datetime.now().isoformat(), 'categories': [], 'series': {}}
+        for category_id, listing in catalog.series_by_category.items():
+            for record in listing:
+                series_id, entry = cache_manager._project_series(record, category_id)
+                data['series'][series_id] = entry
+
+        for backend in (JsonCacheBackend(f'search_{size}.json'), SqliteCacheBackend(f'search_{size}.db')):
+            with quiet():
+                save_seconds, _ = timed(backend.save, data)
+                if hasattr(backend, 'invalidate'):
+                    backend.invalidate()
+                first_seconds, _ = timed(backend.search, 'the', 0, SEARCH_LIMIT)
+            samples = []
+            matches = 0
+            for _ in range(args.repeat):
+                for query in SEARCH_QUERIES:
+                    seconds, (_, total, _) = timed(backend.search, query, 0, SEARCH_LIMIT)
+                    samples.append(seconds)
+                    matches += total
+            results[f'search.{backend.name}_{size}'] = dict(
+                percentiles(samples), save_s=round(save_seconds, 3), first_query_s=round(first_seconds, 3),
+                avg_matches=round(matches / len(samples), 1))
+    return results
+
+
+def bench_pages(app, cache_manager, server, args):
+    client = app.app.test_client()
+    category_id = server.catalog.categories[0]['category_id']
+    results = {}
+    with quiet():
+        if not cache_manager.get_cached_data():
+            cache_manager.process_and_cache_series_data(app.get_categories, app.iter_series_by_category)
+        for name, path in (('index', '/'), ('series', f'/series/{category_id}'),
+                           ('series_page_2', f'/series/{category_id}/page/2')):
+            app.api_cache.invalidate()
+            app.page_cache.invalidate()
+            cold_seconds, response = timed(client.get, path)
+            if response.status_code != 200:
+                raise RuntimeError(f"GET {path} returned {response.status_code}")
+            samples = [timed(client.get, path)[0] for _ in range(args.repeat * 5)]
+            # Repeat visit of a browser that kept the page: answered with 304 when the ETag still matches
+            etag = response.headers.get('ETag')
+            revalidations = [timed(client.get, path, headers={'If-None-Match': etag} if etag else {})[0]
+                             for _ in range(args.repeat * 5)]
+            results[f'pages.{name}'] = dict(percentiles(samples), cold_ms=round(cold_seconds * 1000, 3),
+                                            revalidate_p50_ms=percentiles(revalidations)['p50_ms'])
+    return results
+
+
+def bench_download(app, server, args):
+    from rate_limiter import parse_rate
+
+    server.episode_size = args.episode_mb * 1024 * 1024
+    episode = {'id': '990001', 'container_extension': 'mkv', 'title': 'Benchmark Episode'}
+    output_path = os.path.abspath('benchmark_episode.mkv')
+    results = {}
+
+    def run(name):
+        samples = []
+        for _ in range(args.download_runs):
+            if os.path.exists(output_path):
+                os.remove(output_path)
+            cpu_start = time.process_time()
+            with quiet():
+                seconds, ok = timed(app.download_episode_file, episode, output_path)
+            cpu = time.process_time() - cpu_start
+            if not ok or os.path.getsize(output_path) != server.episode_size:
+                raise RuntimeError("Benchmark download failed or was incomplete")
+            samples.append((seconds, cpu))
+        best, cpu = min(samples)
+        results[name] = {
+            'seconds': round(best, 3),
+            'mb_per_s': round(server.episode_size / best / 1024 / 1024, 1),
+            'mbit_per_s': round(server.episode_size * 8 / best / 1000 / 1000, 1),
+            # Includes the in-process fake server's share of the work
+            'cpu_percent': round(cpu / best * 100, 1),
+            'cpu_s_per_gb': round(cpu / (server.episode_size / 1024 ** 3), 2),
+        }
+
+    defaults = app.DOWNLOAD_SEGMENTS, app.DOWNLOAD_CHUNK_SIZE, app.DOWNLOAD_FSYNC_INTERVAL
+    try:
+        for segments in sorted({1, args.segments}):
+            app.DOWNLOAD_SEGMENTS = segments
+            run(f'download.segments_{segments}')
+        app.DOWNLOAD_SEGMENTS = 1
+        for chunk_size in args.chunk_sizes:
+            app.DOWNLOAD_CHUNK_SIZE = parse_rate(chunk_size)
+            run(f'download.chunk_{chunk_size}')
+        app.DOWNLOAD_CHUNK_SIZE = defaults[1]
+        if args.fsync:
+            app.DOWNLOAD_FSYNC_INTERVAL = 0 if args.fsync == 'end' else parse_rate(args.fsync)
+            run(f'download.fsync_{args.fsync}')
+    finally:
+        app.DOWNLOAD_SEGMENTS, app.DOWNLOAD_CHUNK_SIZE, app.DOWNLOAD_FSYNC_INTERVAL = defaults
+    return results
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_ROOT,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_results(results, baseline=None):
+    baseline_results = (baseline or {}).get('results', {})
+    for name in sorted(results):
+        print(name)
+        for metric, value in results[name].items():
+            line = f"    {metric:<16} {value:>12}"
+            old = baseline_results.get(name, {}).get(metric)
+            if isinstance(old, (int, float)) and isinstance(value, (int, float)) and old:
+                line += f"   baseline {old:>12}   {((value - old) / old) * 100:+.1f}%"
+            print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--only', default=','.join(SUITES), help=f"comma separated subset of {', '.join(SUITES)}")
+    parser.add_argument('--categories', type=int, default=100)
+    parser.add_argument('--series-per-category', type=int, default=100)
+    parser.add_argument('--latency', type=float, default=0.02, help='seconds added to each fake API request')
+    parser.add_argument('--bandwidth', type=int, default=0, help='bytes/s per fake episode stream (0 = unlimited)')
+    parser.add_argument('--search-sizes', default='10000,100000')
+    parser.add_argument('--episode-mb', type=int, default=256)
+    parser.add_argument('--segments', type=int, default=4, help='also benchmark segmented downloads with N ranges')
+    parser.add_argument('--download-runs', type=int, default=3)
+    parser.add_argument('--chunk-sizes', default='64K,1M',
+                        help='also benchmark single-stream downloads with these chunk sizes')
+    parser.add_argument('--fsync', help="also benchmark a DOWNLOAD_FSYNC policy ('end' or a size such as 64M)")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', help='write results as JSON to this file')
+    parser.add_argument('--compare', help='baseline JSON file written by an earlier --output')
+    args = parser.parse_args()
+    args.search_sizes = [int(size) for size in args.search_sizes.split(',') if size]
+    args.chunk_sizes = [size.strip() for size in args.chunk_sizes.split(',') if size.strip()]
+    suites = [suite.strip() for suite in args.only.split(',') if suite.strip()]
+    output = os.path.abspath(args.output) if args.output else None
+    baseline = None
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+
+    catalog = FakeCatalog(args.categories, args.series_per_category)
+    server = FakeXtreamServer(catalog, latency=args.latency, bandwidth=args.bandwidth).start()
+    workdir = tempfile.mkdtemp(prefix='iptv-bench-')
+    os.chdir(workdir)
+    os.environ.update({
+        'BASE_URL': server.base_url,
+        'USERNAME': 'bench',
+        'PASSWORD': 'bench',
+        'DOWNLOAD_JOBS_DB': os.path.join(workdir, 'download_jobs.db'),
+    })
+
+    import app
+    import cache_manager
+    logging.disable(logging.WARNING)
+
+    results = {}
+    try:
+        if 'crawl' in suites:
+            results.update(bench_crawl(app, cache_manager, server, args))
+        if 'search' in suites:
+            results.update(bench_search(cache_manager, args))
+        if 'pages' in suites:
+            results.update(bench_pages(app, cache_manager, server, args))
+        if 'download' in suites:
+            results.update(bench_download(app, server, args))
+    finally:
+        server.stop()
+
+    report = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(),
+            'git_revision': git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'catalog_series': len(catalog.series),
+            'latency_s': args.latency,
+            'workdir': workdir,
+        },
+        'results': results,
+    }
+    print_results(results, baseline)
+    if output:
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {output}")
+
+
+if __name__ == '__main__':
+    main()
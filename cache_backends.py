@@ -0,0 +1,609 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from search_index import (FIELD_WEIGHTS, SHORT_PREFIX_LENGTH, SHORT_PREFIX_MAX_EXPANSIONS, FuzzyVocabulary,
+                          SearchIndex, tokenize)
+
+
+class _JsonBulkWriter:
+    """Streams series entries into a temporary JSON file that atomically replaces the cache on commit.
+
+    A series id added twice keeps its first position and its last entry, exactly as assigning
+    into a dict would, because json.load keeps the last value of a duplicated key.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.tmp_path = f"{backend.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        self._file = open(self.tmp_path, 'w', encoding='utf-8')
+        self._file.write('{"series": {')
+        self._first = True
+
+    def add(self, series_id, series_data):
+        if not self._first:
+            self._file.write(',')
+        self._first = False
+        self._file.write(json.dumps(str(series_id)))
+        self._file.write(':')
+        self._file.write(json.dumps(series_data, ensure_ascii=False, separators=(',', ':')))
+
+    def commit(self, categories, last_fetch_date, index=None):
+        """Moves the file into place. index, when given, is the search index of the new file;
+        otherwise the index is rebuilt from it."""
+        try:
+            self._file.write('}, "categories": ')
+            self._file.write(json.dumps(categories, ensure_ascii=False, separators=(',', ':')))
+            self._file.write(', "last_fetch_date": ')
+            self._file.write(json.dumps(last_fetch_date))
+            self._file.write('}')
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        except BaseException:
+            self.abort()
+            raise
+        self._file.close()
+        os.replace(self.tmp_path, self.backend.path)
+        if index is None:
+            self.backend.refresh_index()
+        else:
+            self.backend._install_index(index)
+
+    def abort(self):
+        self._file.close()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+
+class JsonCacheBackend:
+    """Stores the catalog as a single JSON document and searches it through an in-memory SearchIndex."""
+
+    name = 'json'
+
+    def __init__(self, path):
+        self.path = path
+        self._index_lock = threading.Lock()  # guards the two fields below; held only to read or swap them
+        self._build_lock = threading.Lock()  # held by the one thread (re)building the index
+        self._index_signature = None
+        self._search_index = None
+
+    def load(self):
+        """Loads cached series data from the JSON file."""
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+            except json.JSONDecodeError:
+                print(f"Warning: Cache file {self.path} is empty or contains invalid JSON. Returning None.")
+                return None
+        return None
+
+    def bulk_writer(self):
+        """Returns a writer that streams a complete new catalog into place; see _JsonBulkWriter."""
+        return _JsonBulkWriter(self)
+
+    def save(self, data):
+        """Saves series data to the JSON file, atomically replacing the previous one."""
+        writer = self.bulk_writer()
+        try:
+            for series_id, series_data in data.get("series", {}).items():
+                writer.add(series_id, series_data)
+        except BaseException:
+            writer.abort()
+            raise
+        writer.commit(data.get("categories", []), data.get("last_fetch_date"))
+
+    def refresh_index(self):
+        """Rebuilds the search index from the file before swapping it in, so searches keep
+        being answered from the previous generation while a refresh is written."""
+        with self._build_lock:
+            self._rebuild_index()
+
+    def _rebuild_index(self):
+        # Called with _build_lock held. Loading and indexing happen outside _index_lock, so readers
+        # keep using the current index; a rebuild that already happened for this file is reused.
+        signature = self.signature()
+        with self._index_lock:
+            if self._search_index is not None and signature == self._index_signature:
+                return self._search_index
+        start = time.monotonic()
+        cached_data = self.load()
+        index = SearchIndex(cached_data) if cached_data else None
+        with self._index_lock:
+            self._search_index = index
+            self._index_signature = signature
+        if index is not None:
+            print(f"Built search index over {len(index)} series in {time.monotonic() - start:.2f}s")
+        return index
+
+    def _install_index(self, index):
+        signature = self.signature()
+        with self._index_lock:
+            self._search_index = index
+            self._index_signature = signature
+
+    def replace_category(self, category, series):
+        """Replaces the series of one category and its metadata; see SearchIndex.replace_category.
+
+        The search index is updated from the current one and the file is written from it, so the
+        catalog is neither reloaded nor indexed again. Returns False when there is no cache.
+        """
+        with self._build_lock:
+            index = self._rebuild_index()
+            if index is None:
+                return False
+            index = index.replace_category(category, series)
+            writer = self.bulk_writer()
+            try:
+                for series_id, series_data in index.series_items():
+                    writer.add(series_id, series_data)
+            except BaseException:
+                writer.abort()
+                raise
+            writer.commit(index.category_list(), index.last_fetch_date, index=index)
+        return True
+
+    def apply_delta(self, changed, removed, categories, last_fetch_date):
+        """Upserts changed series, drops removed series ids and replaces the category metadata."""
+        data = self.load() or {"series": {}}
+        series = data.setdefault("series", {})
+        series.update(changed)
+        for series_id in removed:
+            series.pop(series_id, None)
+        data["categories"] = categories
+        data["last_fetch_date"] = last_fetch_date
+        self.save(data)
+
+    def signature(self):
+        """Returns a value that changes whenever the cached catalog changes, or None without a cache."""
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def invalidate(self):
+        """Drops the in-memory search index so the next lookup rebuilds it."""
+        with self._index_lock:
+            self._index_signature = None
+            self._search_index = None
+
+    def get_index(self):
+        """Returns the search index for the current cache file, rebuilding it when the file has changed.
+
+        When an index already exists, it keeps being returned while a background thread rebuilds it.
+        """
+        signature = self.signature()
+        if signature is None:
+            return None
+        with self._index_lock:
+            index, index_signature = self._search_index, self._index_signature
+        if index is not None and signature == index_signature:
+            return index
+        if index is not None:
+            if self._build_lock.acquire(blocking=False):
+                threading.Thread(target=self._rebuild_index_in_background, name='search-index', daemon=True).start()
+            return index
+        with self._build_lock:
+            return self._rebuild_index()
+
+    def _rebuild_index_in_background(self):
+        # Runs with _build_lock acquired by get_index on its behalf
+        try:
+            self._rebuild_index()
+        except Exception as e:
+            print(f"Error rebuilding search index: {e}")
+        finally:
+            self._build_lock.release()
+
+    def search(self, query, offset=0, limit=None):
+        """Returns (results, total, last_fetch_date) for query, best matches first."""
+        index = self.get_index()
+        if not index:
+            return [], 0, None
+        results, total = index.search(query, offset, limit)
+        return results, total, index.last_fetch_date
+
+    def last_fetch_date(self):
+        index = self.get_index()
+        return index.last_fetch_date if index else None
+
+    def category_counts(self):
+        index = self.get_index()
+        return dict(index.category_counts) if index else {}
+
+    def category_page(self, category_id, sort='default', offset=0, limit=20):
+        """Returns (entries, total, category) for a page of a category, or None when it is not cached."""
+        index = self.get_index()
+        if not index or category_id not in index.categories:
+            return None
+        entries, total = index.category_page(category_id, sort, offset, limit)
+        return entries, total, dict(index.categories[category_id])
+
+
+class SqliteCacheBackend:
+    """Stores the catalog in SQLite with an FTS5 table over names, actors and plots.
+
+    Refreshes are written in a single transaction, counts use an index on category_ID and
+    searches never load the whole catalog into memory. When the database is empty and a JSON
+    cache from JsonCacheBackend exists, it is imported on first use.
+    """
+
+    name = 'sqlite'
+
+    # Optional per-series fields, stored as nullable columns and omitted from entries when NULL.
+    # Columns missing from databases created by older versions are added on startup.
+    EXTRA_COLUMNS = ('last_modified', 'cover', 'rating')
+
+    # ORDER BY clauses matching search_index.CATEGORY_SORTS.
+    CATEGORY_ORDERS = {
+        'default': 'id',
+        'name': 'series_name COLLATE NOCASE, id',
+        'added': "CAST(COALESCE(last_modified, 0) AS INTEGER) DESC, id",
+        'rating': "CAST(COALESCE(rating, 0) AS REAL) DESC, id",
+    }
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        );
+        CREATE TABLE IF NOT EXISTS series (
+            id INTEGER PRIMARY KEY,
+            series_id TEXT NOT NULL UNIQUE,
+            series_name TEXT NOT NULL,
+            category_ID TEXT,
+            actors TEXT NOT NULL,
+            plot TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_series_category ON series (category_ID);
+        CREATE VIRTUAL TABLE IF NOT EXISTS series_fts USING fts5 (
+            series_name, actors, plot,
+            content='series', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 0'
+        );
+        CREATE VIRTUAL TABLE IF NOT EXISTS series_vocab USING fts5vocab (series_fts, 'row');
+    """
+
+    def __init__(self, path, json_path=None):
+        self.path = path
+        self.json_path = json_path
+        self._init_lock = threading.Lock()
+        self._initialized = False
+        self._fuzzy = (None, None)  # (generation, FuzzyVocabulary over the FTS terms)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _ensure_schema(self):
+        if self._initialized:
+            return
+        with self._init_lock:
+            if self._initialized:
+                return
+            conn = self._connect()
+            try:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.executescript(self.SCHEMA)
+                existing = {row["name"] for row in conn.execute("PRAGMA table_info(series)")}
+                for column in self.EXTRA_COLUMNS:
+                    if column not in existing:
+                        conn.execute(f"ALTER TABLE series ADD COLUMN {column} TEXT")
+                conn.commit()
+            finally:
+                conn.close()
+            self._initialized = True
+            self._migrate_from_json()
+
+    def _migrate_from_json(self):
+        """Imports an existing JSON cache into an empty database."""
+        if not self.json_path or not os.path.exists(self.json_path) or self.signature() is not None:
+            return
+        data = JsonCacheBackend(self.json_path).load()
+        if data:
+            print(f"Migrating cache from {self.json_path} to {self.path}...")
+            self.save(data)
+            print(f"Migrated {len(data.get('series', {}))} series to SQLite.")
+
+    def _get_meta(self, conn, key):
+        row = conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    @classmethod
+    def _row_to_series(cls, row):
+        series_data = {
+            "series_name": row["series_name"],
+            "category_ID": row["category_ID"],
+            "actors": json.loads(row["actors"]),
+            "plot": row["plot"]
+        }
+        for column in cls.EXTRA_COLUMNS:
+            if row[column] is not None:
+                series_data[column] = row[column]
+        return series_data
+
+    @classmethod
+    def _series_row(cls, series_id, series_data):
+        return (str(series_id), series_data.get("series_name", ""), series_data.get("category_ID"),
+                json.dumps(series_data.get("actors", []), ensure_ascii=False), series_data.get("plot", "")) + \
+            tuple(series_data.get(column) for column in cls.EXTRA_COLUMNS)
+
+    @classmethod
+    def _insert_sql(cls, with_rowid=False):
+        columns = ("series_id", "series_name", "category_ID", "actors", "plot") + cls.EXTRA_COLUMNS
+        if with_rowid:
+            columns = ("id",) + columns
+        return f"INSERT INTO series ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+
+    def _write_meta(self, conn, categories, last_fetch_date):
+        generation = int(self._get_meta(conn, "generation") or 0) + 1
+        conn.executemany(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+            [("last_fetch_date", last_fetch_date),
+             ("categories", json.dumps(categories, ensure_ascii=False)),
+             ("generation", str(generation))])
+
+    def load(self):
+        """Reassembles the full cached_data dict from the database."""
+        self._ensure_schema()
+        conn = self._connect()
+        try:
+            last_fetch_date = self._get_meta(conn, "last_fetch_date")
+            if last_fetch_date is None:
+                return None
+            categories = json.loads(self._get_meta(conn, "categories") or "[]")
+            series = {row["series_id"]: self._row_to_series(row)
+                      for row in conn.execute("SELECT * FROM series ORDER BY id")}
+        finally:
+            conn.close()
+        return {"last_fetch_date": last_fetch_date, "categories": categories, "series": series}
+
+    def bulk_writer(self):
+        """Returns a writer that replaces the catalog in one transaction; see _SqliteBulkWriter."""
+        self._ensure_schema()
+        return _SqliteBulkWriter(self)
+
+    def save(self, data):
+        """Replaces the stored catalog with data in one transaction."""
+        writer = self.bulk_writer()
+        try:
+            for series_id, series_data in data.get("series", {}).items():
+                writer.add(series_id, series_data)
+        except BaseException:
+            writer.abort()
+            raise
+        writer.commit(data.get("categories", []), data.get("last_fetch_date"))
+
+    def _delete_fts(self, conn, row):
+        conn.execute("INSERT INTO series_fts (series_fts, rowid, series_name, actors, plot) "
+                     "VALUES ('delete', ?, ?, ?, ?)", (row["id"], row["series_name"], row["actors"], row["plot"]))
+
+    def apply_delta(self, changed, removed, categories, last_fetch_date):
+        """Upserts changed series and deletes removed ones in one transaction, updating FTS in place."""
+        self._ensure_schema()
+        conn = self._connect()
+        try:
+            with conn:
+                self._apply_delta(conn, changed, removed)
+                self._write_meta(conn, categories, last_fetch_date)
+        finally:
+            conn.close()
+
+    def replace_category(self, category, series):
+        """Replaces the series of one category and its metadata in one transaction.
+
+        Returns False when there is no cache.
+        """
+        self._ensure_schema()
+        category_id = category.get("category_id")
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                last_fetch_date = self._get_meta(conn, "last_fetch_date")
+                if last_fetch_date is None:
+                    return False
+                current = {row["series_id"]: self._row_to_series(row)
+                           for row in conn.execute("SELECT * FROM series WHERE category_ID = ?", (category_id,))}
+                series = {str(series_id): series_data for series_id, series_data in series.items()}
+                changed = {series_id: series_data for series_id, series_data in series.items()
+                           if current.get(series_id) != series_data}
+                removed = [series_id for series_id in current if series_id not in series]
+                self._apply_delta(conn, changed, removed)
+                categories = [dict(category) if cached.get("category_id") == category_id else cached
+                              for cached in json.loads(self._get_meta(conn, "categories") or "[]")]
+                self._write_meta(conn, categories, last_fetch_date)
+            return True
+        finally:
+            conn.close()
+
+    def _apply_delta(self, conn, changed, removed):
+        for series_id in removed:
+            row = conn.execute("SELECT * FROM series WHERE series_id = ?", (str(series_id),)).fetchone()
+            if row is not None:
+                self._delete_fts(conn, row)
+                conn.execute("DELETE FROM series WHERE id = ?", (row["id"],))
+        for series_id, series_data in changed.items():
+            row = conn.execute("SELECT * FROM series WHERE series_id = ?", (str(series_id),)).fetchone()
+            if row is not None:
+                self._delete_fts(conn, row)
+                conn.execute("DELETE FROM series WHERE id = ?", (row["id"],))
+                # Reuse the rowid so the series keeps its position in catalog order.
+                conn.execute(self._insert_sql(with_rowid=True),
+                             (row["id"],) + self._series_row(series_id, series_data))
+                rowid = row["id"]
+            else:
+                rowid = conn.execute(self._insert_sql(), self._series_row(series_id, series_data)).lastrowid
+            new_row = conn.execute("SELECT * FROM series WHERE id = ?", (rowid,)).fetchone()
+            conn.execute("INSERT INTO series_fts (rowid, series_name, actors, plot) VALUES (?, ?, ?, ?)",
+                         (rowid, new_row["series_name"], new_row["actors"], new_row["plot"]))
+
+    def signature(self):
+        """Returns the catalog generation counter, or None without a cache."""
+        if not os.path.exists(self.path):
+            return None
+        conn = self._connect()
+        try:
+            return self._get_meta(conn, "generation")
+        except sqlite3.OperationalError:
+            return None
+        finally:
+            conn.close()
+
+    def _fuzzy_vocabulary(self, conn):
+        generation = self._get_meta(conn, "generation")
+        cached_generation, vocabulary = self._fuzzy
+        if vocabulary is None or cached_generation != generation:
+            vocabulary = FuzzyVocabulary(row[0] for row in conn.execute("SELECT term FROM series_vocab"))
+            self._fuzzy = (generation, vocabulary)
+        return vocabulary
+
+    @staticmethod
+    def _short_prefix_terms(conn, token):
+        """Returns the terms a token shorter than SHORT_PREFIX_LENGTH matches, like SearchIndex does.
+
+        That is the token itself and its SHORT_PREFIX_MAX_EXPANSIONS most common completions, or None
+        when it has no more completions than that and a prefix query matches the same terms.
+        """
+        upper = token[:-1] + chr(ord(token[-1]) + 1)
+        completions = [row[0] for row in conn.execute(
+            "SELECT term FROM series_vocab WHERE term > ? AND term < ? ORDER BY doc DESC, term LIMIT ?",
+            (token, upper, SHORT_PREFIX_MAX_EXPANSIONS + 1))]
+        if len(completions) <= SHORT_PREFIX_MAX_EXPANSIONS:
+            return None
+        return [token] + completions[:SHORT_PREFIX_MAX_EXPANSIONS]
+
+    def _match_expression(self, conn, tokens):
+        """Builds an FTS5 query requiring every token as a prefix or, for unknown terms, a close spelling."""
+        clauses = []
+        for token in tokens:
+            # A one- or two-letter prefix query would expand to a large share of the vocabulary
+            terms = self._short_prefix_terms(conn, token) if len(token) < SHORT_PREFIX_LENGTH else None
+            if terms is not None:
+                clauses.append('(' + ' OR '.join('"{}"'.format(term.replace('"', '""')) for term in terms) + ')')
+                continue
+            alternatives = ['"{}"*'.format(token.replace('"', '""'))]
+            if conn.execute("SELECT 1 FROM series_vocab WHERE term = ?", (token,)).fetchone() is None:
+                alternatives.extend('"{}"'.format(term.replace('"', '""'))
+                                    for term, _ in self._fuzzy_vocabulary(conn).expand(token))
+            clauses.append('(' + ' OR '.join(alternatives) + ')')
+        return ' AND '.join(clauses)
+
+    def search(self, query, offset=0, limit=None):
+        """Returns (results, total, last_fetch_date) for query, ranked by FTS5 bm25 with field weights."""
+        self._ensure_schema()
+        tokens = list(dict.fromkeys(tokenize(query)))
+        conn = self._connect()
+        try:
+            last_fetch_date = self._get_meta(conn, "last_fetch_date")
+            if not tokens or last_fetch_date is None:
+                return [], 0, last_fetch_date
+            match = self._match_expression(conn, tokens)
+            total = conn.execute("SELECT COUNT(*) FROM series_fts WHERE series_fts MATCH ?", (match,)).fetchone()[0]
+            rows = conn.execute(
+                "SELECT s.* FROM series_fts JOIN series s ON s.id = series_fts.rowid "
+                "WHERE series_fts MATCH ? ORDER BY bm25(series_fts, ?, ?, ?), s.id LIMIT ? OFFSET ?",
+                (match,) + FIELD_WEIGHTS + (-1 if limit is None else limit, offset))
+            results = []
+            for row in rows:
+                series_data = self._row_to_series(row)
+                series_data['series_id'] = row["series_id"]
+                results.append(series_data)
+            return results, total, last_fetch_date
+        finally:
+            conn.close()
+
+    def last_fetch_date(self):
+        self._ensure_schema()
+        conn = self._connect()
+        try:
+            return self._get_meta(conn, "last_fetch_date")
+        finally:
+            conn.close()
+
+    def category_counts(self):
+        self._ensure_schema()
+        conn = self._connect()
+        try:
+            return {row[0]: row[1] for row in conn.execute(
+                "SELECT category_ID, COUNT(*) FROM series WHERE category_ID IS NOT NULL AND category_ID != '' GROUP BY category_ID")}
+        finally:
+            conn.close()
+
+    def category_page(self, category_id, sort='default', offset=0, limit=20):
+        """Returns (entries, total, category) for a page of a category, or None when it is not cached."""
+        self._ensure_schema()
+        conn = self._connect()
+        try:
+            categories = json.loads(self._get_meta(conn, "categories") or "[]")
+            category = next((c for c in categories if c.get("category_id") == category_id), None)
+            if category is None:
+                return None
+            total = conn.execute("SELECT COUNT(*) FROM series WHERE category_ID = ?", (category_id,)).fetchone()[0]
+            rows = conn.execute(f"SELECT * FROM series WHERE category_ID = ? ORDER BY {self.CATEGORY_ORDERS[sort]} "
+                                "LIMIT ? OFFSET ?", (category_id, limit, offset))
+            entries = []
+            for row in rows:
+                series_data = self._row_to_series(row)
+                series_data['series_id'] = row["series_id"]
+                entries.append(series_data)
+            return entries, total, category
+        finally:
+            conn.close()
+
+
+class _SqliteBulkWriter:
+    """Streams series entries into an open transaction that replaces the catalog on commit.
+
+    Readers keep seeing the previous catalog (WAL snapshot) until the commit. A series id added
+    twice keeps its first position and its last entry.
+    """
+
+    BATCH_SIZE = 500
+
+    def __init__(self, backend):
+        self.backend = backend
+        self._conn = backend._connect()
+        self._conn.execute("BEGIN IMMEDIATE")
+        self._conn.execute("DELETE FROM series")
+        columns = ("series_id", "series_name", "category_ID", "actors", "plot") + backend.EXTRA_COLUMNS
+        self._upsert_sql = backend._insert_sql() + " ON CONFLICT(series_id) DO UPDATE SET " + \
+            ', '.join(f"{column} = excluded.{column}" for column in columns[1:])
+        self._pending = []
+
+    def add(self, series_id, series_data):
+        self._pending.append(self.backend._series_row(series_id, series_data))
+        if len(self._pending) >= self.BATCH_SIZE:
+            self._flush()
+
+    def _flush(self):
+        self._conn.executemany(self._upsert_sql, self._pending)
+        self._pending = []
+
+    def commit(self, categories, last_fetch_date):
+        try:
+            self._flush()
+            self._conn.execute("INSERT INTO series_fts (series_fts) VALUES ('rebuild')")
+            self.backend._write_meta(self._conn, categories, last_fetch_date)
+            self._conn.commit()
+        except BaseException:
+            self.abort()
+            raise
+        self._conn.close()
+
+    def abort(self):
+        self._conn.rollback()
+        self._conn.close()
+
+
+def create_backend(name, json_path, sqlite_path):
+    """Returns the cache backend registered under name ('json' or 'sqlite')."""
+    if name == 'sqlite':
+        return SqliteCacheBackend(sqlite_path, json_path=json_path)
+    if name == 'json':
+        return JsonCacheBackend(json_path)
+    raise ValueError(f"Unknown cache backend: {name}")
@@ -1,38 +1,109 @@
-import json
+import asyncio
 import os
 import time
 from datetime import datetime
 
+import aiohttp
+
+from cache_backends import create_backend
+from search_index import sort_category_entries
+
 # Assuming these functions are available from app.py or a shared utility
 # For now, we'll assume they are passed in or imported from a common source.
 # In the final implementation, we'll ensure proper import paths.
 
 CACHE_FILE = 'cached_series_data.json'
+CACHE_DB_FILE = os.getenv('CACHE_DB_FILE', 'cached_series_data.db')
+
+# Storage backend for the series cache: 'json' (single document + in-memory index) or
+# 'sqlite' (SQLite with FTS5). Switching to 'sqlite' imports an existing JSON cache.
+CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'json')
+
+_backend = create_backend(CACHE_BACKEND, CACHE_FILE, CACHE_DB_FILE)
+
+def get_backend():
+    """Returns the active cache storage backend."""
+    return _backend
 
 def get_cached_data():
-    """Loads cached series data from a JSON file."""
-    if os.path.exists(CACHE_FILE):
-        try:
-            with open(CACHE_FILE, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except json.JSONDecodeError:
-            print(f"Warning: Cache file {CACHE_FILE} is empty or contains invalid JSON. Returning None.")
-            return None
-    return None
+    """Loads cached series data from the storage backend."""
+    return _backend.load()
 
 def save_cached_data(data):
-    """Saves series data to a JSON file."""
-    with open(CACHE_FILE, 'w', encoding='utf-8') as f:
-        json.dump(data, f, indent=4, ensure_ascii=False)
+    """Saves series data to the storage backend."""
+    _backend.save(data)
+
+def get_last_fetch_date():
+    """Returns the last_fetch_date of the cached data, or None when there is no cache."""
+    return _backend.last_fetch_date()
+
+def get_catalog_generation():
+    """Returns a value that changes whenever the cached catalog changes, or None when there is no cache."""
+    return _backend.signature()
+
+def _project_series(series, category_id):
+    """Projects an upstream series record onto the fields kept in the cache. Returns (series_id, entry)."""
+    series_id = series.get("series_id") if isinstance(series, dict) else None
+    series_name = series.get("name") if series_id else None
+    if not series_id or not series_name:
+        return None
+    actors = series.get("cast")
+    plot = series.get("plot")
+    entry = {
+        "series_name": series_name,
+        "category_ID": category_id,
+        "actors": actors.split(', ') if actors else [],
+        "plot": plot if plot else ""
+    }
+    # Optional fields used for browsing and sorting categories from the cache.
+    for field in ("last_modified", "cover", "rating"):
+        if series.get(field):
+            entry[field] = str(series[field])
+    return str(series_id), entry
+
+def _collect_category_series(category_id, category_name, series_iter):
+    """Projects a category's (possibly streamed) series records as they arrive.
+
+    Returns (entries, failed) where entries is a list of (series_id, entry). A listing that fails
+    part-way is dropped entirely, as if the request had failed.
+    """
+    entries = []
+    failed = 0
+    try:
+        for series in series_iter or []:
+            projected = _project_series(series, category_id)
+            if projected:
+                entries.append(projected)
+            else:
+                failed += 1
+                print(f"  Skipping series due to missing ID or name: {series}")
+    except Exception as e:
+        print(f"  Error fetching category {category_name} (ID: {category_id}): {str(e)}")
+        return [], failed
+    return entries, failed
+
+def _write_category_series(add_func, category_name, entries):
+    for series_id, entry in entries:
+        add_func(series_id, entry)
+    if entries:
+        print(f"  Cached {len(entries)} series for category: {category_name}")
+    else:
+        print(f"  No series found for category: {category_name}")
+
+def _category_entry(category_id, category_name, last_fetched):
+    """Category metadata kept in the cache, including when its series listing was last fetched."""
+    return {"category_id": category_id, "category_name": category_name, "last_fetched": last_fetched}
 
 def process_and_cache_series_data(get_categories_func, get_series_by_category_func, progress_callback=None):
-    """Fetches, processes, and caches series data."""
+    """Fetches, processes, and caches series data.
+
+    get_series_by_category_func may return a list or a lazy iterator streaming records from
+    upstream. Records are projected as they arrive and written straight to the storage backend,
+    which swaps in the new catalog atomically, so peak memory is bounded by one category.
+    """
     print("Starting series data caching process...")
-    cached_data = {
-        "last_fetch_date": datetime.now().isoformat(),
-        "categories": [],
-        "series": {}
-    }
+    last_fetch_date = datetime.now().isoformat()
+    cached_categories = []
 
     categories = get_categories_func()
     if not categories:
@@ -45,83 +116,311 @@ def process_and_cache_series_data(get_categories_func, get_series_by_category_fu
     total_series_processed = 0
     failed_series_count = 0
 
-    for i, category in enumerate(categories):
-        category_id = category.get("category_id")
-        category_name = category.get("category_name")
-        
+    writer = get_backend().bulk_writer()
+    try:
+        for i, category in enumerate(categories):
+            category_id = category.get("category_id")
+            category_name = category.get("category_name")
+            
+            if progress_callback:
+                progress = int(((i + 1) / total_categories) * 100)
+                progress_callback(progress, f"Processing category: {category_name}", "in_progress")
+
+            if category_id and category_name:
+                print(f"Processing category: {category_name} (ID: {category_id})")
+                try:
+                    series_iter = get_series_by_category_func(category_id)
+                except Exception as e:
+                    print(f"  Error fetching category {category_name} (ID: {category_id}): {str(e)}")
+                    series_iter = []
+                entries, failed = _collect_category_series(category_id, category_name, series_iter)
+                cached_categories.append(_category_entry(category_id, category_name, datetime.now().isoformat()))
+                _write_category_series(writer.add, category_name, entries)
+                total_series_processed += len(entries)
+                failed_series_count += failed
+            else:
+                failed_series_count += 1 # Consider if this should count as a failed series or category
+                print(f"Skipping category due to missing ID or name: {category}")
+    except BaseException:
+        writer.abort()
+        raise
+
+    writer.commit(cached_categories, last_fetch_date)
+    print(f"Caching process completed. Total series processed: {total_series_processed}, Failed series: {failed_series_count}.")
+    if progress_callback:
+        progress_callback(100, "Caching process completed.", "complete")
+    return True
+
+async def _fetch_category_async(http_session, get_series_by_category_async_func, category_id, category_name):
+    """Fetches and projects one category. The fetch function may return a list or an async iterator."""
+    result = get_series_by_category_async_func(http_session, category_id)
+    entries = []
+    failed = 0
+    if hasattr(result, '__aiter__'):
+        async for series in result:
+            projected = _project_series(series, category_id)
+            if projected:
+                entries.append(projected)
+            else:
+                failed += 1
+        return entries, failed
+    return _collect_category_series(category_id, category_name, await result)
+
+async def _fetch_categories_concurrently(categories, get_series_by_category_async_func, progress_callback,
+                                        max_in_flight, request_timeout, on_category):
+    """Fetches the series listing of every category with at most max_in_flight requests outstanding.
+
+    Progress is reported in completion order, while on_category(category_id, category_name, entries,
+    failed) is called in category order. Categories are started in a sliding window of
+    2 * max_in_flight past the oldest one not yet handed on, which bounds the listings held in memory.
+    """
+    semaphore = asyncio.Semaphore(max_in_flight)
+    # A read timeout rather than a total one, so a large listing that keeps arriving is not cut off
+    timeout = aiohttp.ClientTimeout(total=None, sock_connect=request_timeout, sock_read=request_timeout)
+    connector = aiohttp.TCPConnector(limit=max_in_flight)
+    total_categories = len(categories)
+    window = 2 * max_in_flight
+
+    async with aiohttp.ClientSession(timeout=timeout, connector=connector) as http_session:
+        async def fetch(index):
+            category_id, category_name = categories[index]
+            async with semaphore:
+                try:
+                    entries, failed = await _fetch_category_async(
+                        http_session, get_series_by_category_async_func, category_id, category_name)
+                except asyncio.TimeoutError:
+                    print(f"  Timed out fetching category: {category_name} (ID: {category_id})")
+                    entries, failed = [], 0
+                except Exception as e:
+                    print(f"  Error fetching category {category_name} (ID: {category_id}): {str(e)}")
+                    entries, failed = [], 0
+            return entries, failed
+
+        pending = {}
+        finished = {}
+        next_to_start = 0
+        next_to_emit = 0
+        completed = 0
+        while next_to_emit < total_categories:
+            while next_to_start < total_categories and next_to_start < next_to_emit + window:
+                pending[asyncio.ensure_future(fetch(next_to_start))] = next_to_start
+                next_to_start += 1
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                index = pending.pop(task)
+                finished[index] = task.result()
+                completed += 1
+                if progress_callback:
+                    progress = int((completed / total_categories) * 100)
+                    progress_callback(progress, f"Processed category: {categories[index][1]}", "in_progress")
+            while next_to_emit in finished:
+                entries, failed = finished.pop(next_to_emit)
+                category_id, category_name = categories[next_to_emit]
+                on_category(category_id, category_name, entries, failed)
+                next_to_emit += 1
+
+def process_and_cache_series_data_concurrent(get_categories_func, get_series_by_category_async_func,
+                                             progress_callback=None, max_in_flight=8, request_timeout=30):
+    """Fetches, processes, and caches series data, crawling categories concurrently.
+
+    get_series_by_category_async_func is called as (aiohttp_session, category_id) and must return the
+    upstream series list, or an async iterator streaming its records. Categories are written in order,
+    so the resulting cache is identical to process_and_cache_series_data.
+    """
+    print(f"Starting concurrent series data caching process (max in flight: {max_in_flight})...")
+    last_fetch_date = datetime.now().isoformat()
+    cached_categories = []
+
+    categories = get_categories_func()
+    if not categories:
+        print("No categories found to cache.")
         if progress_callback:
-            progress = int(((i + 1) / total_categories) * 100)
-            progress_callback(progress, f"Processing category: {category_name}", "in_progress")
+            progress_callback(100, "No categories found.", "error")
+        return False
 
+    valid_categories = []
+    failed_series_count = 0
+    for category in categories:
+        category_id = category.get("category_id")
+        category_name = category.get("category_name")
         if category_id and category_name:
-            print(f"Processing category: {category_name} (ID: {category_id})")
-            series_list = get_series_by_category_func(category_id)
-            if series_list:
-                for series in series_list:
-                    series_id = series.get("series_id")
-                    series_name = series.get("name")
-                    actors = series.get("cast")
-                    plot = series.get("plot")
-                    
-                    if series_id and series_name:
-                        cached_data["series"][str(series_id)] = {
-                            "series_name": series_name,
-                            "category_ID": category_id,
-                            "actors": actors.split(', ') if actors else [],
-                            "plot": plot if plot else ""
-                        }
-                        total_series_processed += 1
-                        print(f"  Cached series: {series_name} (Total processed: {total_series_processed})")
-                    else:
-                        failed_series_count += 1
-                        print(f"  Skipping series due to missing ID or name: {series} (Failed: {failed_series_count})")
-            else:
-                print(f"  No series found for category: {category_name}")
+            valid_categories.append((category_id, category_name))
         else:
-            failed_series_count += 1 # Consider if this should count as a failed series or category
+            failed_series_count += 1
             print(f"Skipping category due to missing ID or name: {category}")
 
-    save_cached_data(cached_data)
-    print(f"Caching process completed. Total series processed: {total_series_processed}, Failed series: {failed_series_count}.")
+    totals = {"processed": 0, "failed": failed_series_count}
+    writer = get_backend().bulk_writer()
+
+    def on_category(category_id, category_name, entries, failed):
+        cached_categories.append(_category_entry(category_id, category_name, datetime.now().isoformat()))
+        _write_category_series(writer.add, category_name, entries)
+        totals["processed"] += len(entries)
+        totals["failed"] += failed
+
+    start = time.monotonic()
+    try:
+        asyncio.run(_fetch_categories_concurrently(
+            valid_categories, get_series_by_category_async_func, progress_callback,
+            max(1, max_in_flight), request_timeout, on_category))
+    except BaseException:
+        writer.abort()
+        raise
+    print(f"Fetched {len(valid_categories)} categories in {time.monotonic() - start:.1f}s")
+
+    writer.commit(cached_categories, last_fetch_date)
+    print(f"Caching process completed. Total series processed: {totals['processed']}, Failed series: {totals['failed']}.")
     if progress_callback:
         progress_callback(100, "Caching process completed.", "complete")
     return True
 
-def search_series(query):
-    """Searches cached series data for matching series names, actors, or plot."""
-    cached_data = get_cached_data()
-    if not cached_data:
-        return [], None
-
-    results = []
-    query_lower = query.lower()
-    last_fetch_date = cached_data.get("last_fetch_date")
-
-    for series_id, series_data in cached_data.get("series", {}).items():
-        series_name_lower = series_data.get('series_name', '').lower()
-        actors_lower = ' '.join(series_data.get('actors', [])).lower()
-        plot_lower = series_data.get('plot', '').lower()
-
-        if query_lower in series_name_lower or \
-           query_lower in actors_lower or \
-           query_lower in plot_lower:
-            # Add series_id to the dictionary before appending to results
-            series_data['series_id'] = series_id
-            results.append(series_data)
-            
-    return results, last_fetch_date
+def refresh_series_data_incremental(get_categories_func, get_series_by_category_func=None, progress_callback=None,
+                                    stale_after=None, get_series_by_category_async_func=None,
+                                    max_in_flight=8, request_timeout=30):
+    """Refreshes the cache in place, writing only added, changed and removed series.
+
+    Only categories that are new upstream or whose listing is older than stale_after seconds are
+    fetched (all of them when stale_after is None); categories gone upstream lose their series.
+    Series entries, including the upstream last_modified stamp, are compared against the cache
+    to find changes. Categories are fetched concurrently when get_series_by_category_async_func
+    is given. Falls back to a full crawl when there is no cache yet.
+    """
+    existing = get_cached_data()
+    if not existing:
+        print("No existing cache, running a full caching process instead.")
+        if get_series_by_category_async_func:
+            return process_and_cache_series_data_concurrent(get_categories_func, get_series_by_category_async_func,
+                                                            progress_callback, max_in_flight, request_timeout)
+        return process_and_cache_series_data(get_categories_func, get_series_by_category_func, progress_callback)
+
+    print("Starting incremental series data refresh...")
+    categories = get_categories_func()
+    if not categories:
+        print("No categories found to refresh.")
+        if progress_callback:
+            progress_callback(100, "No categories found.", "error")
+        return False
+
+    now = datetime.now()
+    known_categories = {category["category_id"]: category for category in existing.get("categories", [])}
+    upstream_categories = [(category.get("category_id"), category.get("category_name")) for category in categories
+                           if category.get("category_id") and category.get("category_name")]
+
+    def is_stale(category_id):
+        if stale_after is None or category_id not in known_categories:
+            return True
+        last_fetched = known_categories[category_id].get("last_fetched")
+        if not last_fetched:
+            return True
+        return (now - datetime.fromisoformat(last_fetched)).total_seconds() >= stale_after
+
+    to_refresh = [(category_id, category_name) for category_id, category_name in upstream_categories
+                  if is_stale(category_id)]
+    print(f"Refreshing {len(to_refresh)} of {len(upstream_categories)} categories")
+
+    existing_series = existing.get("series", {})
+    category_counts = {}
+    for series_data in existing_series.values():
+        category_counts[series_data.get("category_ID")] = category_counts.get(series_data.get("category_ID"), 0) + 1
+
+    fetched = {}
+    refreshed = set()
+
+    def on_category(category_id, category_name, entries, failed):
+        if not entries and category_counts.get(category_id):
+            # An empty listing for a category that had series is more likely a failed request
+            # than an emptied category: keep the cached series and retry on the next refresh.
+            print(f"  Keeping cached series for category {category_name}: empty or failed listing")
+            return
+        _write_category_series(fetched.__setitem__, category_name, entries)
+        refreshed.add(category_id)
+
+    if get_series_by_category_async_func:
+        asyncio.run(_fetch_categories_concurrently(
+            to_refresh, get_series_by_category_async_func, progress_callback,
+            max(1, max_in_flight), request_timeout, on_category))
+    else:
+        for i, (category_id, category_name) in enumerate(to_refresh):
+            if progress_callback:
+                progress = int(((i + 1) / len(to_refresh)) * 100)
+                progress_callback(progress, f"Processing category: {category_name}", "in_progress")
+            try:
+                series_iter = get_series_by_category_func(category_id)
+            except Exception as e:
+                print(f"  Error fetching category {category_name} (ID: {category_id}): {str(e)}")
+                series_iter = []
+            on_category(category_id, category_name, *_collect_category_series(category_id, category_name, series_iter))
+
+    fetched_at = now.isoformat()
+    upstream_ids = {category_id for category_id, _ in upstream_categories}
+    changed = {series_id: series_data for series_id, series_data in fetched.items()
+               if existing_series.get(series_id) != series_data}
+    removed = [series_id for series_id, series_data in existing_series.items()
+               if series_id not in fetched and
+               (series_data.get("category_ID") in refreshed or series_data.get("category_ID") not in upstream_ids)]
+    updated_categories = [
+        _category_entry(category_id, category_name,
+                        fetched_at if category_id in refreshed
+                        else known_categories.get(category_id, {}).get("last_fetched"))
+        for category_id, category_name in upstream_categories
+    ]
+
+    get_backend().apply_delta(changed, removed, updated_categories, fetched_at)
+    added = sum(1 for series_id in changed if series_id not in existing_series)
+    message = (f"Refresh completed: {added} added, {len(changed) - added} changed, {len(removed)} removed "
+               f"({len(refreshed)} categories refreshed).")
+    print(message)
+    if progress_callback:
+        progress_callback(100, message, "complete")
+    return True
+
+def refresh_category(category_id, category_name, get_series_by_category_func):
+    """Refetches one category's listing and replaces only that category's series in the cache.
+
+    Returns False when the listing failed or came back empty for a category that has series,
+    in which case the cached series are kept, or when there is no cache yet.
+    """
+    try:
+        series_iter = get_series_by_category_func(category_id)
+    except Exception as e:
+        print(f"  Error fetching category {category_name} (ID: {category_id}): {str(e)}")
+        series_iter = []
+    entries, _ = _collect_category_series(category_id, category_name, series_iter)
+    if not entries and _backend.category_counts().get(category_id):
+        print(f"  Keeping cached series for category {category_name}: empty or failed listing")
+        return False
+    category = _category_entry(category_id, category_name, datetime.now().isoformat())
+    if not _backend.replace_category(category, dict(entries)):
+        return False
+    print(f"Refreshed category {category_name}: {len(entries)} series")
+    return True
+
+def search_series(query, offset=0, limit=None):
+    """Searches cached series names, actors and plots, best matches first.
+
+    Returns (results, total, last_fetch_date); results holds at most limit series starting at offset.
+    """
+    return _backend.search(query, offset, limit)
 
 
+def get_category_page(category_id, sort='default', offset=0, limit=20):
+    """Returns (entries, total, category) for a page of a category from the cache, or None when it is not cached.
+
+    sort is one of search_index.CATEGORY_SORTS; category holds the cached category metadata.
+    """
+    return _backend.category_page(category_id, sort, offset, limit)
+
+def page_series_listing(listing, category_id, sort='default', offset=0, limit=20):
+    """Projects an upstream category listing like the cache does and returns (entries, total) for one page."""
+    entries = []
+    for series in listing or []:
+        projected = _project_series(series, category_id)
+        if projected:
+            series_id, entry = projected
+            entry['series_id'] = series_id
+            entries.append(entry)
+    return sort_category_entries(entries, sort)[offset:offset + limit], len(entries)
+
 def get_series_count_by_category():
     """Returns a dictionary mapping category IDs to their series count."""
-    cached_data = get_cached_data()
-    if not cached_data:
-        return {}
-        
-    category_counts = {}
-    for series_data in cached_data.get("series", {}).values():
-        category_id = series_data.get("category_ID")
-        if category_id:
-            category_counts[category_id] = category_counts.get(category_id, 0) + 1
-            
-    return category_counts
\ No newline at end of file
+    return _backend.category_counts()
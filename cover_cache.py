@@ -0,0 +1,222 @@
+import hashlib
+import io
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow is optional; without it covers are cached at their original size
+    Image = None
+
+# Leading bytes of the image formats providers serve covers in.
+IMAGE_SIGNATURES = (
+    (b'\xff\xd8\xff', 'image/jpeg', 'jpg'),
+    (b'\x89PNG\r\n\x1a\n', 'image/png', 'png'),
+    (b'GIF8', 'image/gif', 'gif'),
+    (b'RIFF', 'image/webp', 'webp'),
+)
+EXTENSION_TYPES = {extension: mimetype for _, mimetype, extension in IMAGE_SIGNATURES}
+
+
+def sniff_image_type(data):
+    """Returns (mimetype, extension) for image bytes, or None when they are not a known image format."""
+    for signature, mimetype, extension in IMAGE_SIGNATURES:
+        if data.startswith(signature) and (extension != 'webp' or data[8:12] == b'WEBP'):
+            return mimetype, extension
+    return None
+
+
+class _InFlight:
+    """A pending cover fetch that concurrent requests for the same cover wait on."""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+
+
+class CoverCache:
+    """Size-bounded on-disk LRU cache of cover thumbnails, keyed by the cover URL.
+
+    fetch(url) returns the original image bytes. Each cover is fetched once, shrunk to fit
+    max_size (when Pillow is installed) and written to directory; concurrent requests for a
+    cover being fetched wait for that fetch. A cover that failed is not fetched again for
+    retry_after seconds. Least recently served covers are deleted once the files exceed
+    max_bytes. The LRU order survives restarts through the files' mtimes.
+    """
+
+    def __init__(self, directory, fetch, max_bytes=256 * 1024 * 1024, max_size=(300, 450), quality=80,
+                 retry_after=600):
+        self.directory = directory
+        self.fetch = fetch
+        self.max_bytes = max_bytes
+        self.max_size = max_size
+        self.quality = quality
+        self.retry_after = retry_after
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (filename, size), least recently used first
+        self._in_flight = {}
+        self._failed = {}  # key -> time before which the cover is not fetched again
+        self._size = 0
+        self._stats = {'hits': 0, 'misses': 0, 'shared': 0, 'errors': 0, 'evictions': 0}
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    def _load(self):
+        files = []
+        for filename in os.listdir(self.directory):
+            if filename.endswith('.tmp'):  # left behind by an interrupted write
+                os.remove(self._path(filename))
+                continue
+            key, _, extension = filename.partition('.')
+            if extension not in EXTENSION_TYPES:
+                continue
+            stat = os.stat(os.path.join(self.directory, filename))
+            files.append((stat.st_mtime, key, filename, stat.st_size))
+        for _, key, filename, size in sorted(files):
+            self._entries[key] = (filename, size)
+            self._size += size
+        self._evict()
+
+    @staticmethod
+    def key(url):
+        return hashlib.sha1(url.encode('utf-8')).hexdigest()
+
+    def _path(self, filename):
+        return os.path.join(self.directory, filename)
+
+    def _evict(self):
+        # Called with the lock held (or before the cache is shared)
+        while self._size > self.max_bytes and self._entries:
+            _, (filename, size) = self._entries.popitem(last=False)
+            self._size -= size
+            self._stats['evictions'] += 1
+            try:
+                os.remove(self._path(filename))
+            except OSError:
+                pass
+
+    def _thumbnail(self, data):
+        """Returns (bytes, extension) of the cover shrunk to fit max_size, or the original image."""
+        if Image is not None:
+            try:
+                with Image.open(io.BytesIO(data)) as image:
+                    image.draft('RGB', self.max_size)  # lets JPEG decoding skip most of the pixels
+                    image = ImageOps.exif_transpose(image).convert('RGB')
+                    image.thumbnail(self.max_size)
+                    output = io.BytesIO()
+                    image.save(output, 'JPEG', quality=self.quality, optimize=True)
+                thumbnail = output.getvalue()
+                if len(thumbnail) < len(data):
+                    return thumbnail, 'jpg'
+            except (OSError, ValueError, Image.DecompressionBombError):
+                pass
+        image_type = sniff_image_type(data)
+        if image_type is None:
+            raise ValueError('Cover is not an image')
+        return data, image_type[1]
+
+    def _store(self, key, data):
+        thumbnail, extension = self._thumbnail(data)
+        filename = f"{key}.{extension}"
+        temp_path = self._path(f"{filename}.{threading.get_ident()}.tmp")
+        with open(temp_path, 'wb') as f:
+            f.write(thumbnail)
+        os.replace(temp_path, self._path(filename))
+        with self._lock:
+            if key in self._entries:
+                self._size -= self._entries.pop(key)[1]
+            self._entries[key] = (filename, len(thumbnail))
+            self._size += len(thumbnail)
+            self._evict()
+        return filename
+
+    def _lookup(self, key):
+        filename, size = self._entries[key]
+        return self._path(filename), f"{key[:20]}-{size}", EXTENSION_TYPES[filename.rpartition('.')[2]]
+
+    def get(self, url):
+        """Returns (path, etag, mimetype) of the cached cover for url, fetching it on a miss.
+
+        Returns None when the cover cannot be fetched or is not an image.
+        """
+        key = self.key(url)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self._stats['hits'] += 1
+                result = self._lookup(key)
+            elif self._failed.get(key, 0) > time.monotonic():
+                self._stats['errors'] += 1
+                return None
+            else:
+                result = None
+                pending = self._in_flight.get(key)
+                if pending is None:
+                    pending = self._in_flight[key] = _InFlight()
+                    self._stats['misses'] += 1
+                    leader = True
+                else:
+                    self._stats['shared'] += 1
+                    leader = False
+
+        if result is not None:
+            try:
+                os.utime(result[0])  # keeps the LRU order across restarts
+                return result
+            except OSError:
+                # Deleted behind our back; forget it so the next request fetches it again
+                with self._lock:
+                    if key in self._entries:
+                        self._size -= self._entries.pop(key)[1]
+                return None
+
+        if not leader:
+            pending.event.wait()
+            return pending.value
+
+        try:
+            self._store(key, self.fetch(url))
+            with self._lock:
+                pending.value = self._lookup(key) if key in self._entries else None
+        except Exception:
+            with self._lock:
+                self._stats['errors'] += 1
+                if len(self._failed) > 10000:
+                    now = time.monotonic()
+                    self._failed = {k: until for k, until in self._failed.items() if until > now}
+                self._failed[key] = time.monotonic() + self.retry_after
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+            pending.event.set()
+        return pending.value
+
+    def contains(self, url):
+        with self._lock:
+            return self.key(url) in self._entries
+
+    def is_full(self):
+        with self._lock:
+            return self._size >= self.max_bytes
+
+    def prefetch(self, urls, workers=1):
+        """Fetches the covers in urls that are not cached yet, workers at a time.
+
+        Stops once the cache is full, so prefetching does not push out covers that were already
+        served. Returns the number of covers fetched.
+        """
+        def fetch_one(url):
+            if not url or self.is_full() or self.contains(url):
+                return False
+            return self.get(url) is not None
+
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            return sum(pool.map(fetch_one, urls))
+
+    def stats(self):
+        """Returns request counters and the current disk footprint."""
+        with self._lock:
+            return dict(self._stats, entries=len(self._entries), bytes=self._size, max_bytes=self.max_bytes)
@@ -0,0 +1,308 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+ACTIVE_STATES = (QUEUED, RUNNING)
+
+
+class DownloadJobQueue:
+    """Durable queue of episode downloads journaled in SQLite.
+
+    Each job downloads one episode. Jobs are picked highest priority first, at most
+    executor.max_parallel at a time, and an episode that is already queued or running is
+    not queued again. Jobs left running by a previous process are re-queued by start(),
+    where the downloader resumes them from their partial files.
+
+    run_func(job, cancel_event, host_slot) performs the download and returns True on success;
+    url_func(job) returns the URL used for the executor's per-host limit, which the download
+    starts from (host_slot.url, see DownloadExecutor.submit).
+    on_finished(job, batch), if given, is called after every job with the batch's counters.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            batch_id TEXT NOT NULL,
+            episode_id TEXT NOT NULL,
+            series_id TEXT,
+            title TEXT,
+            episode TEXT NOT NULL,
+            output_path TEXT NOT NULL,
+            priority INTEGER NOT NULL DEFAULT 0,
+            state TEXT NOT NULL,
+            error TEXT,
+            created_at REAL NOT NULL,
+            updated_at REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_jobs_state ON jobs (state, priority DESC, id);
+        CREATE INDEX IF NOT EXISTS idx_jobs_episode ON jobs (episode_id, state);
+        CREATE INDEX IF NOT EXISTS idx_jobs_batch ON jobs (batch_id);
+    """
+
+    # At most one queued or running job per episode, so concurrent enqueues cannot both add it.
+    # Journals written before this index existed may hold duplicates; all but the oldest are cancelled.
+    ACTIVE_EPISODE_INDEX = """
+        UPDATE jobs SET state = 'cancelled', error = 'Duplicate of an earlier job'
+        WHERE state IN ('queued', 'running')
+          AND id NOT IN (SELECT MIN(id) FROM jobs WHERE state IN ('queued', 'running') GROUP BY episode_id);
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_jobs_active_episode ON jobs (episode_id)
+            WHERE state IN ('queued', 'running');
+    """
+
+    INTERRUPT_GRACE = 10  # seconds interrupted jobs get to record their state
+
+    def __init__(self, path, executor, run_func, url_func, on_finished=None):
+        self.path = path
+        self.executor = executor
+        self.run_func = run_func
+        self.url_func = url_func
+        self.on_finished = on_finished
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._running = {}  # job id -> cancel event
+        self._interrupted = set()  # ids of running jobs stopped by stop(interrupt=True)
+        self._started = False
+        self._stopping = False
+        self._dispatcher = None
+
+        conn = self._connect()
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(self.SCHEMA)
+            conn.executescript(self.ACTIVE_EPISODE_INDEX)
+        finally:
+            conn.close()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    @staticmethod
+    def _row_to_job(row):
+        job = dict(row)
+        job['episode'] = json.loads(job['episode'])
+        return job
+
+    def start(self):
+        """Re-queues jobs interrupted by a restart and starts dispatching."""
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        conn = self._connect()
+        try:
+            with conn:
+                resumed = conn.execute("UPDATE jobs SET state = ?, updated_at = ? WHERE state = ?",
+                                       (QUEUED, time.time(), RUNNING)).rowcount
+        finally:
+            conn.close()
+        if resumed:
+            logger.info(f"Resuming {resumed} download jobs interrupted by a restart")
+        self._dispatcher = threading.Thread(target=self._dispatch_loop, name='download-dispatcher', daemon=True)
+        self._dispatcher.start()
+
+    def stop(self, timeout=None, interrupt=False):
+        """Stops dispatching new jobs and waits up to timeout seconds for running ones to finish.
+
+        With interrupt, jobs still running after timeout are stopped and put back in the queue,
+        keeping their partial files, so the next start() resumes them. Returns True when no job
+        is left running.
+        """
+        with self._lock:
+            self._stopping = True
+            self._wakeup.notify_all()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._lock:
+            while self._running:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    break
+                self._wakeup.wait(remaining)
+            if self._running and interrupt:
+                logger.info(f"Interrupting {len(self._running)} running download jobs for shutdown")
+                self._interrupted.update(self._running)
+                for cancel_event in self._running.values():
+                    cancel_event.set()
+                # Downloads notice the cancel event on their next chunk
+                deadline = time.monotonic() + self.INTERRUPT_GRACE
+                while self._running and time.monotonic() < deadline:
+                    self._wakeup.wait(deadline - time.monotonic())
+            return not self._running
+
+    def enqueue(self, items, priority=0):
+        """Queues (episode, series_id, output_path) items as one batch.
+
+        Returns (batch_id, created_job_ids, skipped_episode_ids); episodes that already have
+        a queued or running job are skipped.
+        """
+        batch_id = uuid.uuid4().hex
+        created = []
+        skipped = []
+        now = time.time()
+        conn = self._connect()
+        try:
+            with conn:
+                for episode, series_id, output_path in items:
+                    episode_id = str(episode['id'])
+                    # Ignored when idx_jobs_active_episode already holds an active job for the episode
+                    cursor = conn.execute(
+                        "INSERT OR IGNORE INTO jobs (batch_id, episode_id, series_id, title, episode, output_path, "
+                        "priority, state, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        (batch_id, episode_id, series_id, episode.get('title'), json.dumps(episode),
+                         output_path, priority, QUEUED, now, now))
+                    if cursor.rowcount:
+                        created.append(cursor.lastrowid)
+                    else:
+                        skipped.append(episode_id)
+        finally:
+            conn.close()
+        with self._lock:
+            self._wakeup.notify_all()
+        return batch_id, created, skipped
+
+    def get(self, job_id):
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            return self._row_to_job(row) if row else None
+        finally:
+            conn.close()
+
+    def list_jobs(self, state=None, limit=200):
+        """Returns jobs newest first, optionally filtered by state."""
+        conn = self._connect()
+        try:
+            if state:
+                rows = conn.execute("SELECT * FROM jobs WHERE state = ? ORDER BY id DESC LIMIT ?", (state, limit))
+            else:
+                rows = conn.execute("SELECT * FROM jobs ORDER BY id DESC LIMIT ?", (limit,))
+            return [self._row_to_job(row) for row in rows]
+        finally:
+            conn.close()
+
+    def batch_progress(self, batch_id):
+        """Returns counters for the jobs of a batch: total, finished, failed and active."""
+        conn = self._connect()
+        try:
+            counts = dict(conn.execute("SELECT state, COUNT(*) FROM jobs WHERE batch_id = ? GROUP BY state",
+                                       (batch_id,)).fetchall())
+        finally:
+            conn.close()
+        total = sum(counts.values())
+        active = sum(counts.get(state, 0) for state in ACTIVE_STATES)
+        return {
+            'batch_id': batch_id,
+            'total': total,
+            'finished': total - active,
+            'failed': counts.get(FAILED, 0) + counts.get(CANCELLED, 0),
+            'active': active
+        }
+
+    def state_counts(self):
+        """Returns the number of jobs in each state."""
+        conn = self._connect()
+        try:
+            return dict(conn.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall())
+        finally:
+            conn.close()
+
+    def cancel(self, job_id):
+        """Cancels a queued or running job. Returns False when the job is not active."""
+        conn = self._connect()
+        try:
+            with conn:
+                cancelled = conn.execute(
+                    "UPDATE jobs SET state = ?, updated_at = ? WHERE id = ? AND state = ?",
+                    (CANCELLED, time.time(), job_id, QUEUED)).rowcount
+        finally:
+            conn.close()
+        if cancelled:
+            return True
+        with self._lock:
+            cancel_event = self._running.get(job_id)
+        if cancel_event is None:
+            return False
+        cancel_event.set()
+        return True
+
+    def _set_state(self, job_id, state, error=None):
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute("UPDATE jobs SET state = ?, error = ?, updated_at = ? WHERE id = ?",
+                             (state, error, time.time(), job_id))
+        finally:
+            conn.close()
+
+    def _claim_next(self):
+        """Atomically moves the highest priority queued job to running and returns it."""
+        conn = self._connect()
+        try:
+            with conn:
+                row = conn.execute("SELECT * FROM jobs WHERE state = ? ORDER BY priority DESC, id LIMIT 1",
+                                   (QUEUED,)).fetchone()
+                if row is None:
+                    return None
+                claimed = conn.execute("UPDATE jobs SET state = ?, updated_at = ? WHERE id = ? AND state = ?",
+                                       (RUNNING, time.time(), row['id'], QUEUED)).rowcount
+            return self._row_to_job(row) if claimed else None
+        finally:
+            conn.close()
+
+    def _dispatch_loop(self):
+        while True:
+            with self._lock:
+                while not self._stopping and len(self._running) >= self.executor.max_parallel:
+                    self._wakeup.wait()
+                if self._stopping:
+                    return
+            cancel_event = threading.Event()
+            with self._lock:
+                # Claimed and registered under one lock, so cancel() always finds a job marked running
+                job = self._claim_next()
+                if job is None:
+                    if not self._stopping:
+                        self._wakeup.wait(timeout=5)
+                    continue
+                self._running[job['id']] = cancel_event
+            self.executor.submit(self.url_func(job), self._run_job, job, cancel_event)
+
+    def _run_job(self, job, cancel_event, host_slot):
+        try:
+            # Runs once the job has a slot on its host; it may have been cancelled while it waited
+            success = not cancel_event.is_set() and self.run_func(job, cancel_event, host_slot)
+            if job['id'] in self._interrupted:
+                self._set_state(job['id'], QUEUED)
+                return
+            if cancel_event.is_set():
+                self._set_state(job['id'], CANCELLED)
+            else:
+                self._set_state(job['id'], DONE if success else FAILED, None if success else 'Download failed')
+        except Exception as e:
+            logger.error(f"Download job {job['id']} failed: {str(e)}")
+            if job['id'] in self._interrupted:
+                self._set_state(job['id'], QUEUED)
+                return
+            self._set_state(job['id'], CANCELLED if cancel_event.is_set() else FAILED, str(e))
+        finally:
+            with self._lock:
+                self._running.pop(job['id'], None)
+                self._interrupted.discard(job['id'])
+                self._wakeup.notify_all()
+        if self.on_finished:
+            try:
+                self.on_finished(self.get(job['id']), self.batch_progress(job['batch_id']))
+            except Exception as e:
+                logger.error(f"Download job callback failed: {str(e)}")
@@ -0,0 +1,74 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+
+class HostSlot:
+    """The per-host slot held by one running download, for the URL it is currently fetching from.
+
+    A download keeps sending its requests to url. When it has to switch to another mirror it calls
+    move(new_url), which gives up the slot on the old host and waits for one on the new host.
+    """
+
+    def __init__(self, executor, url):
+        self._executor = executor
+        self._lock = threading.Lock()
+        self.url = url
+        self._slot = executor._host_slot(urlparse(url).netloc)
+
+    def move(self, url):
+        with self._lock:
+            slot = self._executor._host_slot(urlparse(url).netloc)
+            if slot is not self._slot:
+                self._slot.release()
+                slot.acquire()
+                self._slot = slot
+            self.url = url
+
+    def _acquire(self):
+        self._slot.acquire()
+
+    def _release(self):
+        with self._lock:
+            self._slot.release()
+
+
+class DownloadExecutor:
+    """Runs episode downloads on a shared thread pool.
+
+    max_parallel bounds the number of episodes transferring at once across all jobs;
+    max_per_host additionally bounds the streams opened against any single upstream host.
+    """
+
+    def __init__(self, max_parallel=3, max_per_host=2):
+        self.max_parallel = max(1, max_parallel)
+        self.max_per_host = max(1, max_per_host)
+        self._pool = ThreadPoolExecutor(max_workers=self.max_parallel, thread_name_prefix='download')
+        self._host_slots = {}
+        self._lock = threading.Lock()
+
+    def _host_slot(self, host):
+        with self._lock:
+            slot = self._host_slots.get(host)
+            if slot is None:
+                slot = self._host_slots[host] = threading.BoundedSemaphore(self.max_per_host)
+            return slot
+
+    def submit(self, url, func, *args):
+        """Schedules func(*args, host_slot) once a slot for url's host is free. Returns a Future.
+
+        func should fetch from host_slot.url, and switch hosts with host_slot.move() so the
+        per-host limit applies to the host actually serving the download.
+        """
+        host_slot = HostSlot(self, url)
+
+        def run():
+            host_slot._acquire()
+            try:
+                return func(*args, host_slot)
+            finally:
+                host_slot._release()
+        return self._pool.submit(run)
+
+    def shutdown(self, wait=True):
+        self._pool.shutdown(wait=wait)
@@ -0,0 +1,75 @@
+import json
+import os
+import re
+import threading
+import time
+
+COMPLETE = 'complete'
+INCOMPLETE = 'incomplete'
+
+
+class DownloadManifest:
+    """Per-series record of downloaded episodes: output path, expected size and completion state.
+
+    Each series has one JSON file in directory, replaced atomically on every change. Manifests
+    are kept in memory once read, so checking a whole library reads each file only once.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._manifests = {}  # series_id -> {episode_id: entry}
+
+    def _path(self, series_id):
+        return os.path.join(self.directory, re.sub(r'[^\w.-]', '_', str(series_id)) + '.json')
+
+    def _load(self, series_id):
+        # Called with the lock held
+        series_id = str(series_id)
+        manifest = self._manifests.get(series_id)
+        if manifest is None:
+            try:
+                with open(self._path(series_id), 'r', encoding='utf-8') as f:
+                    manifest = json.load(f).get('episodes', {})
+            except (OSError, ValueError, AttributeError):
+                manifest = {}
+            self._manifests[series_id] = manifest
+        return manifest
+
+    def _save(self, series_id, manifest):
+        # Called with the lock held
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(series_id)
+        temp_path = path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({'series_id': str(series_id), 'episodes': manifest}, f, indent=1)
+        os.replace(temp_path, path)
+
+    def get(self, series_id, episode_id):
+        """Returns a copy of the entry of an episode, or None when it was never recorded."""
+        with self._lock:
+            entry = self._load(series_id).get(str(episode_id))
+            return dict(entry) if entry else None
+
+    def record(self, series_id, episode_id, path, state, size=None):
+        """Records the output path and state of an episode, and its size once known."""
+        with self._lock:
+            manifest = self._load(series_id)
+            previous = manifest.get(str(episode_id), {})
+            manifest[str(episode_id)] = {
+                'path': path,
+                'size': size if size is not None else previous.get('size'),
+                'state': state,
+                'updated_at': time.time()
+            }
+            self._save(series_id, manifest)
+
+    def is_complete(self, series_id, episode_id, path):
+        """Whether path holds an episode recorded as complete, judged by its size alone."""
+        entry = self.get(series_id, episode_id)
+        if not entry or entry['state'] != COMPLETE or entry['path'] != path or entry['size'] is None:
+            return False
+        try:
+            return os.path.getsize(path) == entry['size']
+        except OSError:
+            return False
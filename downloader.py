@@ -0,0 +1,455 @@
+import json
+import logging
+import os
+import queue
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+PART_SUFFIX = '.part'
+SEGMENTS_SUFFIX = '.segments'
+CHUNK_SIZE = 256 * 1024
+# Received chunks wait in a buffer of this many bytes for the writer thread.
+BUFFER_SIZE = 16 * 1024 * 1024
+# Saved segment positions may run ahead of what reached the disk before a crash; resumed
+# segments re-fetch this many bytes before their recorded position.
+RESUME_REWIND = 1024 * 1024
+CONTENT_RANGE_RE = re.compile(r'bytes\s+(\d+)-(\d+)/(\d+|\*)')
+CONTENT_RANGE_TOTAL_RE = re.compile(r'bytes\s+\*/(\d+)')
+
+
+class DownloadError(Exception):
+    """Raised when a file could not be downloaded after all retry attempts."""
+
+
+class DownloadCancelled(Exception):
+    """Raised from a progress callback to abort a transfer, keeping the partial file for later."""
+
+
+class _Progress:
+    """Thread-safe byte counter that forwards updates to a progress callback."""
+
+    def __init__(self, callback, downloaded=0, total=0):
+        self.callback = callback
+        self.downloaded = downloaded
+        self.total = total
+        self._lock = threading.Lock()
+
+    def add(self, size):
+        with self._lock:
+            self.downloaded += size
+            if self.callback:
+                self.callback(self.downloaded, self.total)
+
+
+def _preallocate(f, size):
+    """Reserves size bytes for f so the file is laid out in one piece instead of growing chunk by chunk."""
+    try:
+        os.posix_fallocate(f.fileno(), 0, size)
+    except (AttributeError, OSError):
+        # Not available on this platform or filesystem: fall back to a sparse file of the final size
+        f.truncate(size)
+
+
+def _fsync_path(path):
+    """Flushes path to disk; for a directory this makes a rename within it durable (POSIX only)."""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+class _FileWriter:
+    """Writes received chunks to a file on its own OS thread, fed through a bounded buffer.
+
+    The network side only queues chunks, so a slow disk or an fsync does not stall the socket,
+    and reading does not wait for writes. write() blocks while buffer_size bytes are waiting,
+    which bounds memory use. position is the file offset after the last chunk written;
+    on_written(nbytes), if given, is called from the writer thread after every write.
+    With fsync_interval > 0 the file is flushed to disk every that many bytes.
+
+    This relies on real threads; the production server only runs progress streams on its event
+    loop and keeps everything else, downloads included, on OS threads (see asgi.py).
+    """
+
+    def __init__(self, f, position, chunk_size=CHUNK_SIZE, buffer_size=BUFFER_SIZE, fsync_interval=None,
+                 on_written=None):
+        self.position = position
+        self.on_written = on_written
+        self._f = f
+        self._f.seek(position)
+        self._fsync_interval = fsync_interval
+        self._unsynced = 0
+        self._queue = queue.Queue(maxsize=max(1, buffer_size // max(1, chunk_size)))
+        self._error = None
+        self._thread = threading.Thread(target=self._run, name='download-writer', daemon=True)
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close(raise_errors=exc_type is None)
+
+    def write(self, data):
+        if self._error is not None:
+            raise self._error
+        self._queue.put(data)
+
+    def _run(self):
+        while True:
+            data = self._queue.get()
+            if data is None:
+                return
+            if self._error is not None:
+                continue  # keep draining so write() never blocks on a failed writer
+            try:
+                self._f.write(data)
+                self.position += len(data)
+                if self.on_written:
+                    self.on_written(len(data))
+                if self._fsync_interval:
+                    self._unsynced += len(data)
+                    if self._unsynced >= self._fsync_interval:
+                        self._f.flush()
+                        os.fsync(self._f.fileno())
+                        self._unsynced = 0
+            except Exception as e:
+                self._error = e
+
+    def close(self, raise_errors=True):
+        """Writes the chunks still buffered and stops the writer thread."""
+        self._queue.put(None)
+        self._thread.join()
+        try:
+            self._f.flush()
+        except OSError as e:
+            self._error = self._error or e
+        if raise_errors and self._error is not None:
+            raise self._error
+
+
+def probe(http_session, url, timeout=(5, 30)):
+    """Returns (size, accepts_ranges) for url. size is 0 when the server does not report it."""
+    response = http_session.head(url, timeout=timeout, allow_redirects=True)
+    response.raise_for_status()
+    size = int(response.headers.get('content-length', 0) or 0)
+    accepts_ranges = response.headers.get('accept-ranges', '').lower() == 'bytes'
+    return size, accepts_ranges
+
+
+def _resolve(url):
+    return url() if callable(url) else url
+
+
+def _backoff(attempt):
+    time.sleep(min(30, 2 ** attempt))
+
+
+def _download_stream(http_session, url, part_path, progress, chunk_size, max_attempts, timeout, throttle,
+                     buffer_size, preallocate, fsync_interval, on_request_error):
+    """Downloads url into part_path over one connection, resuming from the bytes already on disk.
+
+    With preallocate and a known size the part file is created at its final size; its progress is
+    then tracked in a single-segment state file, as the file size no longer tells where to resume.
+    """
+    state_path = part_path + SEGMENTS_SUFFIX
+    state = _SegmentState.load(state_path)
+    if state is not None and os.path.exists(part_path) and os.path.getsize(part_path) == state.size:
+        offset = state.segments[0][2]
+    elif os.path.exists(state_path):
+        # The part file does not match its state (e.g. interrupted while preallocating): start over
+        state = None
+        offset = 0
+    else:
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    attempt = 0
+    try:
+        while True:
+            start_offset = offset
+            writer = None
+            request_url = _resolve(url)
+            try:
+                headers = {'Range': f'bytes={offset}-'} if offset else {}
+                with http_session.get(request_url, stream=True, headers=headers, timeout=timeout) as response:
+                    if response.status_code == 416:
+                        # Nothing left to fetch: the partial file already holds the whole body.
+                        match = CONTENT_RANGE_TOTAL_RE.match(response.headers.get('content-range', ''))
+                        if match and int(match.group(1)) == offset:
+                            progress.total = offset
+                            progress.add(offset - progress.downloaded)
+                            return
+                        offset = 0
+                        raise DownloadError("Server rejected resume range")
+                    response.raise_for_status()
+
+                    if offset and response.status_code == 206:
+                        match = CONTENT_RANGE_RE.match(response.headers.get('content-range', ''))
+                        if not match or int(match.group(1)) != offset:
+                            offset = 0
+                            raise DownloadError("Server returned an unexpected range")
+                        total = int(match.group(3)) if match.group(3) != '*' else 0
+                        expected = state.size if state is not None else progress.total
+                        if expected and total != expected:
+                            # Served by a mirror holding a different file: the part file is of no use
+                            offset = 0
+                            raise DownloadError(f"File size changed from {expected} to {total} bytes")
+                    else:
+                        if offset:
+                            logger.debug(f"Server ignored range request, restarting {part_path} from zero")
+                            offset = 0
+                        total = int(response.headers.get('content-length', 0) or 0)
+
+                    if not offset:
+                        state = None
+                        if preallocate and total:
+                            # The state goes first: a full-size part file without one would look complete
+                            state = _SegmentState.create(state_path, total, 1)
+                            state.save()
+                        elif os.path.exists(state_path):
+                            os.remove(state_path)
+                        with open(part_path, 'wb') as f:
+                            if state is not None:
+                                _preallocate(f, total)
+
+                    progress.total = total
+                    progress.downloaded = offset
+                    on_written = (lambda size: state.advance(0, size)) if state is not None else None
+                    with open(part_path, 'r+b') as f:
+                        writer = _FileWriter(f, offset, chunk_size, buffer_size, fsync_interval, on_written)
+                        with writer:
+                            for data in response.iter_content(chunk_size=chunk_size):
+                                if data:
+                                    if throttle:
+                                        throttle(len(data))
+                                    writer.write(data)
+                                    progress.add(len(data))
+                    offset = writer.position
+
+                if total and offset < total:
+                    raise DownloadError(f"Connection closed at {offset} of {total} bytes")
+                return
+            except (requests.exceptions.RequestException, DownloadError, OSError) as e:
+                if on_request_error and isinstance(e, requests.exceptions.RequestException):
+                    on_request_error(request_url, e)
+                if writer is not None:
+                    offset = writer.position
+                if offset > start_offset:
+                    attempt = 0
+                attempt += 1
+                if attempt >= max_attempts:
+                    raise DownloadError(f"Giving up after {attempt} attempts: {str(e)}") from e
+                logger.warning(f"Download interrupted at {offset} bytes ({str(e)}), resuming (attempt {attempt})")
+                if _resolve(url) == request_url:  # no other mirror to move to
+                    _backoff(attempt)
+    finally:
+        if state is not None:
+            state.save()
+
+
+class _SegmentState:
+    """Byte ranges of a segmented download, persisted next to the .part file so restarts can resume."""
+
+    def __init__(self, path, size, segments):
+        self.path = path
+        self.size = size
+        self.segments = segments  # list of [start, end, position]
+        self._lock = threading.Lock()
+        self._last_save = 0
+
+    @classmethod
+    def load(cls, path):
+        """Returns the saved state at path, rewound by RESUME_REWIND, or None when there is none."""
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+            segments = [[start, end, max(start, position - RESUME_REWIND)]
+                        for start, end, position in state['segments']]
+            return cls(path, state['size'], segments)
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    @classmethod
+    def load_or_create(cls, path, size, count):
+        state = cls.load(path)
+        if state is not None and state.size == size:
+            return state
+        return cls.create(path, size, count)
+
+    @classmethod
+    def create(cls, path, size, count):
+        step = -(-size // count)
+        segments = [[start, min(start + step, size) - 1, start] for start in range(0, size, step)]
+        return cls(path, size, segments)
+
+    @property
+    def downloaded(self):
+        return sum(position - start for start, _, position in self.segments)
+
+    def advance(self, index, size):
+        with self._lock:
+            self.segments[index][2] += size
+            if time.monotonic() - self._last_save >= 1:
+                self._save_locked()
+
+    def save(self):
+        with self._lock:
+            self._save_locked()
+
+    def _save_locked(self):
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump({'size': self.size, 'segments': self.segments}, f)
+        self._last_save = time.monotonic()
+
+
+def _download_segment(http_session, url, part_path, state, index, progress, chunk_size, max_attempts, timeout,
+                      throttle, buffer_size, fsync_interval, on_request_error):
+    start, end, _ = state.segments[index]
+    attempt = 0
+    while state.segments[index][2] <= end:
+        position = state.segments[index][2]
+        request_url = _resolve(url)
+        try:
+            headers = {'Range': f'bytes={position}-{end}'}
+            with http_session.get(request_url, stream=True, headers=headers, timeout=timeout) as response:
+                response.raise_for_status()
+                if response.status_code != 206:
+                    raise DownloadError("Server does not honour range requests")
+                match = CONTENT_RANGE_RE.match(response.headers.get('content-range', ''))
+                if not match or int(match.group(1)) != position or match.group(3) not in ('*', str(state.size)):
+                    raise DownloadError("Server returned an unexpected range")
+                received = position
+                with open(part_path, 'r+b') as f, \
+                        _FileWriter(f, position, chunk_size, buffer_size, fsync_interval,
+                                    lambda size: state.advance(index, size)) as writer:
+                    for data in response.iter_content(chunk_size=chunk_size):
+                        if data:
+                            data = data[:end + 1 - received]
+                            if throttle:
+                                throttle(len(data))
+                            writer.write(data)
+                            received += len(data)
+                            progress.add(len(data))
+                            if received > end:
+                                break
+            if state.segments[index][2] <= end:
+                raise DownloadError(f"Segment {index} closed at byte {state.segments[index][2]}")
+        except (requests.exceptions.RequestException, DownloadError, OSError) as e:
+            if on_request_error and isinstance(e, requests.exceptions.RequestException):
+                on_request_error(request_url, e)
+            if state.segments[index][2] > position:
+                attempt = 0
+            attempt += 1
+            if attempt >= max_attempts:
+                raise DownloadError(f"Segment {index} failed after {attempt} attempts: {str(e)}") from e
+            logger.warning(f"Segment {index} interrupted ({str(e)}), resuming (attempt {attempt})")
+            if _resolve(url) == request_url:  # no other mirror to move to
+                _backoff(attempt)
+
+
+def _download_segmented(http_session, url, part_path, size, segments, progress, chunk_size, max_attempts, timeout,
+                        throttle, buffer_size, preallocate, fsync_interval, on_request_error):
+    """Downloads url as `segments` concurrent byte ranges written in place into part_path.
+
+    Every segment has its own writer thread; they share buffer_size between them.
+    """
+    state = _SegmentState.load_or_create(part_path + SEGMENTS_SUFFIX, size, segments)
+    if not os.path.exists(part_path) or os.path.getsize(part_path) != size:
+        # No usable partial file: start over with one of the final size.
+        state = _SegmentState.create(state.path, size, segments)
+        with open(part_path, 'wb') as f:
+            if preallocate:
+                _preallocate(f, size)
+            else:
+                f.truncate(size)
+    progress.total = size
+    progress.downloaded = state.downloaded
+
+    try:
+        with ThreadPoolExecutor(max_workers=len(state.segments), thread_name_prefix='segment') as pool:
+            futures = [pool.submit(_download_segment, http_session, url, part_path, state, index,
+                                   progress, chunk_size, max_attempts, timeout, throttle,
+                                   buffer_size // len(state.segments), fsync_interval, on_request_error)
+                       for index in range(len(state.segments))]
+            for future in futures:
+                future.result()
+    finally:
+        state.save()
+
+
+def download_file(http_session, url, output_path, progress_callback=None, segments=1,
+                  chunk_size=CHUNK_SIZE, max_attempts=5, timeout=(5, 30), throttle=None,
+                  buffer_size=BUFFER_SIZE, preallocate=True, fsync_interval=None, on_request_error=None):
+    """Downloads url to output_path, resuming interrupted transfers.
+
+    Data is written to output_path + '.part' and renamed into place once complete, so a
+    failed or interrupted download can be resumed with an HTTP Range request on the next
+    attempt or after a restart. With segments > 1 and a server that advertises
+    Accept-Ranges, the file is fetched over that many concurrent byte ranges.
+    progress_callback(downloaded, total) is called as bytes arrive, possibly from several threads;
+    it may raise DownloadCancelled to abort. throttle(nbytes), if given, is called before each chunk
+    is written and may block to limit bandwidth. Raises DownloadError when the transfer cannot be completed.
+
+    Chunks of chunk_size bytes are handed to a writer thread through a buffer of up to buffer_size
+    bytes. With preallocate, files of known size get their disk space reserved up front.
+    fsync_interval None never forces data to disk; 0 flushes the file before it is renamed into
+    place, and larger values also every that many bytes. A file whose size does not match the
+    size announced by the server is discarded.
+
+    url may also be a function returning the URL for each request, e.g. to move to another mirror
+    after a failure; on_request_error(url, error), if given, is called for every failed request.
+    Resumed ranges must come from a copy of the same size.
+    """
+    part_path = output_path + PART_SUFFIX
+    state_path = part_path + SEGMENTS_SUFFIX
+    progress = _Progress(progress_callback)
+
+    size, accepts_ranges = 0, False
+    if segments > 1:
+        try:
+            size, accepts_ranges = probe(http_session, _resolve(url), timeout)
+        except requests.exceptions.RequestException as e:
+            logger.debug(f"HEAD request failed ({str(e)}), using a single stream")
+
+    if segments > 1 and accepts_ranges and size >= segments * chunk_size:
+        _download_segmented(http_session, url, part_path, size, segments, progress,
+                            chunk_size, max_attempts, timeout, throttle, buffer_size, preallocate, fsync_interval,
+                            on_request_error)
+    else:
+        if os.path.exists(state_path):
+            state = _SegmentState.load(state_path)
+            if state is None or len(state.segments) > 1:
+                # A segmented download cannot be resumed as a single stream: its .part has holes.
+                os.remove(state_path)
+                if os.path.exists(part_path):
+                    os.remove(part_path)
+        _download_stream(http_session, url, part_path, progress, chunk_size, max_attempts, timeout, throttle,
+                         buffer_size, preallocate, fsync_interval, on_request_error)
+
+    actual_size = os.path.getsize(part_path)
+    if progress.total and actual_size != progress.total:
+        os.remove(part_path)
+        if os.path.exists(state_path):
+            os.remove(state_path)
+        raise DownloadError(f"Downloaded file has {actual_size} bytes, expected {progress.total}")
+    if fsync_interval is not None:
+        _fsync_path(part_path)
+    os.replace(part_path, output_path)
+    if os.path.exists(state_path):
+        os.remove(state_path)
+    if fsync_interval is not None:
+        _fsync_path(os.path.dirname(os.path.abspath(output_path)))
+    return progress.downloaded
@@ -0,0 +1,30 @@
+# Production server settings, picked up automatically by `gunicorn asgi:app` (see the Dockerfile).
+#
+# The worker runs an asyncio event loop (uvicorn). Progress streams are served on the loop and hold
+# no thread while connected; every other request runs the Flask app on a pool of WEB_THREADS threads
+# (see asgi.py). A page that calls the provider keeps its thread until the provider answers, so
+# WEB_THREADS also bounds the upstream calls page views can have waiting at once. Downloads, file
+# writes, SQLite and catalog crawls run on their own threads and may block without stalling requests.
+import os
+
+wsgi_app = 'asgi:app'
+bind = os.getenv('BIND', '0.0.0.0:5000')
+worker_class = 'uvicorn_worker.UvicornWorker'
+# One process on purpose. The download job dispatcher, the progress hub and the catalog's search
+# index live in the worker's memory: a second worker would re-queue the jobs the first is running
+# when it starts, and progress streams connected to it would never see the first worker's downloads.
+# Page requests scale with WEB_THREADS and open streams cost no thread, so extra workers are refused
+# rather than sharing that state between processes (see on_starting).
+workers = 1
+timeout = int(os.getenv('WEB_TIMEOUT', '120'))
+keepalive = 5
+accesslog = '-'
+loglevel = os.getenv('LOG_LEVEL', 'info')
+
+# Workers get the download drain time plus a margin before the arbiter kills them.
+graceful_timeout = int(float(os.getenv('SHUTDOWN_DRAIN_TIMEOUT', '60'))) + 15
+
+
+def on_starting(server):
+    if server.cfg.workers > 1:
+        raise RuntimeError("Only one worker is supported; scale with WEB_THREADS instead of --workers")
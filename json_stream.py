@@ -0,0 +1,92 @@
+import codecs
+import json
+
+WHITESPACE = ' \t\n\r'
+# Characters that end a number or literal (true, false, null) inside the array
+DELIMITERS = WHITESPACE + ',]'
+
+
+class JsonArrayParser:
+    """Incremental parser for a top-level JSON array, yielding each element as soon as it is complete.
+
+    Feed it the raw response body chunk by chunk; only the element currently being received is
+    buffered, so memory stays bounded by the largest element rather than the whole document.
+    A body that is not an array (e.g. an error object) is buffered and yields nothing.
+    """
+
+    def __init__(self):
+        self._decoder = json.JSONDecoder()
+        self._utf8 = codecs.getincrementaldecoder('utf-8')()
+        self._buffer = ''
+        self._state = 'start'  # start -> array -> done, or start -> other
+
+    def feed(self, chunk, final=False):
+        """Adds a chunk of bytes and returns the list of array elements completed by it."""
+        self._buffer += self._utf8.decode(chunk, final=final)
+        elements = []
+        if self._state == 'start':
+            stripped = self._buffer.lstrip(WHITESPACE)
+            if not stripped:
+                self._buffer = ''
+                return elements
+            if stripped[0] != '[':
+                self._state = 'other'
+                self._buffer = stripped
+                return elements
+            self._state = 'array'
+            self._buffer = stripped[1:]
+        if self._state != 'array':
+            return elements
+
+        buffer = self._buffer
+        pos = 0
+        length = len(buffer)
+        while True:
+            while pos < length and (buffer[pos] in WHITESPACE or buffer[pos] == ','):
+                pos += 1
+            if pos >= length:
+                break
+            if buffer[pos] == ']':
+                self._state = 'done'
+                pos = length
+                break
+            if buffer[pos] in '{["':
+                try:
+                    value, end = self._decoder.raw_decode(buffer, pos)
+                except json.JSONDecodeError:
+                    break  # Element not complete yet
+            else:
+                # A number or literal has no closing character, and a prefix of one may already
+                # parse ('-3' of '-3e5'): wait until a delimiter follows it or the body ends
+                token_end = pos
+                while token_end < length and buffer[token_end] not in DELIMITERS:
+                    token_end += 1
+                if token_end == length and not final:
+                    break
+                value, end = self._decoder.raw_decode(buffer, pos)
+                if end != token_end:
+                    raise ValueError(f"Invalid JSON value: {buffer[pos:token_end]}")
+            elements.append(value)
+            pos = end
+        self._buffer = buffer[pos:]
+        return elements
+
+    def close(self):
+        """Finishes parsing. Returns any remaining elements; raises ValueError on a truncated array."""
+        elements = self.feed(b'', final=True)
+        if self._state == 'array':
+            raise ValueError("Truncated JSON array")
+        if self._state == 'other':
+            value = json.loads(self._buffer)
+            self._buffer = ''
+            if isinstance(value, list):
+                elements.extend(value)
+        return elements
+
+
+def iter_json_array(chunks):
+    """Yields the elements of a JSON array body given as an iterable of byte chunks."""
+    parser = JsonArrayParser()
+    for chunk in chunks:
+        yield from parser.feed(chunk)
+    yield from parser.close()
@@ -0,0 +1,138 @@
+import functools
+import gzip
+import hashlib
+
+from flask import Response, current_app, make_response, request
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; without it responses are only gzip-compressed
+    brotli = None
+
+COMPRESSIBLE_TYPES = {'text/html', 'text/css', 'text/javascript', 'application/javascript',
+                      'application/json', 'image/svg+xml'}
+MIN_COMPRESS_SIZE = 512  # smaller bodies are not worth the Content-Encoding overhead
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+def compress(body, encoding):
+    if encoding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def negotiate_encoding():
+    """Returns the Content-Encoding to use for the current request: 'br', 'gzip' or None."""
+    accepted = request.accept_encodings
+    if brotli is not None and accepted['br']:
+        return 'br'
+    if accepted['gzip']:
+        return 'gzip'
+    return None
+
+
+def is_compressible(mimetype, size):
+    return mimetype in COMPRESSIBLE_TYPES and size >= MIN_COMPRESS_SIZE
+
+
+class RenderedPage:
+    """A response body with its ETag and compressed variants, built once and served many times."""
+
+    def __init__(self, body, status, content_type, mimetype, etag=None):
+        self.body = body
+        self.status = status
+        self.content_type = content_type
+        self.etag = etag or hashlib.sha1(body).hexdigest()
+        self.variants = {}  # Content-Encoding -> body
+        if is_compressible(mimetype, len(body)):
+            self.variants['gzip'] = compress(body, 'gzip')
+            if brotli is not None:
+                self.variants['br'] = compress(body, 'br')
+        self.nbytes = len(body) + sum(len(variant) for variant in self.variants.values())
+
+    @classmethod
+    def from_response(cls, response):
+        return cls(response.get_data(), response.status_code, response.content_type, response.mimetype)
+
+    def encoded(self):
+        """Returns (encoding, body) of the variant that suits the current request."""
+        encoding = negotiate_encoding() if self.variants else None
+        return encoding, self.variants[encoding] if encoding else self.body
+
+    def to_response(self):
+        encoding, body = self.encoded()
+        response = Response(body, status=self.status, content_type=self.content_type)
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        if self.variants:
+            response.vary.add('Accept-Encoding')
+        if self.status != 200:
+            return response
+        # Weak, since the compressed variants share it; browsers revalidate on every visit
+        response.set_etag(self.etag, weak=True)
+        response.cache_control.no_cache = True
+        return response.make_conditional(request)
+
+
+def cached_page(cache, ttl, generation):
+    """Decorator that serves a view's rendered response from cache.
+
+    Pages are keyed by endpoint, view arguments, query string and generation(), so they are
+    rendered again once the catalog changes and at the latest after ttl seconds. Only 200
+    responses are stored. Responses carry an ETag for If-None-Match revalidation and are
+    compressed once per page. A ttl of 0 or debug mode (where templates reload) disables the cache.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(**kwargs):
+            if ttl <= 0 or current_app.debug:
+                return view(**kwargs)
+            key = ('pages', request.endpoint, tuple(sorted((name, str(value)) for name, value in kwargs.items())),
+                   tuple(sorted(request.args.items(multi=True))), generation())
+            page = cache.get_or_fetch('pages', key, ttl,
+                                      lambda: RenderedPage.from_response(make_response(view(**kwargs))),
+                                      should_cache=lambda page: page.status == 200)
+            return page.to_response()
+        return wrapper
+    return decorator
+
+
+def compress_response(response, cache):
+    """Compresses a response for clients that accept it; meant for an after_request hook.
+
+    Static files are compressed once per ETag and the results kept in cache. Other responses
+    are compressed on the fly unless they are streamed or already encoded.
+    """
+    if (response.status_code != 200 or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESSIBLE_TYPES):
+        return response
+    encoding = negotiate_encoding()
+    if request.endpoint == 'static':
+        etag, _ = response.get_etag()
+        if not etag:
+            return response
+
+        def read_file():
+            response.direct_passthrough = False
+            return RenderedPage(response.get_data(), 200, response.content_type, response.mimetype, etag=etag)
+
+        page = cache.get_or_fetch('static', ('static', request.path, etag), float('inf'), read_file)
+        if not page.variants:
+            return response
+        if hasattr(response.response, 'close'):
+            response.response.close()  # the file is not read when the compressed copy is cached
+        encoding, body = page.encoded()
+        response.set_data(body)
+    else:
+        if response.is_streamed or not is_compressible(response.mimetype, response.content_length or 0):
+            return response
+        if encoding:
+            response.set_data(compress(response.get_data(), encoding))
+    response.vary.add('Accept-Encoding')
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+    return response
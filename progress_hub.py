@@ -0,0 +1,182 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from queue import Queue, Empty, Full
+
+
+class Subscription:
+    """A subscriber's view of one channel. get() returns events, or None once the channel closes.
+
+    aget() is the coroutine equivalent, for subscribers served from an event loop.
+    """
+
+    def __init__(self, channel, maxsize):
+        self.channel = channel
+        self._queue = Queue(maxsize=maxsize)
+        self._waiter = None  # (loop, asyncio.Event) of a pending aget()
+
+    def put(self, event):
+        while True:
+            try:
+                self._queue.put_nowait(event)
+                break
+            except Full:
+                # A slow client loses its oldest pending update rather than stalling publishers.
+                try:
+                    self._queue.get_nowait()
+                except Empty:
+                    pass
+        waiter = self._waiter
+        if waiter is not None:
+            loop, ready = waiter
+            try:
+                loop.call_soon_threadsafe(ready.set)
+            except RuntimeError:  # The subscriber's loop has been closed
+                pass
+
+    def get(self, timeout=None):
+        """Returns the next event; raises queue.Empty after timeout seconds without one."""
+        return self._queue.get(timeout=timeout)
+
+    async def aget(self, timeout=None):
+        """Like get(), but waits on the running event loop instead of blocking a thread."""
+        loop = asyncio.get_running_loop()
+        ready = asyncio.Event()
+        deadline = None if timeout is None else loop.time() + timeout
+        # Publishers run on other threads; they set ready once an event is queued after this point.
+        self._waiter = (loop, ready)
+        try:
+            while True:
+                try:
+                    return self._queue.get_nowait()
+                except Empty:
+                    pass
+                remaining = None if deadline is None else deadline - loop.time()
+                if remaining is not None and remaining <= 0:
+                    raise Empty
+                try:
+                    await asyncio.wait_for(ready.wait(), remaining)
+                except asyncio.TimeoutError:
+                    raise Empty from None
+                ready.clear()
+        finally:
+            self._waiter = None
+
+
+class _Channel:
+    def __init__(self):
+        self.subscribers = set()
+        self.last_events = OrderedDict()  # key -> latest event, replayed to late subscribers
+        self.last_published = {}  # key -> (monotonic time, progress) of the last delivered update
+        self.closed = False
+
+
+class ProgressHub:
+    """Publish/subscribe hub for progress events with one channel per job.
+
+    Every subscriber of a channel receives every delivered event. Events with a status in
+    throttled_statuses are coalesced per (channel, key): at most max_rate per second and,
+    when min_step is set, only once progress has advanced by min_step percent. All other
+    events are always delivered. Subscribers joining late first receive the latest event
+    per key, and a closed channel stays readable until max_closed newer channels have closed.
+    """
+
+    def __init__(self, max_rate=4, min_step=0, throttled_statuses=('downloading', 'in_progress'),
+                 max_closed=256, subscriber_queue_size=1000):
+        self.min_interval = 1.0 / max_rate if max_rate > 0 else 0
+        self.min_step = min_step
+        self.throttled_statuses = frozenset(throttled_statuses)
+        self.max_closed = max_closed
+        self.subscriber_queue_size = subscriber_queue_size
+        self._lock = threading.Lock()
+        self._channels = {}
+        self._closed = OrderedDict()
+
+    def _channel(self, name):
+        channel = self._channels.get(name)
+        if channel is None:
+            channel = self._channels[name] = _Channel()
+        return channel
+
+    def publish(self, name, event, key=None):
+        """Publishes event on channel name. Returns False when it was coalesced away."""
+        now = time.monotonic()
+        with self._lock:
+            channel = self._channel(name)
+            channel.last_events[key] = event
+            channel.last_events.move_to_end(key)
+            if event.get('status') in self.throttled_statuses:
+                last = channel.last_published.get(key)
+                if last is not None:
+                    if now - last[0] < self.min_interval:
+                        return False
+                    if self.min_step and abs(event.get('progress', 0) - last[1]) < self.min_step:
+                        return False
+            channel.last_published[key] = (now, event.get('progress', 0))
+            subscribers = list(channel.subscribers)
+        for subscription in subscribers:
+            subscription.put(event)
+        return True
+
+    def close(self, name):
+        """Ends the streams of all subscribers of channel name; its last state stays replayable."""
+        with self._lock:
+            channel = self._channel(name)
+            channel.closed = True
+            subscribers = list(channel.subscribers)
+            channel.subscribers.clear()
+            self._closed[name] = None
+            self._closed.move_to_end(name)
+            while len(self._closed) > self.max_closed:
+                expired, _ = self._closed.popitem(last=False)
+                self._channels.pop(expired, None)
+        for subscription in subscribers:
+            subscription.put(None)
+
+    def close_all(self):
+        """Closes every open channel, ending all subscriber streams (used at shutdown)."""
+        with self._lock:
+            names = [name for name, channel in self._channels.items() if not channel.closed]
+        for name in names:
+            self.close(name)
+
+    def reset(self, name):
+        """Forgets channel name's state so it can be reused by a new run."""
+        with self._lock:
+            channel = self._channels.pop(name, None)
+            self._closed.pop(name, None)
+            if channel is not None and channel.subscribers:
+                # Keep current subscribers attached to the fresh channel.
+                self._channel(name).subscribers.update(channel.subscribers)
+
+    def subscribe(self, name):
+        """Returns a Subscription primed with the channel's last known state."""
+        subscription = Subscription(name, self.subscriber_queue_size)
+        with self._lock:
+            channel = self._channel(name)
+            for event in channel.last_events.values():
+                subscription.put(event)
+            if channel.closed:
+                subscription.put(None)
+            else:
+                channel.subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            channel = self._channels.get(subscription.channel)
+            if channel is not None:
+                channel.subscribers.discard(subscription)
+                if not channel.subscribers and not channel.last_events and not channel.closed:
+                    del self._channels[subscription.channel]
+
+    def stats(self):
+        """Returns the number of channels, subscribers and events waiting in subscriber queues."""
+        with self._lock:
+            subscriptions = [s for channel in self._channels.values() for s in channel.subscribers]
+            return {
+                'channels': len(self._channels),
+                'subscribers': len(subscriptions),
+                'queued_events': sum(s._queue.qsize() for s in subscriptions)
+            }
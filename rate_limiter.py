@@ -0,0 +1,158 @@
+import re
+import threading
+import time
+from datetime import datetime
+
+RATE_RE = re.compile(r'^\s*(\d+(?:\.\d+)?)\s*([kmg]?)i?b?\s*$', re.IGNORECASE)
+WINDOW_RE = re.compile(r'^\s*(\d{1,2}):(\d{2})\s*-\s*(\d{1,2}):(\d{2})\s*$')
+UNITS = {'': 1, 'k': 1024, 'm': 1024 ** 2, 'g': 1024 ** 3}
+
+
+def parse_rate(value):
+    """Parses a rate such as 2097152, '500K' or '2M' (bytes per second). 0 means unlimited."""
+    if value is None or value == '':
+        return 0
+    if isinstance(value, (int, float)):
+        return max(0, int(value))
+    match = RATE_RE.match(str(value))
+    if not match:
+        raise ValueError(f"Invalid rate: {value}")
+    return int(float(match.group(1)) * UNITS[match.group(2).lower()])
+
+
+def parse_schedule(spec):
+    """Parses 'HH:MM-HH:MM=RATE;...;*=RATE' into a list of (start_minute, end_minute, rate).
+
+    Windows may wrap past midnight; '*' matches any time not covered by an earlier window.
+    """
+    schedule = []
+    for part in filter(None, (p.strip() for p in (spec or '').split(';'))):
+        window, sep, rate = part.partition('=')
+        if not sep:
+            raise ValueError(f"Invalid schedule entry: {part}")
+        if window.strip() == '*':
+            schedule.append((0, 24 * 60, parse_rate(rate)))
+            continue
+        match = WINDOW_RE.match(window)
+        if not match:
+            raise ValueError(f"Invalid schedule window: {window}")
+        start_h, start_m, end_h, end_m = (int(g) for g in match.groups())
+        if start_h > 23 or end_h > 23 or start_m > 59 or end_m > 59:
+            raise ValueError(f"Invalid schedule window: {window}")
+        schedule.append((start_h * 60 + start_m, end_h * 60 + end_m, parse_rate(rate)))
+    return schedule
+
+
+def format_schedule(schedule):
+    parts = []
+    for start, end, rate in schedule:
+        if start == 0 and end == 24 * 60:
+            parts.append(f"*={rate}")
+        else:
+            parts.append(f"{start // 60:02d}:{start % 60:02d}-{end // 60:02d}:{end % 60:02d}={rate}")
+    return ';'.join(parts)
+
+
+class TokenBucket:
+    """Token bucket holding up to one second of tokens. A rate of 0 disables limiting."""
+
+    def __init__(self, rate=0):
+        self.rate = rate
+        self._tokens = rate
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def set_rate(self, rate):
+        with self._lock:
+            self.rate = rate
+            self._tokens = min(self._tokens, rate)
+
+    def consume(self, amount):
+        """Takes amount tokens, sleeping as long as needed to stay under the rate."""
+        with self._lock:
+            rate = self.rate
+            if not rate:
+                return
+            now = time.monotonic()
+            self._tokens = min(rate, self._tokens + (now - self._updated) * rate)
+            self._updated = now
+            # Going into debt keeps callers in FIFO order without a wait loop.
+            self._tokens -= amount
+            wait = -self._tokens / rate if self._tokens < 0 else 0
+        if wait > 0:
+            time.sleep(wait)
+
+
+class BandwidthLimiter:
+    """Global download bandwidth limit shared by every stream, plus an optional per-download limit.
+
+    The global rate follows the schedule when one is set (checked at most once per second),
+    otherwise global_rate. All settings can be changed at runtime; running downloads pick
+    them up on their next chunk. When nothing is limited, throttling costs one attribute check.
+    """
+
+    def __init__(self, global_rate=0, per_download_rate=0, schedule=None):
+        self._lock = threading.Lock()
+        self._bucket = TokenBucket()
+        self.global_rate = 0
+        self.per_download_rate = 0
+        self.schedule = []
+        self.active = False
+        self._checked_at = 0
+        self.configure(global_rate=global_rate, per_download_rate=per_download_rate, schedule=schedule or [])
+
+    def configure(self, global_rate=None, per_download_rate=None, schedule=None):
+        """Updates any of the limits. Rates are bytes per second (0 = unlimited)."""
+        with self._lock:
+            if global_rate is not None:
+                self.global_rate = global_rate
+            if per_download_rate is not None:
+                self.per_download_rate = per_download_rate
+            if schedule is not None:
+                self.schedule = schedule
+            self._checked_at = 0
+            self._refresh_locked(time.monotonic())
+
+    def scheduled_rate(self, now=None):
+        """Returns the global rate in effect at now (a datetime, default: current local time)."""
+        if not self.schedule:
+            return self.global_rate
+        now = now or datetime.now()
+        minute = now.hour * 60 + now.minute
+        for start, end, rate in self.schedule:
+            if start <= end:
+                if start <= minute < end:
+                    return rate
+            elif minute >= start or minute < end:
+                return rate
+        return self.global_rate
+
+    def _refresh_locked(self, now):
+        self._bucket.set_rate(self.scheduled_rate())
+        self._checked_at = now
+        self.active = bool(self._bucket.rate or self.per_download_rate or self.schedule)
+
+    def state(self):
+        return {
+            'global_rate': self.global_rate,
+            'effective_rate': self._bucket.rate,
+            'per_download_rate': self.per_download_rate,
+            'schedule': format_schedule(self.schedule)
+        }
+
+    def throttle_for_download(self):
+        """Returns a throttle(nbytes) callable for one download (shared by all of its segments)."""
+        own_bucket = TokenBucket(self.per_download_rate)
+
+        def throttle(amount):
+            if not self.active:
+                return
+            now = time.monotonic()
+            if self.schedule and now - self._checked_at >= 1:
+                with self._lock:
+                    self._refresh_locked(now)
+            if own_bucket.rate != self.per_download_rate:
+                own_bucket.set_rate(self.per_download_rate)
+            own_bucket.consume(amount)
+            self._bucket.consume(amount)
+        return throttle
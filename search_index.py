@@ -0,0 +1,377 @@
+import copy
+import heapq
+import re
+import threading
+from bisect import bisect_left
+from collections import Counter
+
+TOKEN_RE = re.compile(r'\w+')
+
+# Relevance tuning: a token found in the name counts more than in the actors, which counts more
+# than in the plot. Exact terms score 1, prefix completions and typo corrections less. The SQLite
+# cache backend ranks with the same field weights in bm25.
+FIELD_WEIGHTS = (3.0, 2.0, 1.0)  # series_name, actors, plot
+PREFIX_QUALITY = 0.75
+FUZZY_QUALITY = 0.6
+PHRASE_BONUS = 1.5  # multi-word query found verbatim in the name (half of it for other fields)
+FUZZY_MIN_LENGTH = 3
+FUZZY_MAX_EXPANSIONS = 8
+# Tokens shorter than SHORT_PREFIX_LENGTH complete to a large share of the vocabulary; they only
+# match their SHORT_PREFIX_MAX_EXPANSIONS most common completions.
+SHORT_PREFIX_LENGTH = 3
+SHORT_PREFIX_MAX_EXPANSIONS = 32
+
+
+def tokenize(text):
+    """Splits lowercased text into word tokens."""
+    return TOKEN_RE.findall(text.lower()) if text else []
+
+
+def _number(value, convert):
+    try:
+        return convert(value)
+    except (TypeError, ValueError):
+        return 0
+
+
+# Orders for browsing a category: key functions over cached series entries (None keeps catalog order).
+# Missing or malformed dates and ratings sort last.
+CATEGORY_SORTS = {
+    'default': None,
+    'name': lambda entry: entry.get('series_name', '').casefold(),
+    'added': lambda entry: -_number(entry.get('last_modified'), int),
+    'rating': lambda entry: -_number(entry.get('rating'), float),
+}
+
+
+def sort_category_entries(entries, sort):
+    """Returns entries in the given CATEGORY_SORTS order; ties keep their catalog order."""
+    key = CATEGORY_SORTS[sort]
+    return sorted(entries, key=key) if key else list(entries)
+
+
+def trigrams(term):
+    """Returns the set of padded character trigrams of term."""
+    padded = f"  {term} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def edit_distance(a, b, max_distance):
+    """Optimal string alignment distance between a and b, or max_distance + 1 once it is exceeded."""
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    previous2 = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if previous2 is not None and i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if min(current) > max_distance:
+            return max_distance + 1
+        previous2, previous = previous, current
+    return previous[-1]
+
+
+class FuzzyVocabulary:
+    """Trigram index over a vocabulary, used to find the terms a misspelled token was meant to be."""
+
+    def __init__(self, terms):
+        self._terms = [term for term in terms if len(term) >= FUZZY_MIN_LENGTH - 1]
+        self._trigrams = {}
+        for term_id, term in enumerate(self._terms):
+            for gram in trigrams(term):
+                self._trigrams.setdefault(gram, []).append(term_id)
+
+    def expand(self, token, limit=FUZZY_MAX_EXPANSIONS):
+        """Returns up to limit (term, similarity) pairs for terms within a small edit distance of token."""
+        if len(token) < FUZZY_MIN_LENGTH:
+            return []
+        max_distance = 1 if len(token) < 8 else 2
+        shared = Counter()
+        for gram in trigrams(token):
+            shared.update(self._trigrams.get(gram, ()))
+        matches = []
+        # Terms sharing the most trigrams are the likeliest candidates; only those get the exact check.
+        for term_id, _ in shared.most_common(limit * 16):
+            term = self._terms[term_id]
+            if term == token:
+                continue
+            distance = edit_distance(token, term, max_distance)
+            if distance <= max_distance:
+                matches.append((term, 1 - distance / max(len(token), len(term))))
+        matches.sort(key=lambda match: -match[1])
+        return matches[:limit]
+
+
+class SearchIndex:
+    """Ranked, typo-tolerant inverted index over the cached series names, actors and plots.
+
+    Built once per cache generation. Every query token must match a term of the series, exactly,
+    as a prefix or, when the token is not a known term, through a close spelling. Matches are
+    scored by field weight and match quality, and the best page is picked with a heap.
+    """
+
+    def __init__(self, cached_data):
+        cached_data = cached_data or {}
+        self.last_fetch_date = cached_data.get("last_fetch_date")
+        self.category_counts = {}
+        self.categories = {category.get("category_id"): category for category in cached_data.get("categories", [])}
+        self._category_docs = {}
+        self._category_orders = {}
+        self._docs = []  # None for series removed by replace_category
+        self._doc_ids = {}  # series_id -> doc_id
+        self._fields = []
+        self._tiebreak = []
+        postings = tuple({} for _ in FIELD_WEIGHTS)
+
+        for series_id, series_data in cached_data.get("series", {}).items():
+            doc_id = len(self._docs)
+            doc = dict(series_data)
+            doc['series_id'] = series_id
+            self._docs.append(doc)
+            self._doc_ids[series_id] = doc_id
+
+            name_lower = doc.get('series_name', '').lower()
+            actors_lower = ' '.join(doc.get('actors', [])).lower()
+            plot_lower = doc.get('plot', '').lower()
+            fields = (name_lower, actors_lower, plot_lower)
+            self._fields.append(fields)
+            # Among equal scores, shorter names (closer matches) and earlier series come first.
+            self._tiebreak.append(min(len(name_lower), 999) * 1e-6 + doc_id * 1e-12)
+
+            for field, field_postings in zip(fields, postings):
+                for token in TOKEN_RE.findall(field):
+                    doc_ids = field_postings.setdefault(token, [])
+                    if not doc_ids or doc_ids[-1] != doc_id:
+                        doc_ids.append(doc_id)
+
+            category_id = doc.get("category_ID")
+            if category_id:
+                self.category_counts[category_id] = self.category_counts.get(category_id, 0) + 1
+                self._category_docs.setdefault(category_id, []).append(doc_id)
+
+        self._postings = postings
+        self._vocabulary = sorted(set().union(*postings))
+        # Documents containing each vocabulary term in any field
+        self._term_counts = [sum(len(field_postings.get(term, ())) for field_postings in postings)
+                             for term in self._vocabulary]
+        self._fuzzy = None
+        self._fuzzy_lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._doc_ids)
+
+    def series_items(self):
+        """Yields (series_id, entry) for every indexed series in catalog order."""
+        for doc in self._docs:
+            if doc is not None:
+                entry = dict(doc)
+                yield entry.pop('series_id'), entry
+
+    def category_list(self):
+        """Returns the category metadata in catalog order."""
+        return [dict(category) for category in self.categories.values()]
+
+    def replace_category(self, category, series):
+        """Returns a new index in which the category's series are series ({series_id: entry}).
+
+        Series of the category missing from series are dropped, and category becomes its metadata.
+        Only the documents and terms of series that changed are touched, which is much cheaper than
+        indexing the catalog again. This index is left as it was and can keep serving searches.
+        """
+        category_id = category.get("category_id")
+        index = copy.copy(self)
+        index._docs = list(self._docs)
+        index._doc_ids = dict(self._doc_ids)
+        index._fields = list(self._fields)
+        index._tiebreak = list(self._tiebreak)
+        index.categories = dict(self.categories)
+        index.categories[category_id] = dict(category)
+        index._fuzzy_lock = threading.Lock()
+
+        removals = tuple({} for _ in FIELD_WEIGHTS)  # per field: term -> doc ids that lose it
+        additions = tuple({} for _ in FIELD_WEIGHTS)  # per field: term -> doc ids that gain it
+        members = {category_id: (set(), set())}  # category -> (doc ids leaving, doc ids joining)
+
+        def unindex(doc_id):
+            for field, field_removals in zip(index._fields[doc_id], removals):
+                for token in set(TOKEN_RE.findall(field)):
+                    field_removals.setdefault(token, set()).add(doc_id)
+            members.setdefault(index._docs[doc_id].get("category_ID"), (set(), set()))[0].add(doc_id)
+
+        for doc_id in self._category_docs.get(category_id, []):
+            series_id = self._docs[doc_id]['series_id']
+            if series_id not in series:
+                unindex(doc_id)
+                index._docs[doc_id] = None
+                index._fields[doc_id] = ('', '', '')
+                del index._doc_ids[series_id]
+
+        for series_id, series_data in series.items():
+            doc = dict(series_data)
+            doc['series_id'] = series_id = str(series_id)
+            doc_id = index._doc_ids.get(series_id)
+            if doc_id is None:
+                doc_id = index._doc_ids[series_id] = len(index._docs)
+                index._docs.append(None)
+                index._fields.append(None)
+                index._tiebreak.append(None)
+            elif index._docs[doc_id] == doc:
+                continue
+            else:
+                unindex(doc_id)
+            name_lower = doc.get('series_name', '').lower()
+            fields = (name_lower, ' '.join(doc.get('actors', [])).lower(), doc.get('plot', '').lower())
+            index._docs[doc_id] = doc
+            index._fields[doc_id] = fields
+            index._tiebreak[doc_id] = min(len(name_lower), 999) * 1e-6 + doc_id * 1e-12
+            for field, field_additions in zip(fields, additions):
+                for token in set(TOKEN_RE.findall(field)):
+                    field_additions.setdefault(token, set()).add(doc_id)
+            members.setdefault(doc.get("category_ID"), (set(), set()))[1].add(doc_id)
+
+        index._postings = tuple(dict(field_postings) for field_postings in self._postings)
+        for field_postings, field_removals, field_additions in zip(index._postings, removals, additions):
+            for token in field_removals.keys() | field_additions.keys():
+                doc_ids = set(field_postings.get(token, ()))
+                doc_ids -= field_removals.get(token, set())
+                doc_ids |= field_additions.get(token, set())
+                if doc_ids:
+                    field_postings[token] = sorted(doc_ids)
+                else:
+                    del field_postings[token]
+
+        index._category_docs = dict(self._category_docs)
+        index.category_counts = dict(self.category_counts)
+        for member_category, (leaving, joining) in members.items():
+            if not member_category:
+                continue
+            doc_ids = sorted(set(self._category_docs.get(member_category, ())) - leaving | joining)
+            if doc_ids:
+                index._category_docs[member_category] = doc_ids
+                index.category_counts[member_category] = len(doc_ids)
+            else:
+                index._category_docs.pop(member_category, None)
+                index.category_counts.pop(member_category, None)
+        index._category_orders = {key: order for key, order in self._category_orders.items()
+                                  if key[0] not in members}
+
+        term_counts = {term: sum(len(field_postings.get(term, ())) for field_postings in index._postings)
+                       for term in set().union(*removals, *additions)}
+        if any((count > 0) != self._has_term(term) for term, count in term_counts.items()):
+            index._vocabulary = sorted(set().union(*index._postings))
+            index._fuzzy = None
+            previous_counts = dict(zip(self._vocabulary, self._term_counts))
+            previous_counts.update(term_counts)
+            index._term_counts = [previous_counts[term] for term in index._vocabulary]
+        elif term_counts:
+            index._term_counts = list(self._term_counts)
+            for term, count in term_counts.items():
+                index._term_counts[bisect_left(index._vocabulary, term)] = count
+        return index
+
+    def category_page(self, category_id, sort='default', offset=0, limit=20):
+        """Returns (entries, total) for one page of a category's series in the given CATEGORY_SORTS order.
+
+        Each order is computed once per index, so paging costs only the slice.
+        """
+        doc_ids = self._category_docs.get(category_id, [])
+        if CATEGORY_SORTS[sort] is not None:
+            order = self._category_orders.get((category_id, sort))
+            if order is None:
+                key = CATEGORY_SORTS[sort]
+                order = sorted(doc_ids, key=lambda doc_id: key(self._docs[doc_id]))
+                self._category_orders[(category_id, sort)] = order
+            doc_ids = order
+        return [dict(self._docs[doc_id]) for doc_id in doc_ids[offset:offset + limit]], len(doc_ids)
+
+    def _has_term(self, term):
+        position = bisect_left(self._vocabulary, term)
+        return position < len(self._vocabulary) and self._vocabulary[position] == term
+
+    def _fuzzy_vocabulary(self):
+        # Built on the first misspelled query; most generations never need it.
+        if self._fuzzy is None:
+            with self._fuzzy_lock:
+                if self._fuzzy is None:
+                    self._fuzzy = FuzzyVocabulary(self._vocabulary)
+        return self._fuzzy
+
+    def _expand(self, token):
+        """Returns the (term, quality) pairs a query token matches."""
+        expansions = []
+        vocabulary = self._vocabulary
+        start = bisect_left(vocabulary, token)
+        exact = start < len(vocabulary) and vocabulary[start] == token
+        if exact:
+            expansions.append((token, 1.0))
+            start += 1
+        end = start
+        while end < len(vocabulary) and vocabulary[end].startswith(token):
+            end += 1
+        positions = range(start, end)
+        if len(token) < SHORT_PREFIX_LENGTH and len(positions) > SHORT_PREFIX_MAX_EXPANSIONS:
+            positions = heapq.nlargest(SHORT_PREFIX_MAX_EXPANSIONS, positions, key=self._term_counts.__getitem__)
+        expansions.extend((vocabulary[position], PREFIX_QUALITY) for position in positions)
+        if not exact:
+            expansions.extend((term, FUZZY_QUALITY * similarity)
+                              for term, similarity in self._fuzzy_vocabulary().expand(token))
+        return expansions
+
+    def _token_scores(self, token):
+        """Returns {doc_id: best weighted match quality} over the documents matching token."""
+        weighted = []
+        for term, quality in self._expand(token):
+            for weight, field_postings in zip(FIELD_WEIGHTS, self._postings):
+                doc_ids = field_postings.get(term)
+                if doc_ids:
+                    weighted.append((weight * quality, doc_ids))
+        # Applying the lowest values first lets higher ones overwrite them, at dict.update speed.
+        weighted.sort(key=lambda item: item[0])
+        scores = {}
+        for value, doc_ids in weighted:
+            scores.update(dict.fromkeys(doc_ids, value))
+        return scores
+
+    def search(self, query, offset=0, limit=None):
+        """Returns (results, total) for query, best matches first.
+
+        results holds at most limit series starting at offset; total counts every match.
+        """
+        query_lower = ' '.join(TOKEN_RE.findall(query.lower()))
+        tokens = list(dict.fromkeys(query_lower.split()))
+        if not tokens:
+            return [], 0
+
+        scores = None
+        # Most selective (longest) tokens first keeps the intersections small.
+        for token in sorted(tokens, key=len, reverse=True):
+            token_scores = self._token_scores(token)
+            if scores is None:
+                scores = token_scores
+            else:
+                if len(token_scores) < len(scores):
+                    scores, token_scores = token_scores, scores
+                scores = {doc_id: score + token_scores[doc_id]
+                          for doc_id, score in scores.items() if doc_id in token_scores}
+            if not scores:
+                return [], 0
+
+        if len(tokens) > 1:
+            for doc_id in scores:
+                name, actors, plot = self._fields[doc_id]
+                if query_lower in name:
+                    scores[doc_id] += PHRASE_BONUS
+                elif query_lower in actors or query_lower in plot:
+                    scores[doc_id] += PHRASE_BONUS / 2
+
+        tiebreak = self._tiebreak
+        ranked = {doc_id: score - tiebreak[doc_id] for doc_id, score in scores.items()}
+        if limit is None:
+            top = sorted(ranked, key=ranked.__getitem__, reverse=True)[offset:]
+        else:
+            top = heapq.nlargest(offset + limit, ranked, key=ranked.__getitem__)[offset:]
+        return [dict(self._docs[doc_id]) for doc_id in top], len(scores)
@@ -0,0 +1,50 @@
+import threading
+import time
+
+import pytest
+
+from api_cache import ResponseCache
+
+
+def test_waiters_get_the_leaders_error():
+    cache = ResponseCache()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def failing_fetch():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        raise ConnectionError('upstream down')
+
+    errors = []
+
+    def call():
+        try:
+            cache.get_or_fetch('series', ('series', '1'), 60, failing_fetch)
+        except ConnectionError as e:
+            errors.append(e)
+
+    leader = threading.Thread(target=call)
+    leader.start()
+    assert started.wait(5)
+    waiters = [threading.Thread(target=call) for _ in range(3)]
+    for waiter in waiters:
+        waiter.start()
+    while cache.stats()['endpoints']['series']['shared'] < len(waiters):
+        time.sleep(0.001)
+    release.set()
+    for thread in [leader] + waiters:
+        thread.join(5)
+
+    assert len(calls) == 1
+    assert [str(error) for error in errors] == ['upstream down'] * 4
+    # Failures are not cached: the next call fetches again
+    assert cache.get_or_fetch('series', ('series', '1'), 60, lambda: 'ok') == 'ok'
+
+
+def test_values_are_shared_and_cached():
+    cache = ResponseCache()
+    assert cache.get_or_fetch('series', ('series', '1'), 60, lambda: [1, 2]) == [1, 2]
+    assert cache.get_or_fetch('series', ('series', '1'), 60, lambda: pytest.fail('fetched again')) == [1, 2]
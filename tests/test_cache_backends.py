@@ -0,0 +1,92 @@
+import pytest
+
+import cache_backends
+import search_index
+from cache_backends import JsonCacheBackend, SqliteCacheBackend
+
+CATALOG = {
+    'series': {
+        '1': {'series_name': 'Mad Men', 'category_ID': 'a', 'actors': ['Jon Hamm'], 'plot': 'Ad men.'},
+        '2': {'series_name': 'Mad Max', 'category_ID': 'a', 'actors': [], 'plot': 'Gone roads.'},
+        '3': {'series_name': 'Max Payne', 'category_ID': 'b', 'actors': [], 'plot': ''},
+    },
+    'categories': [
+        {'category_id': 'a', 'category_name': 'A', 'last_fetched': '2024-01-01T00:00:00'},
+        {'category_id': 'b', 'category_name': 'B', 'last_fetched': '2024-01-01T00:00:00'},
+    ],
+    'last_fetch_date': '2024-01-01T00:00:00',
+}
+
+
+@pytest.fixture(params=['json', 'sqlite'])
+def backend(request, tmp_path):
+    if request.param == 'json':
+        return JsonCacheBackend(str(tmp_path / 'cache.json'))
+    return SqliteCacheBackend(str(tmp_path / 'cache.db'))
+
+
+def test_replace_category_without_cache(backend):
+    assert backend.replace_category({'category_id': 'a'}, {}) is False
+
+
+def test_replace_category_only_touches_that_category(backend):
+    backend.save(CATALOG)
+    assert backend.search('gone')[1] == 1
+    generation = backend.signature()
+
+    category = {'category_id': 'a', 'category_name': 'A', 'last_fetched': '2024-01-02T00:00:00'}
+    added = {'series_name': 'Max Steel', 'category_ID': 'a', 'actors': [], 'plot': 'New toy.'}
+    assert backend.replace_category(category, {'1': CATALOG['series']['1'], '4': added})
+
+    data = backend.load()
+    assert data['series'] == {'1': CATALOG['series']['1'], '3': CATALOG['series']['3'], '4': added}
+    assert data['categories'] == [category, CATALOG['categories'][1]]
+    assert data['last_fetch_date'] == CATALOG['last_fetch_date']
+    assert backend.signature() != generation
+    assert backend.category_counts() == {'a': 2, 'b': 1}
+    assert backend.search('gone')[1] == 0
+    assert [entry['series_name'] for entry in backend.search('steel')[0]] == ['Max Steel']
+    entries, total, cached_category = backend.category_page('a', 'name')
+    assert [entry['series_name'] for entry in entries] == ['Mad Men', 'Max Steel']
+    assert total == 2 and cached_category == category
+
+
+def test_json_replace_category_keeps_the_updated_index(tmp_path, monkeypatch):
+    backend = JsonCacheBackend(str(tmp_path / 'cache.json'))
+    backend.save(CATALOG)
+    index = backend.get_index()
+    monkeypatch.setattr(backend, 'load', lambda: pytest.fail('the catalog was reloaded'))
+    backend.replace_category({'category_id': 'b', 'category_name': 'B'}, {})
+    assert backend.get_index() is not index
+    assert backend.category_counts() == {'a': 2}
+
+
+def test_short_prefixes_only_expand_to_their_most_common_completions(backend, monkeypatch):
+    monkeypatch.setattr(search_index, 'SHORT_PREFIX_MAX_EXPANSIONS', 2)
+    monkeypatch.setattr(cache_backends, 'SHORT_PREFIX_MAX_EXPANSIONS', 2)
+    names = ['Mad Men', 'Mad Max', 'Mad Dogs', 'Max Payne', 'Max Steel', 'Mars', 'Ma']
+    backend.save({
+        'series': {str(i): {'series_name': name, 'category_ID': 'a', 'actors': [], 'plot': ''}
+                   for i, name in enumerate(names, 1)},
+        'categories': [{'category_id': 'a', 'category_name': 'A'}],
+        'last_fetch_date': '2024-01-01T00:00:00',
+    })
+    results, total = backend.search('ma')[:2]
+    # 'ma' itself, then its two most common completions 'mad' and 'max'; 'mars' is left out
+    assert total == 6
+    assert 'Mars' not in [entry['series_name'] for entry in results]
+    assert [entry['series_name'] for entry in backend.search('mar')[0]][0] == 'Mars'
+
+
+def test_backends_weigh_name_actors_and_plot_alike(backend):
+    backend.save({
+        'series': {
+            '1': {'series_name': 'Plot Only', 'category_ID': 'a', 'actors': [], 'plot': 'A detective in Berlin.'},
+            '2': {'series_name': 'Actors Only', 'category_ID': 'a', 'actors': ['Jane Berlin'], 'plot': ''},
+            '3': {'series_name': 'Berlin Station', 'category_ID': 'a', 'actors': [], 'plot': ''},
+        },
+        'categories': [{'category_id': 'a', 'category_name': 'A'}],
+        'last_fetch_date': '2024-01-01T00:00:00',
+    })
+    results = backend.search('berlin')[0]
+    assert [entry['series_name'] for entry in results] == ['Berlin Station', 'Actors Only', 'Plot Only']
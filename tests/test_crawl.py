@@ -0,0 +1,133 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+import cache_manager
+from cache_backends import JsonCacheBackend
+from upstream_pool import UpstreamPool
+
+CATEGORIES = [{'category_id': str(i), 'category_name': f'Category {i}'} for i in range(1, 7)]
+LISTINGS = {
+    category['category_id']: [
+        {'series_id': f"{category['category_id']}{n}", 'name': f"Show {category['category_id']}-{n}",
+         'cast': 'Jane Doe, John Roe', 'plot': f'Plot {n}.', 'rating': str(n)}
+        for n in range(1, 40)
+    ]
+    for category in CATEGORIES
+}
+
+
+class PlayerApiServer:
+    """Serves get_series listings of LISTINGS.
+
+    failures maps a category id to the failures its next requests get, in order: an HTTP status
+    such as 503, or 'reset' to close the connection without answering.
+    """
+
+    def __init__(self):
+        self.failures = {}
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler_class())
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        self.base_url = f'http://127.0.0.1:{self._server.server_address[1]}'
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                category_id = parse_qs(urlparse(self.path).query).get('category_id', [''])[0]
+                with server._lock:
+                    pending = server.failures.get(category_id)
+                    failure = pending.pop(0) if pending else None
+                if failure == 'reset':
+                    self.close_connection = True
+                    return
+                if failure:
+                    self.send_response(failure)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                body = json.dumps(LISTINGS[category_id]).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
+
+
+@pytest.fixture(scope='module')
+def app(tmp_path_factory):
+    directory = tmp_path_factory.mktemp('app')
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setenv('BASE_URL', 'http://127.0.0.1:1')
+        monkeypatch.setenv('USERNAME', 'user')
+        monkeypatch.setenv('PASSWORD', 'pass')
+        monkeypatch.setenv('DOWNLOAD_JOBS_DB', str(directory / 'jobs.db'))
+        monkeypatch.setenv('COVER_CACHE_DIR', str(directory / 'covers'))
+        import app
+    return app
+
+
+@pytest.fixture
+def server():
+    server = PlayerApiServer()
+    yield server
+    server.stop()
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(app, monkeypatch):
+    monkeypatch.setattr(app.retry_strategy, 'backoff_factor', 0)
+
+
+def crawl(app, tmp_path, monkeypatch, concurrent):
+    backend = JsonCacheBackend(str(tmp_path / f'{"concurrent" if concurrent else "sequential"}.json'))
+    monkeypatch.setattr(cache_manager, '_backend', backend)
+    if concurrent:
+        assert cache_manager.process_and_cache_series_data_concurrent(
+            lambda: CATEGORIES, app.iter_series_by_category_async, max_in_flight=3, request_timeout=5)
+    else:
+        assert cache_manager.process_and_cache_series_data(lambda: CATEGORIES, app.iter_series_by_category)
+    data = backend.load()
+    for category in data['categories']:
+        category.pop('last_fetched')
+    data.pop('last_fetch_date')
+    return data
+
+
+def test_concurrent_crawl_retries_like_the_sequential_crawl(app, server, tmp_path, monkeypatch):
+    monkeypatch.setattr(app, 'upstream_pool', UpstreamPool([server.base_url], lambda base_url: None))
+    caches = []
+    for concurrent in (False, True):
+        server.failures = {'2': [503, 503], '4': ['reset'], '5': [502, 'reset', 504]}
+        caches.append(crawl(app, tmp_path, monkeypatch, concurrent))
+        assert not any(server.failures.values())
+    assert caches[0] == caches[1]
+    assert len(caches[1]['series']) == sum(len(listing) for listing in LISTINGS.values())
+
+
+def test_concurrent_crawl_fails_over_to_the_next_mirror(app, server, tmp_path, monkeypatch):
+    dead = PlayerApiServer()
+    dead.stop()
+    caches = []
+    for concurrent in (False, True):
+        pool = UpstreamPool([dead.base_url, server.base_url], lambda base_url: None)
+        monkeypatch.setattr(app, 'upstream_pool', pool)
+        caches.append(crawl(app, tmp_path, monkeypatch, concurrent))
+        assert not pool.is_healthy(dead.base_url)
+    assert caches[0] == caches[1]
+    assert len(caches[1]['series']) == sum(len(listing) for listing in LISTINGS.values())
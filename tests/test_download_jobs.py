@@ -0,0 +1,148 @@
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from download_jobs import CANCELLED, DONE, QUEUED, RUNNING, DownloadJobQueue
+from download_manager import DownloadExecutor
+
+URL = 'http://upstream.test/series/user/pass/1.mkv'
+
+
+def items(count, start=0):
+    return [({'id': i, 'title': f'Episode {i}'}, '7', f'/downloads/{i}.mkv') for i in range(start, start + count)]
+
+
+def make_queue(path, run_func=None, on_finished=None, max_parallel=2):
+    return DownloadJobQueue(str(path), DownloadExecutor(max_parallel=max_parallel, max_per_host=max_parallel),
+                            run_func or (lambda job, cancel_event, host_slot: True), lambda job: URL,
+                            on_finished=on_finished)
+
+
+@pytest.fixture
+def db(tmp_path):
+    return tmp_path / 'jobs.db'
+
+
+def test_enqueue_skips_active_episodes(db):
+    queue = make_queue(db)
+    _, created, skipped = queue.enqueue(items(3))
+    assert len(created) == 3 and skipped == []
+    _, created, skipped = queue.enqueue(items(3, start=1))
+    assert len(created) == 1
+    assert skipped == ['1', '2']
+
+
+def test_concurrent_enqueues_create_one_job_per_episode(db):
+    queues = [make_queue(db) for _ in range(4)]
+    barrier = threading.Barrier(len(queues))
+    results = []
+
+    def submit(queue):
+        barrier.wait()
+        results.append(queue.enqueue(items(200)))
+
+    threads = [threading.Thread(target=submit, args=(queue,)) for queue in queues]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sum(len(created) for _, created, _ in results) == 200
+    assert sum(len(skipped) for _, _, skipped in results) == 600
+    assert queues[0].state_counts() == {QUEUED: 200}
+
+
+def test_finished_episode_can_be_queued_again(db):
+    queue = make_queue(db)
+    _, (job_id,), _ = queue.enqueue(items(1))
+    queue._set_state(job_id, DONE)
+    _, created, skipped = queue.enqueue(items(1))
+    assert len(created) == 1 and skipped == []
+
+
+def test_duplicate_active_jobs_of_an_old_journal_are_cancelled(db):
+    make_queue(db)
+    conn = sqlite3.connect(db)
+    with conn:
+        conn.execute("DROP INDEX idx_jobs_active_episode")
+        for state in (RUNNING, QUEUED):
+            conn.execute("INSERT INTO jobs (batch_id, episode_id, episode, output_path, state, created_at, updated_at) "
+                         "VALUES ('b', '1', '{}', '/downloads/1.mkv', ?, 0, 0)", (state,))
+    conn.close()
+
+    queue = make_queue(db)
+    assert [job['state'] for job in queue.list_jobs()] == [CANCELLED, RUNNING]
+
+
+def test_start_resumes_jobs_left_running(db):
+    queue = make_queue(db)
+    _, job_ids, _ = queue.enqueue(items(2))
+    claimed = queue._claim_next()
+    assert claimed['id'] == job_ids[0] and queue.get(job_ids[0])['state'] == RUNNING
+
+    finished = threading.Event()
+    ran = []
+
+    def run(job, cancel_event, host_slot):
+        ran.append(job['id'])
+        return True
+
+    def on_finished(job, batch):
+        if batch['active'] == 0:
+            finished.set()
+
+    restarted = make_queue(db, run_func=run, on_finished=on_finished)
+    restarted.start()
+    try:
+        assert finished.wait(10)
+    finally:
+        restarted.stop(timeout=5)
+    assert sorted(ran) == job_ids
+    assert restarted.state_counts() == {DONE: 2}
+
+
+def test_stop_with_interrupt_requeues_running_jobs(db):
+    started = threading.Event()
+
+    def run(job, cancel_event, host_slot):
+        started.set()
+        while not cancel_event.is_set():
+            time.sleep(0.01)
+        return False
+
+    queue = make_queue(db, run_func=run, max_parallel=1)
+    _, (job_id,), _ = queue.enqueue(items(1))
+    queue.start()
+    assert started.wait(10)
+    assert queue.stop(timeout=0, interrupt=True)
+    assert queue.get(job_id)['state'] == QUEUED
+    assert not queue._interrupted
+
+
+def test_cancel_finds_a_job_as_soon_as_it_is_claimed(db):
+    queue = make_queue(db, run_func=lambda job, cancel_event, host_slot: not cancel_event.wait(5))
+    _, (job_id,), _ = queue.enqueue(items(1))
+    claim_next = queue._claim_next
+    cancelled = []
+
+    def claim_and_cancel():
+        job = claim_next()
+        if job is not None:
+            # cancel() from a request thread right after the job was marked running
+            canceller = threading.Thread(target=lambda: cancelled.append(queue.cancel(job_id)))
+            canceller.start()
+            canceller.join(0.1)
+        return job
+
+    queue._claim_next = claim_and_cancel
+    queue.start()
+    try:
+        deadline = time.monotonic() + 10
+        while queue.get(job_id)['state'] in (QUEUED, RUNNING) and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        queue.stop(timeout=5)
+    assert cancelled == [True]
+    assert queue.get(job_id)['state'] == CANCELLED
@@ -0,0 +1,27 @@
+import threading
+
+from download_manager import DownloadExecutor
+
+
+def test_moving_a_download_takes_a_slot_on_its_new_host():
+    executor = DownloadExecutor(max_parallel=2, max_per_host=1)
+    moved = threading.Event()
+    release = threading.Event()
+
+    def failing_over(host_slot):
+        host_slot.move('http://b.test/1.mkv')
+        moved.set()
+        release.wait(5)
+        return host_slot.url
+
+    first = executor.submit('http://a.test/1.mkv', failing_over)
+    assert moved.wait(5)
+    # The slot on a.test was given up, so the next download there starts right away
+    second = executor.submit('http://a.test/2.mkv', lambda host_slot: host_slot.url)
+    assert second.result(timeout=5) == 'http://a.test/2.mkv'
+    assert not executor._host_slot('b.test').acquire(blocking=False)
+
+    release.set()
+    assert first.result(timeout=5) == 'http://b.test/1.mkv'
+    assert executor._host_slot('b.test').acquire(blocking=False)
+    executor.shutdown()
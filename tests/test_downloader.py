@@ -0,0 +1,205 @@
+import os
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+import downloader
+from downloader import PART_SUFFIX, RESUME_REWIND, SEGMENTS_SUFFIX, DownloadError, download_file
+
+RANGE_RE = re.compile(r'bytes=(\d+)-(\d*)')
+PAYLOAD = os.urandom(8 * 1024 * 1024)
+CHUNK_SIZE = 64 * 1024
+
+
+class EpisodeServer:
+    """Serves PAYLOAD with HEAD and Range support, and can misbehave on request.
+
+    cut_after, if set, is the number of body bytes sent before a GET's connection is dropped,
+    for the next cut_times GETs or all of them when cut_times is None. With ignore_range, Range
+    headers are answered with the whole body and a 200.
+    """
+
+    def __init__(self):
+        self.cut_after = None
+        self.cut_times = None
+        self.ignore_range = False
+        self.requests = []  # (method, Range header, status)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        self.url = f'http://127.0.0.1:{self._server.server_address[1]}/series/user/pass/1.mkv'
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def gets(self):
+        with self._lock:
+            return [(range_header, status) for method, range_header, status in self.requests if method == 'GET']
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def _respond(self, head):
+                size = len(PAYLOAD)
+                range_header = self.headers.get('Range')
+                start, end, status = 0, size - 1, 200
+                match = RANGE_RE.match(range_header or '')
+                if match and not server.ignore_range:
+                    start = int(match.group(1))
+                    end = min(int(match.group(2)), size - 1) if match.group(2) else size - 1
+                    status = 206
+                    if start >= size:
+                        status = 416
+                with server._lock:
+                    server.requests.append(('HEAD' if head else 'GET', range_header, status))
+                    cut = not head and server.cut_after is not None and server.cut_times != 0
+                    if cut and server.cut_times is not None:
+                        server.cut_times -= 1
+                if status == 416:
+                    self.send_response(416)
+                    self.send_header('Content-Range', f'bytes */{size}')
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                self.send_response(status)
+                self.send_header('Accept-Ranges', 'bytes')
+                self.send_header('Content-Length', str(end + 1 - start))
+                if status == 206:
+                    self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+                self.end_headers()
+                if head:
+                    return
+                body = PAYLOAD[start:end + 1]
+                if cut:
+                    body = body[:server.cut_after]
+                    self.close_connection = True
+                self.wfile.write(body)
+
+            def do_GET(self):
+                self._respond(head=False)
+
+            def do_HEAD(self):
+                self._respond(head=True)
+
+        return Handler
+
+
+@pytest.fixture
+def server():
+    server = EpisodeServer()
+    yield server
+    server.stop()
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(downloader, '_backoff', lambda attempt: None)
+
+
+def read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+@pytest.mark.parametrize('preallocate', [False, True])
+def test_resume_after_mid_body_disconnect(server, tmp_path, preallocate):
+    output = str(tmp_path / 'episode.mkv')
+    server.cut_after = 3 * 1024 * 1024
+    with pytest.raises(DownloadError):
+        download_file(requests.Session(), server.url, output, chunk_size=CHUNK_SIZE, max_attempts=1,
+                      preallocate=preallocate)
+    assert os.path.exists(output + PART_SUFFIX)
+    assert not os.path.exists(output)
+
+    server.cut_after = None
+    download_file(requests.Session(), server.url, output, chunk_size=CHUNK_SIZE, preallocate=preallocate)
+
+    assert read(output) == PAYLOAD
+    assert not os.path.exists(output + PART_SUFFIX)
+    assert not os.path.exists(output + PART_SUFFIX + SEGMENTS_SUFFIX)
+    (first_range, _), (resume_range, resume_status) = server.gets()
+    assert first_range is None
+    assert resume_status == 206
+    resumed_from = int(RANGE_RE.match(resume_range).group(1))
+    assert 0 < resumed_from <= 3 * 1024 * 1024
+
+
+def test_disconnects_within_one_call_resume_with_range(server, tmp_path):
+    output = str(tmp_path / 'episode.mkv')
+    server.cut_after = 2 * 1024 * 1024
+    server.cut_times = 2
+
+    download_file(requests.Session(), server.url, output, chunk_size=CHUNK_SIZE, max_attempts=3)
+
+    assert read(output) == PAYLOAD
+    (first_range, _), second, third = server.gets()
+    assert first_range is None
+    offsets = [int(RANGE_RE.match(range_header).group(1)) for range_header, _ in (second, third)]
+    assert 0 < offsets[0] < offsets[1]
+    assert [status for _, status in (second, third)] == [206, 206]
+
+
+def test_server_ignoring_range_restarts_from_zero(server, tmp_path):
+    output = str(tmp_path / 'episode.mkv')
+    with open(output + PART_SUFFIX, 'wb') as f:
+        f.write(b'stale bytes that must not survive' * 1000)
+    server.ignore_range = True
+
+    download_file(requests.Session(), server.url, output, chunk_size=CHUNK_SIZE)
+
+    assert read(output) == PAYLOAD
+    (range_header, status), = server.gets()
+    assert range_header == f'bytes={33 * 1000}-'
+    assert status == 200
+
+
+def test_416_on_complete_part_file(server, tmp_path):
+    output = str(tmp_path / 'episode.mkv')
+    with open(output + PART_SUFFIX, 'wb') as f:
+        f.write(PAYLOAD)
+
+    downloaded = download_file(requests.Session(), server.url, output, chunk_size=CHUNK_SIZE)
+
+    assert read(output) == PAYLOAD
+    assert not os.path.exists(output + PART_SUFFIX)
+    assert server.gets() == [(f'bytes={len(PAYLOAD)}-', 416)]
+    assert downloaded == len(PAYLOAD)
+
+
+def test_segmented_download_restarted_after_partial_run(server, tmp_path):
+    output = str(tmp_path / 'episode.mkv')
+    segments = 4
+    segment_size = len(PAYLOAD) // segments
+    server.cut_after = segment_size - 256 * 1024
+
+    with pytest.raises(DownloadError):
+        download_file(requests.Session(), server.url, output, segments=segments, chunk_size=CHUNK_SIZE,
+                      max_attempts=1)
+    assert os.path.getsize(output + PART_SUFFIX) == len(PAYLOAD)
+    assert os.path.exists(output + PART_SUFFIX + SEGMENTS_SUFFIX)
+    first_run = len(server.gets())
+
+    server.cut_after = None
+    download_file(requests.Session(), server.url, output, segments=segments, chunk_size=CHUNK_SIZE)
+
+    assert read(output) == PAYLOAD
+    assert not os.path.exists(output + PART_SUFFIX + SEGMENTS_SUFFIX)
+    resumed = server.gets()[first_run:]
+    assert len(resumed) == segments
+    for range_header, status in resumed:
+        assert status == 206
+        start = int(RANGE_RE.match(range_header).group(1))
+        segment_start = start - start % segment_size
+        # Each segment continues near where the first run stopped, rewound by RESUME_REWIND
+        assert start >= segment_start + segment_size - 256 * 1024 - RESUME_REWIND - CHUNK_SIZE
+        assert start > segment_start
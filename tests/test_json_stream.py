@@ -0,0 +1,53 @@
+import json
+
+import pytest
+
+from json_stream import JsonArrayParser, iter_json_array
+
+DOCUMENT = [
+    -3e5, 0, 12, -0.5, 1.25E-3, 1e+2, True, False, None,
+    "text with \"quotes\", commas] and brackets", "ünïcødé ✓",
+    {"series_id": 1, "name": "Show", "rating": 7.5, "cast": None},
+    [1, [2, [3]]], {},
+]
+
+
+def split(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 3, 7, 1 << 16])
+def test_elements_survive_any_chunking(chunk_size):
+    data = json.dumps(DOCUMENT).encode('utf-8')
+    assert list(iter_json_array(split(data, chunk_size))) == DOCUMENT
+
+
+@pytest.mark.parametrize('chunk_size', [1, 2])
+def test_number_split_across_chunks(chunk_size):
+    assert list(iter_json_array(split(b'[-3e5]', chunk_size))) == [-3e5]
+
+
+def test_number_at_end_of_chunk_waits_for_delimiter():
+    parser = JsonArrayParser()
+    assert parser.feed(b'[12') == []
+    assert parser.feed(b'34, 5') == [1234]
+    assert parser.feed(b']') == [5]
+    assert parser.close() == []
+
+
+def test_truncated_array_raises():
+    parser = JsonArrayParser()
+    assert parser.feed(b'[1, 2') == [1]
+    with pytest.raises(ValueError):
+        parser.close()
+
+
+def test_invalid_number_raises():
+    with pytest.raises(ValueError):
+        list(iter_json_array([b'[-3e]']))
+
+
+def test_non_array_body_yields_nothing_until_close():
+    parser = JsonArrayParser()
+    assert parser.feed(b'{"user_info": {"auth": 0}}') == []
+    assert parser.close() == []
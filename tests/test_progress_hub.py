@@ -0,0 +1,44 @@
+import asyncio
+import threading
+import time
+from queue import Empty
+
+import pytest
+
+from progress_hub import ProgressHub
+
+
+def run(coroutine):
+    return asyncio.new_event_loop().run_until_complete(coroutine)
+
+
+def test_aget_wakes_up_on_events_published_from_other_threads():
+    hub = ProgressHub(max_rate=0)
+    subscription = hub.subscribe('batch')
+
+    def publish():
+        time.sleep(0.05)
+        hub.publish('batch', {'status': 'completed'}, key='1')
+        hub.close('batch')
+
+    async def read():
+        threading.Thread(target=publish).start()
+        return [await subscription.aget(timeout=5), await subscription.aget(timeout=5)]
+
+    assert run(read()) == [{'status': 'completed'}, None]
+    assert subscription._waiter is None
+
+
+def test_aget_times_out_without_events():
+    subscription = ProgressHub().subscribe('batch')
+    started = time.monotonic()
+    with pytest.raises(Empty):
+        run(subscription.aget(timeout=0.05))
+    assert time.monotonic() - started < 1
+
+
+def test_aget_returns_the_replayed_state_first():
+    hub = ProgressHub()
+    hub.publish('batch', {'status': 'downloading', 'progress': 10}, key='1')
+    subscription = hub.subscribe('batch')
+    assert run(subscription.aget(timeout=0)) == {'status': 'downloading', 'progress': 10}
@@ -0,0 +1,150 @@
+import pytest
+
+import search_index
+from search_index import SearchIndex, edit_distance
+
+
+def catalog(*series):
+    return {'series': {str(i): dict(entry, category_ID='1') for i, entry in enumerate(series, 1)}}
+
+
+def names(results):
+    return [entry['series_name'] for entry in results]
+
+
+@pytest.mark.parametrize('a, b, distance', [
+    ('castle', 'castle', 0),
+    ('castle', 'castel', 1),  # transposition
+    ('castle', 'caste', 1),
+    ('castle', 'castles', 1),
+    ('castle', 'cattle', 1),
+    ('', 'abc', 3),
+])
+def test_edit_distance(a, b, distance):
+    assert edit_distance(a, b, 3) == distance
+
+
+def test_edit_distance_stops_past_the_maximum():
+    assert edit_distance('breaking', 'bad', 2) == 3
+    assert edit_distance('abcdef', 'badcfe', 2) == 3
+
+
+def test_name_match_outranks_actors_and_plot():
+    index = SearchIndex(catalog(
+        {'series_name': 'Plot Only', 'plot': 'A detective in Berlin.'},
+        {'series_name': 'Actors Only', 'actors': ['Jane Berlin']},
+        {'series_name': 'Berlin Station'},
+    ))
+    results, total = index.search('berlin')
+    assert names(results) == ['Berlin Station', 'Actors Only', 'Plot Only']
+    assert total == 3
+
+
+def test_every_token_must_match_and_phrases_rank_first():
+    index = SearchIndex(catalog(
+        {'series_name': 'Bad Breaking'},
+        {'series_name': 'Breaking Bad'},
+        {'series_name': 'Breaking Point'},
+    ))
+    results, total = index.search('Breaking Bad')
+    assert names(results) == ['Breaking Bad', 'Bad Breaking']
+    assert total == 2
+
+
+def test_exact_terms_outrank_prefix_completions():
+    index = SearchIndex(catalog({'series_name': 'Housemates'}, {'series_name': 'House'}))
+    assert names(index.search('house')[0]) == ['House', 'Housemates']
+    assert names(index.search('hous')[0]) == ['House', 'Housemates']
+
+
+def test_typo_finds_the_intended_term():
+    index = SearchIndex(catalog({'series_name': 'Sherlock'}, {'series_name': 'Shetland'}))
+    assert names(index.search('sherlcok')[0]) == ['Sherlock']
+    assert index.search('xyzzy') == ([], 0)
+
+
+def test_results_are_paginated():
+    index = SearchIndex(catalog(*({'series_name': f'Show {i}'} for i in range(10))))
+    first, total = index.search('show', offset=0, limit=4)
+    rest, _ = index.search('show', offset=4, limit=10)
+    assert total == 10
+    assert len(first) == 4 and len(rest) == 6
+    assert not set(names(first)) & set(names(rest))
+    assert names(first) + names(rest) == names(index.search('show')[0])
+
+
+def test_short_prefixes_only_expand_to_their_most_common_completions(monkeypatch):
+    monkeypatch.setattr(search_index, 'SHORT_PREFIX_MAX_EXPANSIONS', 2)
+    index = SearchIndex(catalog(
+        {'series_name': 'Mad Men'}, {'series_name': 'Mad Max'}, {'series_name': 'Mad Dogs'},
+        {'series_name': 'Max Payne'}, {'series_name': 'Max Steel'}, {'series_name': 'Mars'},
+    ))
+    assert {term for term, _ in index._expand('ma')} == {'mad', 'max'}
+    assert index.search('ma')[1] == 5
+    assert {term for term, _ in index._expand('m')} == {'mad', 'max'}
+    # Longer prefixes still match every completion
+    assert names(index.search('mar')[0])[0] == 'Mars'
+
+
+def test_short_exact_term_is_always_matched(monkeypatch):
+    monkeypatch.setattr(search_index, 'SHORT_PREFIX_MAX_EXPANSIONS', 1)
+    index = SearchIndex(catalog({'series_name': 'Up'}, {'series_name': 'Upload'}, {'series_name': 'Upload Two'}))
+    assert [term for term, _ in index._expand('up')] == ['up', 'upload']
+
+
+def state(index):
+    """Everything a SearchIndex answers, for comparing an updated index against a rebuilt one."""
+    categories = sorted(index.category_counts)
+    return (
+        dict(index.series_items()),
+        index.category_list(),
+        index.category_counts,
+        {(category, sort): index.category_page(category, sort, 0, 100)
+         for category in categories for sort in search_index.CATEGORY_SORTS},
+        {query: index.search(query) for query in ('mad', 'ma', 'steel', 'stel', 'new', 'payne dogs', 'gone')},
+    )
+
+
+def test_replace_category_matches_a_rebuilt_index():
+    data = {
+        'series': {
+            '1': {'series_name': 'Mad Men', 'category_ID': 'a', 'actors': ['Jon Hamm'], 'plot': 'Ad men.'},
+            '2': {'series_name': 'Mad Max', 'category_ID': 'a', 'actors': [], 'plot': 'Gone roads.'},
+            '3': {'series_name': 'Max Payne', 'category_ID': 'b', 'actors': [], 'plot': ''},
+            '4': {'series_name': 'Mad Dogs', 'category_ID': 'b', 'actors': [], 'plot': '', 'rating': '7'},
+        },
+        'categories': [{'category_id': 'a', 'category_name': 'A'}, {'category_id': 'b', 'category_name': 'B'}],
+        'last_fetch_date': '2024-01-01T00:00:00',
+    }
+    old = SearchIndex(data)
+    old.category_page('a', 'name')
+    old.search('stel')  # builds the fuzzy vocabulary of the old terms
+
+    listing = {
+        '1': data['series']['1'],  # unchanged
+        '4': dict(data['series']['4'], category_ID='a', rating='9'),  # moved from b
+        '5': {'series_name': 'Max Steel', 'category_ID': 'a', 'actors': [], 'plot': 'New toy.'},  # added
+    }  # '2' was removed
+    category = {'category_id': 'a', 'category_name': 'A', 'last_fetched': '2024-01-02T00:00:00'}
+    updated = old.replace_category(category, listing)
+
+    rebuilt = SearchIndex({
+        'series': {series_id: entry for series_id, entry in updated.series_items()},
+        'categories': updated.category_list(),
+        'last_fetch_date': data['last_fetch_date'],
+    })
+    assert list(dict(updated.series_items())) == ['1', '3', '4', '5']
+    assert updated.category_list()[0] == category
+    assert state(updated) == state(rebuilt)
+    assert len(updated) == 4
+
+    # Only known terms change: the vocabulary is kept
+    category = {'category_id': 'b', 'category_name': 'B', 'last_fetched': '2024-01-02T00:00:00'}
+    renamed = updated.replace_category(category, {'3': dict(data['series']['3'], series_name='Mad Payne')})
+    assert renamed._vocabulary is updated._vocabulary
+    rebuilt = SearchIndex({'series': dict(renamed.series_items()), 'categories': renamed.category_list()})
+    assert state(renamed) == state(rebuilt)
+    assert renamed._term_counts == rebuilt._term_counts
+    # The old index still answers from the previous catalog
+    assert names(old.search('gone')[0]) == ['Mad Max']
+    assert old.category_counts == {'a': 2, 'b': 2}
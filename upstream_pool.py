@@ -0,0 +1,130 @@
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class Endpoint:
+    """One mirror of the provider, with its smoothed latency and health."""
+
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.latency = None  # exponentially weighted moving average, seconds
+        self.healthy = True
+        self.failures = 0  # consecutive failures
+        self.last_failure = 0
+
+    def as_dict(self):
+        return {
+            'base_url': self.base_url,
+            'healthy': self.healthy,
+            'latency': self.latency,
+            'failures': self.failures
+        }
+
+
+class UpstreamPool:
+    """Mirrors of one provider, ranked by measured latency.
+
+    check(base_url) performs a health check and raises on failure; the background checker times it
+    every interval seconds. Callers report the outcome of their own requests with observe() and
+    mark_failed(), so a failing mirror is avoided before its next health check. Healthy endpoints
+    are preferred, fastest first; when none is healthy, the one that failed longest ago is tried first.
+    """
+
+    SMOOTHING = 0.3  # weight of a new latency sample in the moving average
+
+    def __init__(self, base_urls, check, interval=30):
+        if not base_urls:
+            raise ValueError("At least one upstream base URL is required")
+        self.endpoints = [Endpoint(base_url) for base_url in base_urls]
+        self.check = check
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __len__(self):
+        return len(self.endpoints)
+
+    def _find(self, url):
+        # Longest matching base URL, so mirrors on the same host with different paths stay apart
+        matches = [endpoint for endpoint in self.endpoints if url.startswith(endpoint.base_url)]
+        return max(matches, key=lambda endpoint: len(endpoint.base_url)) if matches else None
+
+    def ranked(self):
+        """Returns the endpoints in the order to try them."""
+        with self._lock:
+            healthy = [endpoint for endpoint in self.endpoints if endpoint.healthy]
+            unhealthy = [endpoint for endpoint in self.endpoints if not endpoint.healthy]
+            # Unmeasured endpoints keep their configured order behind measured ones
+            healthy.sort(key=lambda endpoint: endpoint.latency if endpoint.latency is not None else float('inf'))
+            unhealthy.sort(key=lambda endpoint: endpoint.last_failure)
+            return healthy + unhealthy
+
+    def best(self):
+        """Returns the endpoint to use for the next request."""
+        return self.ranked()[0]
+
+    def is_healthy(self, url):
+        """Whether the endpoint serving url is currently considered healthy."""
+        endpoint = self._find(url)
+        return endpoint is not None and endpoint.healthy
+
+    def observe(self, url, seconds):
+        """Records a successful request to the endpoint serving url and how long it took."""
+        endpoint = self._find(url)
+        if endpoint is None:
+            return
+        with self._lock:
+            if endpoint.latency is None:
+                endpoint.latency = seconds
+            else:
+                endpoint.latency += self.SMOOTHING * (seconds - endpoint.latency)
+            if not endpoint.healthy:
+                logger.info(f"Upstream {endpoint.base_url} is healthy again")
+            endpoint.healthy = True
+            endpoint.failures = 0
+
+    def mark_failed(self, url):
+        """Records a failed request to the endpoint serving url; it is avoided until it succeeds again."""
+        endpoint = self._find(url)
+        if endpoint is None:
+            return
+        with self._lock:
+            if endpoint.healthy and len(self.endpoints) > 1:
+                logger.warning(f"Upstream {endpoint.base_url} failed, routing to other mirrors")
+            endpoint.healthy = False
+            endpoint.failures += 1
+            endpoint.last_failure = time.monotonic()
+
+    def check_all(self):
+        """Health-checks every endpoint once."""
+        for endpoint in self.endpoints:
+            start = time.perf_counter()
+            try:
+                self.check(endpoint.base_url)
+            except Exception as e:
+                logger.debug(f"Health check of {endpoint.base_url} failed: {str(e)}")
+                self.mark_failed(endpoint.base_url)
+            else:
+                self.observe(endpoint.base_url, time.perf_counter() - start)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.check_all()
+            self._stop.wait(self.interval)
+
+    def start(self):
+        """Starts the background health checker."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='upstream-health', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self):
+        with self._lock:
+            return [endpoint.as_dict() for endpoint in self.endpoints]